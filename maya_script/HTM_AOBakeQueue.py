@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+""" 複数オブジェクトの頂点AOベイクキュー
+    遮蔽物が同じオブジェクトをまとめてBVHとプロセスプールを共有し
+    前回のベイクからジオメトリが変わっていないオブジェクトはスキップする
+    計算結果は最後にまとめてメッシュに書き込む
+"""
+import time
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import get_dag_path, get_points, get_face_vertex_ids
+from HTM_Tools.HTM_RayBVH import TriangleBVH, get_mesh_triangles
+from HTM_Tools.HTM_Util import create_process_pool, undo_ctx, ProgressBar
+from HTM_Tools.HTM_VertexAO import (VERTEX_CHUNK, compute_ao, get_scene_occluders,
+                                    get_vertex_normals, _init_worker, _worker_data)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+
+
+# 前回ベイク時のハッシュを保存するシェイプのアトリビュート名
+HASH_ATTR = 'htmAOBakeHash'
+
+
+def _compute_ao_chunk_timed(job_id, chunk, points, normals, vertex_ids, samples,
+                            max_distance, seed, bias):
+    """ ワーカープロセス側、計算時間も一緒に返す
+    """
+    start = time.perf_counter()
+    ao = compute_ao(_worker_data['bvh'], points, normals, vertex_ids,
+                    samples, max_distance, seed, bias)
+    return job_id, chunk, ao, time.perf_counter() - start
+
+
+def get_shape(obj):
+    return om2.MFnMesh(get_dag_path(obj)).fullPathName()
+
+
+def get_stored_hash(shape):
+    if not mc.attributeQuery(HASH_ATTR, node=shape, exists=True):
+        return None
+    return mc.getAttr('{}.{}'.format(shape, HASH_ATTR))
+
+
+def store_hash(shape, digest):
+    if not mc.attributeQuery(HASH_ATTR, node=shape, exists=True):
+        mc.addAttr(shape, ln=HASH_ATTR, dt='string')
+    mc.setAttr('{}.{}'.format(shape, HASH_ATTR), digest, type='string')
+
+
+class AOBakeJob(object):
+    """ 1オブジェクト分のベイク情報
+
+    Attributes:
+        obj(str): 対象オブジェクト
+        shape(str): シェイプのフルパス
+        points(np.ndarray): (V,3)のワールド座標
+        normals(np.ndarray): (V,3)のワールド法線
+        digest(str): ジオメトリ、遮蔽物、ベイク設定から作ったハッシュ
+        ao(np.ndarray): (V,)の計算結果
+        cpu_time(float): ワーカーでの計算時間の合計
+        wall_time(float): 最初のタスク投入から最後のチャンク完了までの時間
+        skipped(bool): 前回から変更が無くスキップしたか
+    """
+    def __init__(self, obj):
+        fn_mesh = om2.MFnMesh(get_dag_path(obj))
+        self.obj = obj
+        self.shape = fn_mesh.fullPathName()
+        self.fn_mesh = fn_mesh
+        self.points = get_points(fn_mesh, om2.MSpace.kWorld)
+        self.normals = get_vertex_normals(fn_mesh)
+        self.digest = None
+        self.ao = None
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self.skipped = False
+        self._remaining = 0
+        self._start = None
+
+    @property
+    def num_vertices(self):
+        return len(self.points)
+
+    def chunks(self):
+        num_vtx = self.num_vertices
+        return [(i, min(i + VERTEX_CHUNK, num_vtx)) for i in range(0, num_vtx, VERTEX_CHUNK)]
+
+    def geometry_hash(self, settings_digest):
+        """ ワールド座標、トポロジー、ベイク設定からハッシュを作成
+        """
+        counts, vertices = self.fn_mesh.getVertices()
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.points, dtype=np.float32).tobytes())
+        h.update(np.asarray(counts, dtype=np.int32).tobytes())
+        h.update(np.asarray(vertices, dtype=np.int32).tobytes())
+        h.update(settings_digest.encode('ascii'))
+        return h.hexdigest()
+
+
+class AOBakeQueue(object):
+    """ 頂点AOのベイクキュー
+
+    Example:
+        queue = AOBakeQueue(samples=64, max_distance=10.0)
+        queue.add(mc.ls(sl=True, tr=True))
+        queue.run()
+    """
+    def __init__(self, samples=64, max_distance=10.0, seed=0, bias=None,
+                 max_workers=None, channel='rgb', force=False):
+        """
+        Args:
+            samples(int): 頂点あたりのレイ数
+            max_distance(float): 遮蔽とみなす最大距離
+            seed(int): シード値
+            bias(float): レイの始点のオフセット、Noneなら遮蔽物の大きさから決める
+            max_workers(int): 同時に動かすワーカー数、1ならMaya内で処理する
+            channel(str): 書き込むチャンネル
+            force(bool): ハッシュが変わっていなくてもベイクする
+        """
+        self.samples = samples
+        self.max_distance = max_distance
+        self.seed = seed
+        self.bias = bias
+        self.max_workers = max_workers
+        self.channel = channel
+        self.force = force
+
+        # {遮蔽物のタプル: [対象オブジェクト]}
+        self.groups = OrderedDict()
+        self.jobs = []
+
+    def add(self, objs, occluders=None):
+        """ キューに追加、遮蔽物が同じオブジェクトは同じグループで処理される
+
+        Args:
+            objs(list[str]): 対象オブジェクト
+            occluders(list[str]): 遮蔽物、Noneならシーン内の表示されている全メッシュ
+        """
+        if isinstance(objs, str):
+            objs = [objs]
+        if occluders is None:
+            occluders = get_scene_occluders()
+
+        key = tuple(sorted(set(get_shape(o) for o in occluders)))
+        group = self.groups.setdefault(key, [])
+        for obj in objs:
+            if obj not in group:
+                group.append(obj)
+
+    def run(self):
+        """ 全グループをベイクして、最後にまとめて頂点カラーに書き込む
+
+        Returns:
+            list[AOBakeJob]: 処理結果
+        """
+        start = time.perf_counter()
+        self.jobs = []
+        for occluders, objs in self.groups.items():
+            self.jobs.extend(self.bake_group(occluders, objs))
+
+        self.apply()
+        self.report(time.perf_counter() - start)
+        return self.jobs
+
+    def bake_group(self, occluders, objs):
+        """ 遮蔽物を共有する1グループ分のベイク
+        """
+        tris = [get_mesh_triangles(o)[0] for o in occluders]
+        tris = np.concatenate(tris) if tris else np.zeros((0, 3, 3))
+
+        bias = self.bias
+        if bias is None:
+            if len(tris):
+                flat = tris.reshape(-1, 3)
+                bias = np.linalg.norm(flat.max(axis=0) - flat.min(axis=0)) * 1e-5
+            else:
+                bias = 1e-5
+
+        settings = hashlib.sha1(np.ascontiguousarray(tris, dtype=np.float32).tobytes())
+        settings.update(repr((self.samples, self.max_distance, self.seed, bias)).encode('ascii'))
+        settings_digest = settings.hexdigest()
+
+        jobs = []
+        for obj in objs:
+            job = AOBakeJob(obj)
+            job.digest = job.geometry_hash(settings_digest)
+            job.skipped = not self.force and get_stored_hash(job.shape) == job.digest
+            jobs.append(job)
+
+        pending = [job for job in jobs if not job.skipped]
+        if not pending:
+            return jobs
+
+        bvh = TriangleBVH(tris)
+        args = (self.samples, self.max_distance, self.seed, bias)
+        tasks = [(i, chunk) for i, job in enumerate(pending) for chunk in job.chunks()]
+        for job in pending:
+            job.ao = np.ones(job.num_vertices, dtype=np.float64)
+            job._remaining = len(job.chunks())
+
+        progress = ProgressBar(len(tasks), u'AOベイク中...')
+        try:
+            if self.max_workers == 1:
+                for i, (s, e) in tasks:
+                    job = pending[i]
+                    if job._start is None:
+                        job._start = time.perf_counter()
+                    start = time.perf_counter()
+                    job.ao[s:e] = compute_ao(bvh, job.points[s:e], job.normals[s:e],
+                                             np.arange(s, e), *args)
+                    self._finish_chunk(job, time.perf_counter() - start)
+                    progress.step()
+            else:
+                self._run_pool(bvh, pending, tasks, args, progress)
+        finally:
+            progress.end()
+
+        return jobs
+
+    def _run_pool(self, bvh, pending, tasks, args, progress):
+        """ タスクを投入しすぎないよう、実行中のタスク数を制限しながら処理する
+        """
+        num_workers = self.max_workers or max(multiprocessing.cpu_count() - 1, 1)
+        pool = create_process_pool(num_workers, _init_worker, (bvh,))
+        max_in_flight = num_workers * 2
+        task_iter = iter(tasks)
+        in_flight = set()
+
+        def submit_next():
+            for i, (s, e) in task_iter:
+                job = pending[i]
+                if job._start is None:
+                    job._start = time.perf_counter()
+                in_flight.add(pool.submit(_compute_ao_chunk_timed, i, (s, e),
+                                          job.points[s:e], job.normals[s:e],
+                                          np.arange(s, e), *args))
+                return True
+            return False
+
+        try:
+            while len(in_flight) < max_in_flight and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    i, (s, e), ao, elapsed = future.result()
+                    job = pending[i]
+                    job.ao[s:e] = ao
+                    self._finish_chunk(job, elapsed)
+                    progress.step()
+                    submit_next()
+        finally:
+            for future in in_flight:
+                future.cancel()
+            pool.shutdown()
+
+    def _finish_chunk(self, job, elapsed):
+        job.cpu_time += elapsed
+        job._remaining -= 1
+        if job._remaining == 0:
+            job.wall_time = time.perf_counter() - job._start
+            print(u'{}: {}頂点 {:.3f} 秒 (CPU {:.3f} 秒)'.format(
+                job.obj, job.num_vertices, job.wall_time, job.cpu_time))
+
+    @undo_ctx
+    def apply(self):
+        """ 計算結果をまとめて頂点カラーに書き込む、1回のUndoで戻せる
+        """
+        for job in self.jobs:
+            if job.skipped or job.ao is None:
+                continue
+            _, vertices = get_face_vertex_ids(job.fn_mesh)
+            colors = np.repeat(job.ao[vertices, np.newaxis], 4, axis=1)
+            set_face_vertex_colors(job.shape, colors, channel=self.channel)
+            store_hash(job.shape, job.digest)
+
+    def report(self, elapsed):
+        baked = [job for job in self.jobs if not job.skipped]
+        skipped = [job for job in self.jobs if job.skipped]
+        for job in skipped:
+            print(u'{}: 変更が無いためスキップ'.format(job.obj))
+
+        om2.MGlobal.displayInfo(u'AOベイク完了: {}個処理、{}個スキップ、合計 {:.3f} 秒'.format(
+            len(baked), len(skipped), elapsed))
+
+
+def bake_vertex_ao_batch(objs, occluders=None, samples=64, max_distance=10.0, seed=0,
+                         max_workers=None, channel='rgb', force=False):
+    """ 複数オブジェクトのAOをキュー経由でベイク
+
+    Args:
+        objs(list[str]): 対象オブジェクト
+        occluders(list[str]): 遮蔽物、Noneならシーン内の表示されている全メッシュ
+    """
+    queue = AOBakeQueue(samples, max_distance, seed, max_workers=max_workers,
+                        channel=channel, force=force)
+    queue.add(objs, occluders)
+    return queue.run()
+
+
+def main(samples=64, max_distance=10.0, force=False):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    bake_vertex_ao_batch(sel, samples=samples, max_distance=max_distance, force=force)
+
+
+if '__main__' == __name__:
+    main()
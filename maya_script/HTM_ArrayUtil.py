@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+
+# カラーチャンネル名と列番号の対応
+CHANNEL_TABLE = {'r': 0, 'g': 1, 'b': 2, 'a': 3}
+
+
+# ---------------------------------------------------------
+# MFnMesh <-> NumPy 変換
+# ---------------------------------------------------------
+def get_dag_path(obj):
+    """ オブジェクト名からシェイプのDagPathを取得
+
+    Args:
+        obj(str): トランスフォームかシェイプの名前
+    """
+    sel = om2.MSelectionList()
+    sel.add(obj)
+    dag, _ = sel.getComponent(0)
+    return dag
+
+
+def get_points(fn_mesh, space=om2.MSpace.kWorld):
+    """ 全頂点座標を(N,3)の配列で取得、getPointsは1回だけ呼ぶ
+
+    Args:
+        fn_mesh(MFnMesh):
+        space(MSpace):
+    """
+    points = fn_mesh.getPoints(space)
+    return np.array(points, dtype=np.float64).reshape(-1, 4)[:, :3]
+
+
+def to_color_array(colors):
+    """ (N,3)か(N,4)の配列をMColorArrayに変換
+
+    Args:
+        colors(np.ndarray):
+    """
+    colors = np.asarray(colors, dtype=np.float64)
+    if colors.shape[1] == 3:
+        colors = np.column_stack([colors, np.ones(len(colors))])
+    return om2.MColorArray(colors.tolist())
+
+
+def from_color_array(colors):
+    """ MColorArrayを(N,4)のfloat32配列に変換、未設定のカラー(-1)はそのまま
+
+    Args:
+        colors(MColorArray):
+    """
+    return np.array(colors, dtype=np.float32).reshape(-1, 4)
+
+
+def get_face_vertex_ids(fn_mesh):
+    """ フェース頂点ごとのフェースIDと頂点IDを取得
+        getFaceVertexColors()の並びと一致する
+
+    Returns:
+        np.ndarray, np.ndarray: (FV,)のフェースID、(FV,)の頂点ID
+    """
+    counts, vertices = fn_mesh.getVertices()
+    counts = np.array(counts, dtype=np.int32)
+    faces = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    return faces, np.array(vertices, dtype=np.int32)
+
+
+def get_face_vertex_colors(fn_mesh, color_set=None):
+    """ フェース頂点カラーを(FV,4)の配列で取得、未設定のカラーは(0,0,0,1)で埋める
+
+    Args:
+        fn_mesh(MFnMesh):
+        color_set(str): カラーセット名、Noneなら現在のカラーセット
+    """
+    if color_set is None:
+        colors = fn_mesh.getFaceVertexColors()
+    else:
+        colors = fn_mesh.getFaceVertexColors(color_set)
+    colors = from_color_array(colors)
+
+    unset = colors[:, 0] < 0.0
+    colors[unset] = (0.0, 0.0, 0.0, 1.0)
+    return colors
+
+
+def merge_channels(colors_orig, colors_new, channel='rgb'):
+    """ 指定チャンネルの列だけ新しいカラーで上書きした配列を返す
+
+    Args:
+        colors_orig(np.ndarray): (N,4)の元のカラー
+        colors_new(np.ndarray): (N,4)、(N,3)か(N,)の新しいカラー
+        channel(str): 'r', 'g', 'b', 'a'の組み合わせ、'rgb'など
+    """
+    merged = np.array(colors_orig, dtype=np.float32, copy=True)
+    colors_new = np.asarray(colors_new, dtype=np.float32)
+
+    for ch in channel:
+        col = CHANNEL_TABLE[ch]
+        if colors_new.ndim == 1:
+            merged[:, col] = colors_new
+        else:
+            merged[:, col] = colors_new[:, col]
+
+    return merged
+
+
+def get_triangle_face_vertices(fn_mesh):
+    """ 三角形分割した各三角形の、フェースIDとフェース頂点番号を取得
+        フェース頂点番号はget_face_vertex_ids()やgetAssignedUVs()の並びのインデックス
+
+    Returns:
+        np.ndarray, np.ndarray: (T,)のフェースID、(T,3)のフェース頂点番号
+    """
+    counts, _ = fn_mesh.getVertices()
+    counts = np.array(counts, dtype=np.int64)
+    face_start = np.cumsum(counts) - counts
+
+    tri_counts, tri_offsets = fn_mesh.getTriangleOffsets()
+    tri_faces = np.repeat(np.arange(len(counts), dtype=np.int32),
+                          np.array(tri_counts, dtype=np.int64))
+    tri_fv = np.array(tri_offsets, dtype=np.int64).reshape(-1, 3)
+    tri_fv += face_start[tri_faces][:, np.newaxis]
+    return tri_faces, tri_fv
+
+
+def scatter_add(indices, values, num):
+    """ indicesごとにvaluesを足し合わせる、(N,)でも(N,C)でも可
+        indicesが空でもfloat64で返す
+    """
+    if values.ndim == 1:
+        return np.bincount(indices, values, minlength=num).astype(np.float64, copy=False)
+
+    result = np.empty((num, values.shape[1]), dtype=np.float64)
+    for i in range(values.shape[1]):
+        result[:, i] = np.bincount(indices, values[:, i], minlength=num)
+    return result
+
+
+def get_edges(fn_mesh):
+    """ ポリゴンのエッジを頂点IDのペアで取得、フェースの外周から作るので三角形分割の対角線は含まない
+
+    Returns:
+        np.ndarray: (E,2)の頂点ID、各行は小さいID、大きいIDの順
+    """
+    counts, vertices = fn_mesh.getVertices()
+    counts = np.array(counts, dtype=np.int64)
+    vertices = np.array(vertices, dtype=np.int64)
+
+    # 各フェース頂点の次のフェース頂点、フェースの最後は先頭に戻る
+    face_start = np.repeat(np.cumsum(counts) - counts, counts)
+    local = np.arange(len(vertices)) - face_start
+    next_fv = face_start + (local + 1) % np.repeat(counts, counts)
+
+    v0 = np.minimum(vertices, vertices[next_fv])
+    v1 = np.maximum(vertices, vertices[next_fv])
+
+    # 1次元のキーにしてから重複を削除する方が速い
+    num_vtx = fn_mesh.numVertices
+    keys = np.unique(v0 * num_vtx + v1)
+    return np.column_stack([keys // num_vtx, keys % num_vtx]).astype(np.int32)
+
+
+def get_face_vertex_uv_ids(fn_mesh, uv_set=None):
+    """ フェース頂点ごとのUV IDを取得、UVが無いフェース頂点は-1
+
+    Returns:
+        np.ndarray: (FV,)のUV ID
+    """
+    counts, _ = fn_mesh.getVertices()
+    counts = np.array(counts, dtype=np.int64)
+
+    if uv_set is None:
+        uv_counts, uv_ids = fn_mesh.getAssignedUVs()
+    else:
+        uv_counts, uv_ids = fn_mesh.getAssignedUVs(uv_set)
+    uv_counts = np.array(uv_counts, dtype=np.int64)
+
+    # UVが割り当てられていないフェースはuv_countsが0になっている
+    has_uv = np.repeat(uv_counts == counts, counts)
+    fv_uv_ids = np.full(counts.sum(), -1, dtype=np.int64)
+    fv_uv_ids[has_uv] = np.array(uv_ids, dtype=np.int64)
+    return fv_uv_ids
+
+
+def get_uvs(fn_mesh, uv_set=None):
+    """ 全UV座標を(N,2)の配列で取得
+    """
+    if uv_set is None:
+        u_vals, v_vals = fn_mesh.getUVs()
+    else:
+        u_vals, v_vals = fn_mesh.getUVs(uv_set)
+    return np.column_stack([np.array(u_vals, dtype=np.float64),
+                            np.array(v_vals, dtype=np.float64)])
+
+
+def get_vertex_uvs(fn_mesh, uv_set=None):
+    """ 頂点ごとのUV、UVの継ぎ目では最初に見つかったフェース頂点のUVを使う
+
+    Returns:
+        np.ndarray, np.ndarray: (V,2)のUV、(V,)のUVがあるかどうか
+    """
+    _, vertices = get_face_vertex_ids(fn_mesh)
+    fv_uv_ids = get_face_vertex_uv_ids(fn_mesh, uv_set)
+    uvs = get_uvs(fn_mesh, uv_set)
+
+    has_uv = fv_uv_ids >= 0
+    vtx_uvs = np.zeros((fn_mesh.numVertices, 2), dtype=np.float64)
+    valid = np.zeros(fn_mesh.numVertices, dtype=np.bool_)
+
+    # 逆順に書き込むと、同じ頂点では先頭のフェース頂点の値が残る
+    vertices, fv_uv_ids = vertices[has_uv][::-1], fv_uv_ids[has_uv][::-1]
+    vtx_uvs[vertices] = uvs[fv_uv_ids]
+    valid[vertices] = True
+    return vtx_uvs, valid
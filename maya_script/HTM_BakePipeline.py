@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+""" ベイク処理のパイプライン
+    UV準備、レンダリング、インポートをステージとして順番に実行する
+    各ステージは完了をFutureで明示的に通知し、完了したジョブだけが次のステージに進む
+    レンダリング結果のファイル待ちはワーカースレッドで監視するので、待っている間もUIは止まらない
+"""
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+import maya.cmds as mc
+import maya.utils
+import maya.api.OpenMaya as om2
+
+
+# ジョブの状態
+PENDING = 'pending'
+RUNNING = 'running'
+WAITING = 'waiting'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def completed_future(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def watch_file(path, timeout=600.0, interval=0.2, stable_count=2):
+    """ ファイルが書き出し終わるまで監視するFutureを返す
+        ファイルが存在し、サイズが数回続けて変わらず、開ける状態になったら完了
+
+    Args:
+        path(str): 監視するファイル
+        timeout(float): タイムアウトまでの秒数
+        interval(float): 確認間隔の秒数
+        stable_count(int): サイズが変わらなかった回数がこれに達したら完了とみなす
+
+    Returns:
+        Future: 結果はpath、タイムアウトした場合はTimeoutError
+    """
+    future = Future()
+
+    def watch():
+        deadline = time.time() + timeout
+        last_size = -1
+        count = 0
+        while time.time() < deadline:
+            if future.cancelled():
+                return
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = -1
+
+            if size > 0 and size == last_size:
+                count += 1
+                if count >= stable_count:
+                    try:
+                        with open(path, 'rb'):
+                            pass
+                    except (IOError, OSError):
+                        count = 0
+                    else:
+                        future.set_result(path)
+                        return
+            else:
+                count = 0
+            last_size = size
+            time.sleep(interval)
+
+        future.set_exception(TimeoutError('Timed out waiting for {}'.format(path)))
+
+    thread = threading.Thread(target=watch, name='HTM_FileWatcher')
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def prepare_bake_uv(obj, uv_set='xxx_ao_bake', resolution=2048, padding_px=10):
+    """ ベイクに使用するためのUVを生成してレイアウトし直す
+
+    Args:
+        obj(str): 対象オブジェクト
+        uv_set(str): 作成するUVセット名
+        resolution(int): ベイクするテクスチャの解像度、パディングの計算に使う
+        padding_px(int): シェル間の間隔のピクセル数
+    """
+    all_uvs = mc.polyUVSet(obj, q=True, allUVSets=True) or []
+    if not uv_set in all_uvs:
+        mc.polyUVSet(obj, create=True, uvSet=uv_set)
+
+    # UVのコピーはあえて毎回やる、内容が変わっていることがあるあるなので
+    mc.polyUVSet(obj, copy=True, newUVSet=uv_set)
+    try:
+        # 最初からao_bakeセットが選択されているとエラーが出る
+        mc.polyUVSet(obj, currentUVSet=True, uvSet=uv_set)
+    except:
+        pass
+
+    padding = 1.0 / resolution * padding_px
+    mc.u3dLayout('{}.f[*]'.format(obj), res=1024, scl=1, spc=padding, mar=padding, box=[0, 1, 0, 1])
+
+
+class BakeJob(object):
+    """ 1オブジェクト分のベイク処理
+
+    Attributes:
+        obj(str): 対象オブジェクト
+        stages(list[tuple[str, callable]]): (ステージ名, 関数)のリスト
+            関数はジョブを引数に取り、Noneか完了を通知するFutureを返す
+        data(dict): ステージ間で受け渡す値、前のステージのFutureの結果は'result'に入る
+        state(str): ジョブの状態
+        stage_index(int): 実行中のステージ番号
+        error(Exception): 失敗した場合の例外
+        timings(dict): {ステージ名: 秒数}
+    """
+    def __init__(self, obj, stages, **data):
+        self.obj = obj
+        self.stages = list(stages)
+        self.data = data
+        self.state = PENDING
+        self.stage_index = 0
+        self.error = None
+        self.timings = {}
+        self._stage_start = None
+
+    @property
+    def stage_name(self):
+        if self.stage_index < len(self.stages):
+            return self.stages[self.stage_index][0]
+        return None
+
+
+class BakePipeline(object):
+    """ ジョブをステージごとに進めるスケジューラ
+        Maya APIを触るステージはすべてメインスレッドで、1ステップずつアイドル時に実行する
+        完了待ちのジョブがあっても他のジョブは先に進む
+
+    Example:
+        pipeline = BakePipeline(on_finished=lambda jobs: print(jobs))
+        for obj in sel:
+            pipeline.submit(BakeJob(obj, [('uv', prep_uv), ('render', render), ('import', import_tex)]))
+    """
+    def __init__(self, on_finished=None, on_progress=None):
+        """
+        Args:
+            on_finished(callable): 全ジョブ終了時にジョブのリストを引数に呼ばれる
+            on_progress(callable): ステージが完了するたびに(ジョブ, ステージ名)を引数に呼ばれる
+        """
+        self.jobs = []
+        self.on_finished = on_finished
+        self.on_progress = on_progress
+
+    def submit(self, job):
+        self.jobs.append(job)
+        self._schedule(job)
+        return job
+
+    def is_finished(self):
+        return all(job.state in (DONE, FAILED) for job in self.jobs)
+
+    def _schedule(self, job):
+        # Mayaのコマンドはメインスレッドからしか呼べないので、メインスレッドに戻して実行
+        maya.utils.executeDeferred(self._run_stage, job)
+
+    def _run_stage(self, job):
+        if job.state in (DONE, FAILED):
+            return
+        if job.stage_index >= len(job.stages):
+            self._finish(job, DONE)
+            return
+
+        name, func = job.stages[job.stage_index]
+        job.state = RUNNING
+        job._stage_start = time.perf_counter()
+        try:
+            future = func(job)
+        except Exception as e:
+            self._fail(job, e)
+            return
+
+        if future is None:
+            future = completed_future()
+
+        job.state = WAITING
+        future.add_done_callback(lambda f: maya.utils.executeDeferred(self._on_stage_done, job, f))
+
+    def _on_stage_done(self, job, future):
+        name = job.stage_name
+        job.timings[name] = time.perf_counter() - job._stage_start
+
+        error = future.exception()
+        if error is not None:
+            self._fail(job, error)
+            return
+
+        job.data['result'] = future.result()
+        job.stage_index += 1
+        if self.on_progress is not None:
+            self.on_progress(job, name)
+        self._schedule(job)
+
+    def _fail(self, job, error):
+        job.error = error
+        om2.MGlobal.displayError(u'{}: {} ステージで失敗しました: {}'.format(job.obj, job.stage_name, error))
+        self._finish(job, FAILED)
+
+    def _finish(self, job, state):
+        job.state = state
+        if state == DONE:
+            print(u'{}: 完了 ({})'.format(job.obj, ', '.join(
+                '{} {:.3f} 秒'.format(name, job.timings[name]) for name, _ in job.stages)))
+
+        if self.is_finished() and self.on_finished is not None:
+            self.on_finished(self.jobs)
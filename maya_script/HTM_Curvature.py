@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+""" 曲率(凸部・凹部)を計算して頂点カラーに書き込む
+    平均曲率はコタンジェントラプラシアン、ガウス曲率は角度欠損から求める
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (CHANNEL_TABLE, get_dag_path, get_points, get_edges,
+                                     get_face_vertex_ids, get_triangle_face_vertices,
+                                     scatter_add)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorLayers import apply_to_layer
+
+
+CURVATURE_MODES = ('mean', 'gaussian', 'convexity', 'cavity')
+
+
+# ---------------------------------------------------------
+# 曲率
+# ---------------------------------------------------------
+def triangle_geometry(points, tris):
+    """ 三角形ごとの各角のコタンジェント、角度、面積、面法線(面積倍)を計算
+
+    Args:
+        points(np.ndarray): (V,3)の頂点座標
+        tris(np.ndarray): (T,3)の頂点ID
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray, np.ndarray:
+            (T,3)のコタンジェント、(T,3)の角度、(T,)の面積、(T,3)の面法線
+    """
+    p = points[tris]
+    cots = np.empty((len(tris), 3))
+    angles = np.empty((len(tris), 3))
+
+    cross = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    double_area = np.linalg.norm(cross, axis=1)
+    safe_area = np.maximum(double_area, 1e-20)
+
+    for k in range(3):
+        a = p[:, (k + 1) % 3] - p[:, k]
+        b = p[:, (k + 2) % 3] - p[:, k]
+        dot = (a * b).sum(axis=1)
+        cots[:, k] = dot / safe_area
+        angles[:, k] = np.arctan2(np.linalg.norm(np.cross(a, b), axis=1), dot)
+
+    return cots, angles, double_area * 0.5, cross * 0.5
+
+
+def boundary_vertices(tris, num_vtx):
+    """ 1つの三角形にしか使われていないエッジの頂点をTrueにする
+    """
+    e0 = tris.reshape(-1)
+    e1 = np.roll(tris, -1, axis=1).reshape(-1)
+    keys = np.minimum(e0, e1).astype(np.int64) * num_vtx + np.maximum(e0, e1)
+    unique, counts = np.unique(keys, return_counts=True)
+    border = unique[counts == 1]
+
+    mask = np.zeros(num_vtx, dtype=np.bool_)
+    mask[border // num_vtx] = True
+    mask[border % num_vtx] = True
+    return mask
+
+
+def compute_curvature(points, tris):
+    """ 頂点ごとの平均曲率とガウス曲率を計算
+
+    Args:
+        points(np.ndarray): (V,3)の頂点座標
+        tris(np.ndarray): (T,3)の頂点ID
+
+    Returns:
+        np.ndarray, np.ndarray: (V,)の平均曲率(凸が正)、(V,)のガウス曲率
+    """
+    num_vtx = len(points)
+    cots, angles, areas, face_normals = triangle_geometry(points, tris)
+
+    # 頂点の面積は、接している三角形の面積の1/3ずつ
+    vtx_areas = scatter_add(tris.reshape(-1), np.repeat(areas / 3.0, 3), num_vtx)
+    vtx_areas = np.maximum(vtx_areas, 1e-20)
+
+    vtx_normals = scatter_add(tris.reshape(-1), np.repeat(face_normals, 3, axis=0), num_vtx)
+    length = np.linalg.norm(vtx_normals, axis=1)
+    length[length == 0.0] = 1.0
+    vtx_normals /= length[:, np.newaxis]
+
+    # 角kの対辺(k+1, k+2)にcot/2の重みを付ける
+    i = np.concatenate([tris[:, (k + 1) % 3] for k in range(3)])
+    j = np.concatenate([tris[:, (k + 2) % 3] for k in range(3)])
+    w = 0.5 * np.concatenate([cots[:, k] for k in range(3)])
+
+    diff = (points[j] - points[i]) * w[:, np.newaxis]
+    laplacian = scatter_add(i, diff, num_vtx) - scatter_add(j, diff, num_vtx)
+
+    # Δx = -2Hn、凸な部分が正になるように符号を合わせる
+    mean = -0.5 * (laplacian * vtx_normals).sum(axis=1) / vtx_areas
+
+    angle_sum = scatter_add(tris.reshape(-1), angles.reshape(-1), num_vtx)
+    defect = np.where(boundary_vertices(tris, num_vtx), np.pi, 2.0 * np.pi) - angle_sum
+    gaussian = defect / vtx_areas
+
+    return mean, gaussian
+
+
+# ---------------------------------------------------------
+# スムース
+# ---------------------------------------------------------
+def smooth_values(values, edges, iterations=1, strength=0.5):
+    """ 隣接頂点の平均に近づけるスムース
+
+    Args:
+        values(np.ndarray): (V,)か(V,C)の値
+        edges(np.ndarray): (E,2)のエッジ
+        iterations(int): 繰り返し回数
+        strength(float): 1回あたりに隣接頂点の平均に近づける割合
+    """
+    num_vtx = len(values)
+    e0, e1 = edges[:, 0], edges[:, 1]
+    degree = np.bincount(e0, minlength=num_vtx) + np.bincount(e1, minlength=num_vtx)
+    degree = np.maximum(degree, 1).astype(np.float64)
+    if values.ndim == 2:
+        degree = degree[:, np.newaxis]
+
+    result = values.astype(np.float64)
+    for _ in range(iterations):
+        neighbor_sum = scatter_add(e0, result[e1], num_vtx) + scatter_add(e1, result[e0], num_vtx)
+        result += (neighbor_sum / degree - result) * strength
+    return result
+
+
+def multi_scale_smooth(values, edges, scales=(0, 2, 8)):
+    """ 複数のスムース回数の結果を平均する、細かいディテールと大きな形状の両方を拾う
+
+    Args:
+        scales(tuple[int]): スムース回数のリスト
+    """
+    scales = sorted(scales)
+    total = np.zeros_like(values, dtype=np.float64)
+    current = values.astype(np.float64)
+    done = 0
+    for scale in scales:
+        current = smooth_values(current, edges, scale - done)
+        done = scale
+        total += current
+    return total / len(scales)
+
+
+def normalize_signed(values, percentile=95.0):
+    """ 外れ値に引っ張られないよう、絶対値のパーセンタイルで-1.0～1.0に正規化
+    """
+    scale = np.percentile(np.abs(values), percentile) if len(values) else 0.0
+    if scale <= 0.0:
+        return np.zeros_like(values)
+    return np.clip(values / scale, -1.0, 1.0)
+
+
+def curvature_mask(points, tris, edges, mode='cavity', scales=(0, 2, 8), percentile=95.0):
+    """ 曲率を0.0～1.0のマスクにする
+
+    Args:
+        mode(str): 'mean'、'gaussian'は0.5を中心とした符号付き、
+                   'convexity'は凸部、'cavity'は凹部が1.0
+        scales(tuple[int]): マルチスケールのスムース回数
+        percentile(float): 正規化に使うパーセンタイル
+
+    Returns:
+        np.ndarray: (V,)
+    """
+    assert mode in CURVATURE_MODES, 'invalid mode was passed.'
+    mean, gaussian = compute_curvature(points, tris)
+    curvature = gaussian if mode == 'gaussian' else mean
+    curvature = normalize_signed(multi_scale_smooth(curvature, edges, scales), percentile)
+
+    if mode == 'convexity':
+        return np.maximum(curvature, 0.0)
+    elif mode == 'cavity':
+        return np.maximum(-curvature, 0.0)
+    return curvature * 0.5 + 0.5
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def get_mesh_arrays(fn_mesh):
+    """ 曲率計算に必要な配列をまとめて取得
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray, np.ndarray:
+            (V,3)の頂点座標、(T,3)の三角形の頂点ID、(E,2)のエッジ、(FV,)のフェース頂点の頂点ID
+    """
+    points = get_points(fn_mesh, om2.MSpace.kObject)
+    _, vertices = get_face_vertex_ids(fn_mesh)
+    _, tri_fv = get_triangle_face_vertices(fn_mesh)
+    return points, vertices[tri_fv], get_edges(fn_mesh), vertices
+
+
+def bake_curvature(objs, mode='cavity', scales=(0, 2, 8), percentile=95.0, channel='r',
+                   layer=None):
+    """ 曲率を頂点カラーに書き込む
+
+    Args:
+        objs(list[str]): 対象オブジェクト
+        mode(str): 'mean', 'gaussian', 'convexity', 'cavity'
+        scales(tuple[int]): マルチスケールのスムース回数
+        percentile(float): 正規化に使うパーセンタイル
+        channel(str): 書き込むチャンネル、'r'や'rgb'など
+        layer(str): カラーレイヤー名、Noneならカラーセットを直接上書き
+    """
+    cols = [CHANNEL_TABLE[ch] for ch in channel]
+    for obj in objs:
+        fn_mesh = om2.MFnMesh(get_dag_path(obj))
+        points, tris, edges, vertices = get_mesh_arrays(fn_mesh)
+        mask = curvature_mask(points, tris, edges, mode, scales, percentile)
+
+        colors = np.zeros((len(vertices), 4), dtype=np.float32)
+        colors[:, cols] = mask[vertices, np.newaxis]
+
+        if layer is None:
+            set_face_vertex_colors(obj, colors, channel=channel)
+        else:
+            apply_to_layer(obj, layer, colors, channel=channel)
+
+
+def main(mode='cavity', channel='r'):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    bake_curvature(sel, mode=mode, channel=channel)
+
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" ジョイントの回転 or ジョイントの方向をまとめてフリーズするコマンド
+    チャンネルはMPlugでまとめて読み、フリーズ後の値は配列で一括計算して
+    1つのMDGModifierで書き込むので1回でUndoできる
+"""
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_JointAudit import FREEZE_MODES, read_joint_channels, compute_frozen_channels
+
+
+kShort_flag_mode = '-m'
+kLong_flag_mode = '-mode'
+
+
+def maya_useNewAPI():
+    pass
+
+
+def _is_free(fn_node, name):
+    """ ロック、接続されていなくて値を変更できるかどうか
+    """
+    plug = fn_node.findPlug(name, False)
+    plugs = [plug] + [plug.child(i) for i in range(plug.numChildren())]
+    return all(p.isFreeToChange() == om2.MPlug.kFreeToChange for p in plugs)
+
+
+class HTM_FreezeJoint(om2.MPxCommand):
+    """ ジョイントのローカルの向きを保ったまま、回転をジョイントの方向へ(-mode rotation)
+        またはジョイントの方向を回転へ(-mode orientation)移す
+        rotate、jointOrientがロック、接続されているジョイントはスキップする
+    """
+    kPluginCmdName = 'HTM_FreezeJoint'
+
+    def __init__(self):
+        om2.MPxCommand.__init__(self)
+        self.modifier = om2.MDGModifier()
+
+    def doIt(self, args):
+        arg_data = om2.MArgDatabase(self.syntax(), args)
+        sel_list = arg_data.getObjectList()
+        mode = 'rotation'
+        if arg_data.isFlagSet(kShort_flag_mode):
+            mode = arg_data.flagArgumentString(kShort_flag_mode, 0)
+        if mode not in FREEZE_MODES:
+            raise ValueError('mode must be one of {}.'.format(FREEZE_MODES))
+
+        dags = []
+        for i in range(sel_list.length()):
+            dag = sel_list.getDagPath(i)
+            if not dag.hasFn(om2.MFn.kJoint):
+                continue
+            fn_node = om2.MFnDependencyNode(dag.node())
+            if _is_free(fn_node, 'rotate') and _is_free(fn_node, 'jointOrient'):
+                dags.append(dag)
+            else:
+                om2.MGlobal.displayWarning('{} is locked or connected, skipped.'.format(
+                    dag.partialPathName()))
+
+        if dags:
+            rotate, rotate_order, joint_orient, _ = read_joint_channels(dags)
+            rotate, joint_orient = compute_frozen_channels(rotate, rotate_order, joint_orient,
+                                                           mode)
+            for dag, rot, orient in zip(dags, rotate.tolist(), joint_orient.tolist()):
+                fn_node = om2.MFnDependencyNode(dag.node())
+                self.set_compound(fn_node.findPlug('rotate', False), rot)
+                self.set_compound(fn_node.findPlug('jointOrient', False), orient)
+
+        self.setResult(len(dags))
+        self.redoIt()
+
+    def redoIt(self):
+        self.modifier.doIt()
+
+    def undoIt(self):
+        self.modifier.undoIt()
+
+    def isUndoable(self):
+        return True
+
+    def set_compound(self, plug, values):
+        """ 角度はラジアンで設定する
+        """
+        for i, value in enumerate(values):
+            self.modifier.newPlugValueDouble(plug.child(i), value)
+
+    @staticmethod
+    def syntaxCreator():
+        """ Add arguments, keyword arguments.
+
+        Flag:
+            Positional:
+                joint names: Str
+            mode(m): str, 'rotation' or 'orientation'
+        """
+        syntax = om2.MSyntax()
+
+        # Positional Args
+        # setObjectTypeした時点でコマンド引数が設定される。オブジェクトはstringでしか渡せない。
+        syntax.setObjectType(om2.MSyntax.kSelectionList, 1)
+
+        syntax.addFlag(kShort_flag_mode, kLong_flag_mode, om2.MSyntax.kString)
+        return syntax
+
+    @staticmethod
+    def cmdCreator():
+        return HTM_FreezeJoint()
+
+
+def initializePlugin(mobject):
+    plugin = om2.MFnPlugin(mobject)
+    plugin.registerCommand(HTM_FreezeJoint.kPluginCmdName,
+                           HTM_FreezeJoint.cmdCreator,
+                           HTM_FreezeJoint.syntaxCreator)
+
+
+def uninitializePlugin(mobject):
+    pluginFn = om2.MFnPlugin(mobject)
+    pluginFn.deregisterCommand(HTM_FreezeJoint.kPluginCmdName)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+""" 転送に失敗した頂点などを、周りの有効な頂点の値から調和補間で埋める
+    未知の頂点だけを変数にしたグラフラプラシアンの連立方程式を前処理付き共役勾配法で解く
+    0から始めるより少ない反復で済むように、有効な頂点から1リングずつ隣接頂点の平均を
+    伝播させた値を初期値にする
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_dag_path, get_edges, scatter_add,
+                                     from_color_array, to_color_array)
+from HTM_Tools.HTM_SkinWeights import gather_rows
+
+
+def harmonic_fill(values, known, edges, max_iterations=100, tol=1e-6, jacobi_iterations=None):
+    """ knownがFalseの頂点の値を、隣接頂点の平均と等しくなるように(調和関数として)決める
+        有効な頂点に1つも繋がっていない頂点は元の値のまま
+        1回の反復は穴の中のエッジ数に比例し、12万頂点の穴で20ms程度かかる
+        max_iterationsに達した場合は収束途中の値を返すので、大きな穴でも処理時間は頭打ちになる
+        散らばった頂点や数千頂点程度の穴は上限より少ない反復で収束する
+
+    Args:
+        values(np.ndarray): (V,)か(V,C)の値、未知の頂点の値は使われない
+        known(np.ndarray): (V,)のbool、Trueの頂点の値は固定
+        edges(np.ndarray): (E,2)のエッジ
+        max_iterations(int): 共役勾配法の最大反復回数、対話的な操作で止まらないように抑えておく
+        tol(float): 残差の相対許容値
+        jacobi_iterations(int): 指定した場合は共役勾配法の代わりに、初期値から固定回数の
+            ヤコビ反復で近似する、1回あたりの計算量は共役勾配法の6割程度
+            穴の幅程度の範囲にしか値が伝わらないので、細い穴や散らばった頂点向け
+
+    Returns:
+        np.ndarray: valuesと同じ形状
+    """
+    values = np.asarray(values, dtype=np.float64)
+    known = np.asarray(known, dtype=np.bool_)
+    is_1d = values.ndim == 1
+    result = values.reshape(len(values), -1).copy()
+
+    unknown = np.flatnonzero(~known)
+    if not len(unknown) or known.all():
+        return result.reshape(values.shape)
+
+    # 未知の頂点だけを詰めた番号にする、計算量は穴の大きさにしか依存しない
+    num_unknown = len(unknown)
+    index = np.full(len(values), -1, dtype=np.int64)
+    index[unknown] = np.arange(num_unknown)
+
+    a, b = edges[:, 0], edges[:, 1]
+    ua, ub = ~known[a], ~known[b]
+
+    degree = (np.bincount(index[a[ua]], minlength=num_unknown) +
+              np.bincount(index[b[ub]], minlength=num_unknown)).astype(np.float64)
+
+    # 右辺は既知の隣接頂点の値の合計
+    border_a = ua & ~ub
+    border_b = ub & ~ua
+    rhs = (scatter_add(index[a[border_a]], result[b[border_a]], num_unknown) +
+           scatter_add(index[b[border_b]], result[a[border_b]], num_unknown))
+    num_known = (np.bincount(index[a[border_a]], minlength=num_unknown) +
+                 np.bincount(index[b[border_b]], minlength=num_unknown))
+
+    inner = ua & ub
+    ia, ib = index[a[inner]], index[b[inner]]
+
+    # 未知の頂点と繋がっていない頂点は、既知の隣接頂点の平均で確定するので解く必要がない
+    x = rhs / np.maximum(degree, 1.0)[:, np.newaxis]
+    reachable = num_known > 0
+    coupled = np.zeros(num_unknown, dtype=np.bool_)
+    coupled[ia] = True
+    coupled[ib] = True
+
+    num_coupled = int(coupled.sum())
+    if num_coupled:
+        # 行ごとに隣接頂点を並べておき、隣接頂点の合計をreduceatで全列まとめて求める
+        # coupledな頂点は必ず未知の隣接頂点を持つので、空の区間はできない
+        sub_index = np.cumsum(coupled) - 1
+        rows = np.concatenate([sub_index[ia], sub_index[ib]])
+        cols = np.concatenate([sub_index[ib], sub_index[ia]])
+        order = np.argsort(rows, kind='stable')
+        neighbors = cols[order]
+        indptr = np.searchsorted(rows[order], np.arange(num_coupled + 1))
+        starts = indptr[:-1]
+        sub_degree = degree[coupled]
+        sub_rhs = rhs[coupled]
+
+        def sum_neighbors(v):
+            return np.add.reduceat(v[neighbors], starts, axis=0)
+
+        def apply_laplacian(v):
+            return sub_degree[:, np.newaxis] * v - sum_neighbors(v)
+
+        x0, sub_reachable = propagate_front(sub_rhs, num_known[coupled], indptr, neighbors)
+        reachable[coupled] = sub_reachable
+        if jacobi_iterations is None:
+            x[coupled] = solve_pcg(apply_laplacian, sub_rhs, sub_degree, max_iterations, tol, x0)
+        else:
+            inv_degree = (1.0 / sub_degree)[:, np.newaxis]
+            for _ in range(jacobi_iterations):
+                x0 = (sub_rhs + sum_neighbors(x0)) * inv_degree
+            x[coupled] = x0
+
+    # 既知の頂点に繋がっていない頂点は元の値のまま
+    result[unknown[reachable]] = x[reachable]
+    return result[:, 0] if is_1d else result
+
+
+def propagate_front(rhs, num_known, indptr, neighbors):
+    """ 既知の頂点に接する頂点から1リングずつ、確定済みの隣接頂点の平均を割り当てる
+        反復法の初期値用、穴の奥まで既知の値が届いているので0から始めるより収束が早い
+
+    Args:
+        rhs(np.ndarray): (N,C)の既知の隣接頂点の値の合計
+        num_known(np.ndarray): (N,)の既知の隣接頂点の数
+        indptr(np.ndarray): (N+1,)の未知の頂点同士の隣接リストの開始位置
+        neighbors(np.ndarray): 隣接する未知の頂点の番号
+
+    Returns:
+        np.ndarray, np.ndarray: (N,C)の初期値、(N,)の既知の頂点に繋がっているかどうか
+            繋がっていない頂点の初期値は0
+    """
+    x = np.zeros_like(rhs)
+    assigned = num_known > 0
+    front = np.flatnonzero(assigned)
+    x[front] = rhs[front] / num_known[front, np.newaxis]
+
+    while len(front):
+        # 前のリングに隣接する未確定の頂点が次のリング
+        _, positions = gather_rows(indptr, front)
+        front = np.unique(neighbors[positions])
+        front = front[~assigned[front]]
+        if not len(front):
+            break
+
+        # 次のリングの頂点の隣接頂点のうち、確定済みのものだけで平均する
+        owner, positions = gather_rows(indptr, front)
+        src = neighbors[positions]
+        valid = assigned[src]
+        owner, src = owner[valid], src[valid]
+        total = scatter_add(owner, x[src], len(front))
+        x[front] = total / np.bincount(owner, minlength=len(front))[:, np.newaxis]
+        assigned[front] = True
+
+    return x, assigned
+
+
+def solve_pcg(apply_matrix, rhs, diagonal, max_iterations=1000, tol=1e-6, x0=None):
+    """ 対角スケーリングの前処理付き共役勾配法、右辺の列ごとに同時に解く
+
+    Args:
+        apply_matrix(callable): (N,C)を受け取って行列を掛けた(N,C)を返す
+        rhs(np.ndarray): (N,C)の右辺
+        diagonal(np.ndarray): (N,)の行列の対角成分
+        x0(np.ndarray): (N,C)の初期値、Noneなら0
+    """
+    if x0 is None:
+        x = np.zeros_like(rhs)
+        r = rhs.copy()
+    else:
+        x = x0.copy()
+        r = rhs - apply_matrix(x)
+    inv_diag = (1.0 / diagonal)[:, np.newaxis]
+    z = r * inv_diag
+    p = z.copy()
+    rz = np.einsum('ij,ij->j', r, z)
+    threshold = (tol * np.maximum(np.linalg.norm(rhs, axis=0), 1e-30)) ** 2
+
+    for _ in range(max_iterations):
+        ap = apply_matrix(p)
+        pap = np.einsum('ij,ij->j', p, ap)
+        alpha = np.divide(rz, pap, out=np.zeros_like(rz), where=pap > 0.0)
+        x += p * alpha
+        r -= ap * alpha
+
+        if (np.einsum('ij,ij->j', r, r) <= threshold).all():
+            break
+
+        np.multiply(r, inv_diag, out=z)
+        rz_new = np.einsum('ij,ij->j', r, z)
+        beta = np.divide(rz_new, rz, out=np.zeros_like(rz), where=rz > 0.0)
+        p *= beta
+        p += z
+        rz = rz_new
+
+    return x
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def fill_vertex_colors(obj, vertex_ids):
+    """ 指定した頂点の頂点カラーを、周りの頂点カラーから補間して埋める
+
+    Args:
+        obj(str): 対象オブジェクト
+        vertex_ids(list[int]): 埋める頂点
+    """
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    colors = from_color_array(fn_mesh.getVertexColors()).astype(np.float64)
+    known = np.ones(len(colors), dtype=np.bool_)
+    known[vertex_ids] = False
+    known &= colors[:, 0] >= 0.0 # 未設定のカラーも埋める
+
+    filled = harmonic_fill(colors, known, get_edges(fn_mesh))
+    filled[filled[:, 0] < 0.0] = (0.0, 0.0, 0.0, 1.0)
+
+    ids = np.flatnonzero(~known)
+    fn_mesh.setVertexColors(to_color_array(filled[ids]), ids.tolist())
+
+
+def fill_vertex_normals(obj, vertex_ids):
+    """ 指定した頂点の法線を、周りの頂点の法線から補間して埋める
+
+    Args:
+        obj(str): 対象オブジェクト
+        vertex_ids(list[int]): 埋める頂点
+    """
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    normals = np.array(fn_mesh.getVertexNormals(False, om2.MSpace.kWorld),
+                       dtype=np.float64).reshape(-1, 3)
+    known = np.ones(len(normals), dtype=np.bool_)
+    known[vertex_ids] = False
+
+    filled = harmonic_fill(normals, known, get_edges(fn_mesh))
+    ids = np.flatnonzero(~known)
+    filled = filled[ids]
+    length = np.linalg.norm(filled, axis=1)
+    length[length == 0.0] = 1.0
+    filled /= length[:, np.newaxis]
+
+    fn_mesh.setVertexNormals(om2.MVectorArray(filled.tolist()), ids.tolist(), om2.MSpace.kWorld)
+
+
+def main():
+    """ 選択した頂点の頂点カラーを周りから埋める
+    """
+    sel = mc.ls(sl=True, fl=True)
+    vtxs = mc.filterExpand(sel, sm=31) or []
+    if not vtxs:
+        om2.MGlobal.displayWarning('Select vertices to fill.')
+        return
+
+    obj = vtxs[0].split('.')[0]
+    fill_vertex_colors(obj, [int(v.split('[')[-1][:-1]) for v in vtxs])
+
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+""" シーン内のスキンクラスターとインフルエンスの対応表
+    ジョイントごとにlistConnections、findRelatedSkinClusterを繰り返さず、全スキンクラスターを
+    1回だけたどって ジョイント -> スキンクラスター、スキンクラスター -> インフルエンスの表を作り
+    スキンクラスターの接続が変わるまでキャッシュする
+"""
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as oma2
+
+from HTM_Tools.HTM_Util import SceneCache, scene_callbacks
+
+
+class InfluenceIndex(object):
+    """ スキンクラスターとインフルエンスの対応表
+
+    Attributes:
+        skin_clusters(list[str]): スキンクラスター名
+        influences(dict[str, list[str]]): スキンクラスター -> インフルエンスのフルパス、getWeights()の列の並び
+        columns(dict[str, dict[str, int]]): スキンクラスター -> {インフルエンスのフルパス: 列番号}
+        logical(dict[str, dict[str, int]]): スキンクラスター -> {インフルエンスのフルパス: matrixの論理インデックス}
+        clusters(dict[str, list[str]]): インフルエンスのフルパス -> スキンクラスター
+        shapes(dict[str, str]): 出力シェイプのフルパス -> スキンクラスター
+        partial_names(dict[str, str]): インフルエンスのフルパス -> 一意な最短の名前
+    """
+    def __init__(self):
+        self.skin_clusters = []
+        self.influences = {}
+        self.columns = {}
+        self.logical = {}
+        self.clusters = {}
+        self.shapes = {}
+        self.partial_names = {}
+
+        it_node = om2.MItDependencyNodes(om2.MFn.kSkinClusterFilter)
+        while not it_node.isDone():
+            self._add_skin_cluster(oma2.MFnSkinCluster(it_node.thisNode()))
+            it_node.next()
+
+    def _add_skin_cluster(self, fn_sc):
+        sc = fn_sc.name()
+        self.skin_clusters.append(sc)
+
+        paths = []
+        logical = {}
+        for dag in fn_sc.influenceObjects():
+            path = dag.fullPathName()
+            paths.append(path)
+            logical[path] = fn_sc.indexForInfluenceObject(dag)
+            self.partial_names[path] = dag.partialPathName()
+            self.clusters.setdefault(path, []).append(sc)
+
+        self.influences[sc] = paths
+        self.columns[sc] = {path: i for i, path in enumerate(paths)}
+        self.logical[sc] = logical
+
+        for i in range(fn_sc.numOutputConnections()):
+            try:
+                shape = fn_sc.getPathAtIndex(fn_sc.indexForOutputConnection(i))
+            except RuntimeError:
+                continue
+            self.shapes[shape.fullPathName()] = sc
+
+    def is_influence(self, node):
+        """
+        Args:
+            node(str): フルパス
+        """
+        return node in self.clusters
+
+    def filter_influences(self, nodes):
+        """ インフルエンスとして使われているノードだけを返す、並びは保つ
+
+        Args:
+            nodes(list[str]): ノード名、フルパス以外の名前はまとめてフルパスに変換する
+        """
+        full_paths = mc.ls(nodes, l=True) if nodes else []
+        if len(full_paths) != len(nodes):
+            full_paths = [(mc.ls(node, l=True) or [node])[0] for node in nodes]
+        return [node for node, path in zip(nodes, full_paths) if path in self.clusters]
+
+    def skin_cluster_of(self, node):
+        """ メッシュのトランスフォームかシェイプからスキンクラスターを取得、findRelatedSkinClusterの代わり
+
+        Returns:
+            str: 見つからない場合はNone
+        """
+        paths = mc.ls(node, l=True)
+        if not paths:
+            return None
+
+        sc = self.shapes.get(paths[0])
+        if sc is None:
+            for shape in mc.listRelatives(paths[0], s=True, ni=True, f=True) or []:
+                sc = self.shapes.get(shape)
+                if sc is not None:
+                    break
+        return sc
+
+    def influence_names(self, sc):
+        """ インフルエンスの一意な最短の名前、skinCluster -q -inf と同じ形式
+        """
+        return [self.partial_names[path] for path in self.influences.get(sc, [])]
+
+
+# ---------------------------------------------------------
+# キャッシュ
+# ---------------------------------------------------------
+def _connection_changed(src_plug, dst_plug, made, *args):
+    """ スキンクラスターの接続が変わった場合だけ破棄する
+    """
+    for plug in (src_plug, dst_plug):
+        if plug.node().hasFn(om2.MFn.kSkinClusterFilter):
+            invalidate()
+            return
+
+
+_cache = SceneCache(InfluenceIndex, [
+    lambda func: om2.MDGMessage.addConnectionCallback(_connection_changed),
+    lambda func: om2.MDGMessage.addNodeAddedCallback(func, 'skinCluster'),
+    lambda func: om2.MDGMessage.addNodeRemovedCallback(func, 'skinCluster'),
+    om2.MDagMessage.addAllDagChangesCallback,
+    lambda func: om2.MNodeMessage.addNameChangedCallback(om2.MObject.kNullObj, func),
+] + scene_callbacks(om2.MSceneMessage.kAfterOpen, om2.MSceneMessage.kAfterNew))
+
+invalidate = _cache.invalidate
+remove_callbacks = _cache.remove_callbacks
+
+
+def get_influence_index():
+    """ キャッシュ済みのインフルエンスの対応表を取得、接続が変わっていたら作り直す
+
+    Returns:
+        InfluenceIndex:
+    """
+    return _cache.get()
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+""" フリーズされていないジョイントの検出とフリーズ
+    ジョイントごとにxform、getAttrを繰り返さず、rotate、rotateOrder、jointOrient、scaleを
+    MPlugで1回だけ読んで配列にまとめ、許容誤差で判定する
+    フリーズはHTM_FreezeJointコマンドで1つのMDGModifierにまとめて書き込むので1回でUndoできる
+    レポートはパブリッシュチェック用にJSONで書き出せる
+"""
+import json
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import load_plugin
+from HTM_Tools.HTM_JointHierarchy import get_joint_hierarchy
+
+
+# rotateOrderの列挙値の順
+ROTATE_ORDERS = ('xyz', 'yzx', 'zxy', 'xzy', 'yxz', 'zyx')
+AUDIT_MODES = ('rotation', 'orientation', 'scale')
+FREEZE_MODES = ('rotation', 'orientation')
+REPORT_VERSION = 1
+
+
+# ---------------------------------------------------------
+# 回転の計算、Mayaと同じく行ベクトル
+# ---------------------------------------------------------
+def axis_rotations(angles, axis):
+    """ 1軸回りの回転行列
+
+    Args:
+        angles(np.ndarray): (N,)の角度(ラジアン)
+        axis(int): 0, 1, 2 = x, y, z
+
+    Returns:
+        np.ndarray: (N,3,3)
+    """
+    c, s = np.cos(angles), np.sin(angles)
+    i, j = (axis + 1) % 3, (axis + 2) % 3
+    result = np.zeros((len(angles), 3, 3))
+    result[:, axis, axis] = 1.0
+    result[:, i, i] = c
+    result[:, i, j] = s
+    result[:, j, i] = -s
+    result[:, j, j] = c
+    return result
+
+
+def euler_to_matrices(angles, orders=0):
+    """ オイラー角を回転行列に変換、回転順の最初の軸が最初に適用される
+
+    Args:
+        angles(np.ndarray): (N,3)の角度(ラジアン)
+        orders(np.ndarray or int): (N,)のrotateOrderの列挙値
+
+    Returns:
+        np.ndarray: (N,3,3)
+    """
+    angles = np.asarray(angles, dtype=np.float64).reshape(-1, 3)
+    orders = np.broadcast_to(orders, (len(angles),))
+    result = np.empty((len(angles), 3, 3))
+    for order in np.unique(orders):
+        ids = np.flatnonzero(orders == order)
+        axes = ['xyz'.index(a) for a in ROTATE_ORDERS[order]]
+        matrices = [axis_rotations(angles[ids, axis], axis) for axis in axes]
+        result[ids] = np.matmul(np.matmul(matrices[0], matrices[1]), matrices[2])
+    return result
+
+
+def matrices_to_euler(matrices, orders=0):
+    """ 回転行列をオイラー角に変換
+        回転順に合わせて軸を並べ替えてからXYZ順で分解する、奇置換の場合は角度の符号が反転する
+
+    Args:
+        matrices(np.ndarray): (N,3,3)の回転行列
+        orders(np.ndarray or int): (N,)のrotateOrderの列挙値
+
+    Returns:
+        np.ndarray: (N,3)の角度(ラジアン)、x, y, zの順
+    """
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 3, 3)
+    orders = np.broadcast_to(orders, (len(matrices),))
+    result = np.empty((len(matrices), 3))
+    for order in np.unique(orders):
+        ids = np.flatnonzero(orders == order)
+        axes = ['xyz'.index(a) for a in ROTATE_ORDERS[order]]
+        sign = 1.0 if axes in ([0, 1, 2], [1, 2, 0], [2, 0, 1]) else -1.0
+        m = matrices[ids][:, axes][:, :, axes]
+
+        # M = Rx * Ry * Rz、ジンバルロックの場合はzを0にする
+        cos_y = np.hypot(m[:, 0, 0], m[:, 0, 1])
+        gimbal = cos_y < 1e-8
+        x = np.where(gimbal, np.arctan2(-m[:, 2, 1], m[:, 1, 1]), np.arctan2(m[:, 1, 2], m[:, 2, 2]))
+        y = np.arctan2(-m[:, 0, 2], cos_y)
+        z = np.where(gimbal, 0.0, np.arctan2(m[:, 0, 1], m[:, 0, 0]))
+        result[ids[:, np.newaxis], axes] = np.column_stack([x, y, z]) * sign
+    return result
+
+
+def compute_frozen_channels(rotate, rotate_order, joint_orient, mode='rotation'):
+    """ フリーズ後のrotateとjointOrient、ジョイントのローカルの向きは変えない
+
+    Args:
+        rotate(np.ndarray): (N,3)の回転(ラジアン)
+        rotate_order(np.ndarray): (N,)のrotateOrder
+        joint_orient(np.ndarray): (N,3)のジョイントの方向(ラジアン)
+        mode(str): 'rotation'なら回転をジョイントの方向へ、'orientation'ならジョイントの方向を回転へ移す
+
+    Returns:
+        np.ndarray, np.ndarray: (N,3)のrotate、jointOrient
+    """
+    if mode not in FREEZE_MODES:
+        raise ValueError('mode must be one of {}.'.format(FREEZE_MODES))
+
+    # ジョイントの行列は [rotateAxis][rotate][jointOrient] の順
+    combined = np.matmul(euler_to_matrices(rotate, rotate_order), euler_to_matrices(joint_orient))
+    zeros = np.zeros_like(rotate)
+    if mode == 'rotation':
+        return zeros, matrices_to_euler(combined)
+    return matrices_to_euler(combined, rotate_order), zeros
+
+
+# ---------------------------------------------------------
+# チャンネルの取得、判定
+# ---------------------------------------------------------
+def _read_compound(fn_node, name):
+    plug = fn_node.findPlug(name, False)
+    return [plug.child(i).asDouble() for i in range(3)]
+
+
+def read_joint_channels(dags):
+    """ ジョイントのチャンネルをまとめて取得、角度はラジアン
+
+    Args:
+        dags(list[MDagPath]): ジョイント
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray, np.ndarray:
+            (N,3)のrotate、(N,)のrotateOrder、(N,3)のjointOrient、(N,3)のscale
+    """
+    rotate, rotate_order, joint_orient, scale = [], [], [], []
+    for dag in dags:
+        fn_node = om2.MFnDependencyNode(dag.node())
+        rotate.append(_read_compound(fn_node, 'rotate'))
+        rotate_order.append(fn_node.findPlug('rotateOrder', False).asShort())
+        joint_orient.append(_read_compound(fn_node, 'jointOrient'))
+        scale.append(_read_compound(fn_node, 'scale'))
+
+    return (np.array(rotate, dtype=np.float64).reshape(-1, 3),
+            np.array(rotate_order, dtype=np.int64),
+            np.array(joint_orient, dtype=np.float64).reshape(-1, 3),
+            np.array(scale, dtype=np.float64).reshape(-1, 3))
+
+
+class JointAudit(object):
+    """ ジョイントのチャンネルとフリーズの判定結果
+
+    Attributes:
+        paths(list[str]): (N,)のジョイントのフルパス
+        rotate(np.ndarray): (N,3)の回転(度)
+        rotate_order(np.ndarray): (N,)のrotateOrder
+        joint_orient(np.ndarray): (N,3)のジョイントの方向(度)
+        scale(np.ndarray): (N,3)のスケール
+        flags(dict[str, np.ndarray]): モード -> (N,)のbool、フリーズされていないジョイント
+        tolerance(dict[str, float]): モード -> 許容誤差
+    """
+    def __init__(self, paths, rotate, rotate_order, joint_orient, scale,
+                 angle_tolerance=1e-4, scale_tolerance=1e-5):
+        """
+        Args:
+            rotate, joint_orient: (N,3)の角度(ラジアン)、read_joint_channels()の戻り値
+            angle_tolerance(float): 0とみなす角度(度)
+            scale_tolerance(float): 1とみなすスケールの誤差
+        """
+        self.paths = list(paths)
+        self.rotate = np.degrees(rotate)
+        self.rotate_order = np.asarray(rotate_order, dtype=np.int64)
+        self.joint_orient = np.degrees(joint_orient)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+        self.tolerance = {'rotation': angle_tolerance, 'orientation': angle_tolerance,
+                          'scale': scale_tolerance}
+        self.flags = {
+            'rotation': (np.abs(self.rotate) > angle_tolerance).any(axis=1),
+            'orientation': (np.abs(self.joint_orient) > angle_tolerance).any(axis=1),
+            'scale': (np.abs(self.scale - 1.0) > scale_tolerance).any(axis=1),
+        }
+
+    @classmethod
+    def from_joints(cls, joints=None, **kwargs):
+        """ ジョイントを指定して作成、Noneならシーン内の全ジョイント
+
+        Args:
+            joints(list[str]): ジョイント名
+            **kwargs: __init__の許容誤差
+        """
+        hierarchy = get_joint_hierarchy()
+        paths = hierarchy.paths if joints is None else hierarchy.names(hierarchy.indices(joints))
+
+        sel = om2.MSelectionList()
+        for path in paths:
+            sel.add(path)
+        dags = [sel.getDagPath(i) for i in range(sel.length())]
+        return cls(paths, *read_joint_channels(dags), **kwargs)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def unfrozen(self, modes=('rotation', 'orientation')):
+        """ フリーズされていないジョイントの番号
+
+        Args:
+            modes(str or list[str]): 判定するモード、いずれかに当てはまれば対象
+        """
+        if isinstance(modes, str):
+            modes = [modes]
+        flagged = np.zeros(len(self.paths), dtype=np.bool_)
+        for mode in modes:
+            if mode not in AUDIT_MODES:
+                raise ValueError('mode must be one of {}.'.format(AUDIT_MODES))
+            flagged |= self.flags[mode]
+        return np.flatnonzero(flagged)
+
+    def unfrozen_joints(self, modes=('rotation', 'orientation')):
+        return [self.paths[i] for i in self.unfrozen(modes)]
+
+    def report(self, modes=AUDIT_MODES):
+        """ パブリッシュチェック用のレポート、フリーズされていないジョイントだけ載せる
+
+        Returns:
+            dict: JSONにそのまま書き出せる形式
+        """
+        if isinstance(modes, str):
+            modes = [modes]
+        joints = []
+        for i in self.unfrozen(modes):
+            joints.append({
+                'name': self.paths[i],
+                'issues': [mode for mode in modes if self.flags[mode][i]],
+                'rotate': self.rotate[i].tolist(),
+                'rotateOrder': ROTATE_ORDERS[self.rotate_order[i]],
+                'jointOrient': self.joint_orient[i].tolist(),
+                'scale': self.scale[i].tolist(),
+            })
+
+        return {
+            'version': REPORT_VERSION,
+            'scene': mc.file(q=True, sceneName=True),
+            'num_joints': len(self.paths),
+            'tolerance': {mode: self.tolerance[mode] for mode in modes},
+            'counts': {mode: int(self.flags[mode].sum()) for mode in modes},
+            'passed': not joints,
+            'joints': joints,
+        }
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def audit_joints(joints=None, modes=AUDIT_MODES, angle_tolerance=1e-4, scale_tolerance=1e-5,
+                 path=None):
+    """ フリーズされていないジョイントを調べてレポートを返す
+
+    Args:
+        joints(list[str]): 対象のジョイント、Noneならシーン内の全ジョイント
+        modes(list[str]): 判定するモード、'rotation', 'orientation', 'scale'
+        angle_tolerance(float): 0とみなす角度(度)
+        scale_tolerance(float): 1とみなすスケールの誤差
+        path(str): 指定するとレポートをJSONで書き出す
+
+    Returns:
+        dict: JointAudit.report()
+    """
+    audit = JointAudit.from_joints(joints, angle_tolerance=angle_tolerance,
+                                   scale_tolerance=scale_tolerance)
+    report = audit.report(modes)
+    if path:
+        write_report(report, path)
+    return report
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def freeze_joints(joints, mode='rotation'):
+    """ ジョイントの回転 or ジョイントの方向をまとめてフリーズする、1回でUndoできる
+
+    Args:
+        joints(list[str]): 対象のジョイント
+        mode(str): 'rotation'なら回転を0に、'orientation'ならジョイントの方向を0にする
+
+    Returns:
+        int: フリーズしたジョイントの数
+    """
+    if mode not in FREEZE_MODES:
+        raise ValueError('mode must be one of {}.'.format(FREEZE_MODES))
+    if not joints:
+        return 0
+
+    load_plugin('HTM_FreezeJoint')
+    return mc.HTM_FreezeJoint(joints, mode=mode)
+
+
+def freeze_unfrozen(joints=None, mode='rotation', angle_tolerance=1e-4):
+    """ フリーズされていないジョイントだけを調べてまとめてフリーズする
+
+    Returns:
+        list[str]: フリーズしたジョイント
+    """
+    audit = JointAudit.from_joints(joints, angle_tolerance=angle_tolerance)
+    flagged = audit.unfrozen_joints(mode)
+    freeze_joints(flagged, mode)
+    return flagged
+
+
+def main():
+    report = audit_joints()
+    for mode, count in sorted(report['counts'].items()):
+        print('{}: {} / {}'.format(mode, count, report['num_joints']))
+    mc.select([joint['name'] for joint in report['joints']], r=True)
+
+
+if '__main__' == __name__:
+    main()
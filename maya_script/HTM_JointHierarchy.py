@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+""" シーン内のジョイント階層のインデックス
+    DAGを1回だけ深さ優先でたどって親、深さ、ルート、子の配列を作り、DAGが変わるまでキャッシュする
+    深さ優先の順に番号を振るので、あるジョイントの子孫は間にジョイント以外のノードを挟んでいても
+    番号が連続した範囲になる
+"""
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import SceneCache, scene_callbacks
+
+
+class JointHierarchy(object):
+    """ ジョイント階層
+
+    Attributes:
+        paths(list[str]): (N,)のジョイントのフルパス、深さ優先の順
+        index(dict[str, int]): フルパス -> 番号
+        parent(np.ndarray): (N,)の親ジョイントの番号、DAG上の直接の親がジョイントでなければ-1
+        depth(np.ndarray): (N,)のジョイント階層での深さ、ルートが0
+        root(np.ndarray): (N,)のルートジョイントの番号
+        size(np.ndarray): (N,)の自身を含むDAG上の子孫ジョイントの数、子孫はpaths[i:i + size[i]]
+        child_ptr(np.ndarray): (N+1,)の子の開始位置、CSR形式
+        child_ids(np.ndarray): 子の番号
+    """
+    def __init__(self, paths=None):
+        """
+        Args:
+            paths(list[str]): 深さ優先の順のフルパス、NoneならシーンのDAGをたどって取得
+        """
+        if paths is None:
+            paths = []
+            it_dag = om2.MItDag(om2.MItDag.kDepthFirst, om2.MFn.kJoint)
+            while not it_dag.isDone():
+                paths.append(it_dag.fullPathName())
+                it_dag.next()
+
+        self.paths = list(paths)
+        self.index = {path: i for i, path in enumerate(self.paths)}
+        num = len(self.paths)
+
+        # 深さ優先なので親は必ず先に登録されている
+        self.parent = np.full(num, -1, dtype=np.int64)
+        self.depth = np.zeros(num, dtype=np.int64)
+        self.root = np.arange(num, dtype=np.int64)
+        for i, path in enumerate(self.paths):
+            p = self.index.get(path.rpartition('|')[0], -1)
+            if p >= 0:
+                self.parent[i] = p
+                self.depth[i] = self.depth[p] + 1
+                self.root[i] = self.root[p]
+
+        # 子孫の範囲はパスの前方一致で求める、ジョイント以外のノードの下のジョイントも含める
+        # スタックにはDAG上の祖先のジョイントが積まれていて、子孫でないパスが来たら範囲を閉じる
+        end = np.full(num, num, dtype=np.int64)
+        stack = []
+        for i, path in enumerate(self.paths):
+            while stack and not path.startswith(self.paths[stack[-1]] + '|'):
+                end[stack.pop()] = i
+            stack.append(i)
+        self.size = end - np.arange(num, dtype=np.int64)
+
+        has_parent = self.parent >= 0
+        children = np.flatnonzero(has_parent)
+        order = np.argsort(self.parent[children], kind='stable')
+        self.child_ids = children[order]
+        self.child_ptr = np.zeros(num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parent[children], minlength=num), out=self.child_ptr[1:])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def indices(self, names):
+        """ ジョイント名を番号に変換、フルパス以外の名前はMSelectionListで解決する、見つからない名前は無視
+        """
+        result = []
+        unresolved = []
+        for name in names:
+            i = self.index.get(name, -1)
+            if i >= 0:
+                result.append(i)
+            else:
+                unresolved.append(name)
+
+        if unresolved:
+            sel = om2.MSelectionList()
+            for name in unresolved:
+                try:
+                    sel.add(name)
+                except RuntimeError:
+                    continue
+            for i in range(sel.length()):
+                try:
+                    j = self.index.get(sel.getDagPath(i).fullPathName(), -1)
+                except TypeError:
+                    continue
+                if j >= 0:
+                    result.append(j)
+
+        return np.unique(np.array(result, dtype=np.int64))
+
+    def descendants(self, ids, include_self=True):
+        """ 子孫の番号、深さ優先の順
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return ids
+
+        offset = 0 if include_self else 1
+        starts = ids + offset
+        counts = self.size[ids] - offset
+        result = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.unique(result)
+
+    def ancestors(self, ids):
+        """ 祖先の番号
+        """
+        result = []
+        current = self.parent[np.asarray(ids, dtype=np.int64)]
+        while len(current):
+            current = current[current >= 0]
+            result.append(current)
+            current = self.parent[current]
+        return np.unique(np.concatenate(result)) if result else np.zeros(0, dtype=np.int64)
+
+    def below(self, nodes):
+        """ 指定したノード(ジョイント以外でもよい)の下にあるジョイントの番号
+
+        Args:
+            nodes(list[str]): ノードのフルパス
+        """
+        prefixes = tuple(node.rstrip('|') + '|' for node in nodes)
+        if not prefixes:
+            return np.zeros(0, dtype=np.int64)
+        return np.array([i for i, path in enumerate(self.paths) if path.startswith(prefixes)],
+                        dtype=np.int64)
+
+    def roots(self, ids):
+        """ ルートジョイントの番号
+        """
+        return np.unique(self.root[np.asarray(ids, dtype=np.int64)])
+
+    def children(self, i):
+        return self.child_ids[self.child_ptr[i]:self.child_ptr[i + 1]]
+
+    def names(self, ids):
+        return [self.paths[i] for i in ids]
+
+
+# ---------------------------------------------------------
+# キャッシュ
+# ---------------------------------------------------------
+_cache = SceneCache(JointHierarchy, [
+    om2.MDagMessage.addAllDagChangesCallback,
+    lambda func: om2.MDGMessage.addNodeAddedCallback(func, 'joint'),
+    lambda func: om2.MDGMessage.addNodeRemovedCallback(func, 'joint'),
+    lambda func: om2.MNodeMessage.addNameChangedCallback(om2.MObject.kNullObj, func),
+] + scene_callbacks(om2.MSceneMessage.kAfterOpen, om2.MSceneMessage.kAfterNew))
+
+invalidate = _cache.invalidate
+remove_callbacks = _cache.remove_callbacks
+
+
+def get_joint_hierarchy():
+    """ キャッシュ済みのジョイント階層を取得、DAGが変わっていたら作り直す
+
+    Returns:
+        JointHierarchy:
+    """
+    return _cache.get()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_dag_path, get_points, get_triangle_face_vertices,
+                                     get_face_vertex_ids, get_face_vertex_uv_ids, get_uvs)
+from HTM_Tools.HTM_PerlinNoise import normalized_noise
+from HTM_Tools.HTM_Util import create_process_pool, Timer
+
+
+# UVラスタライズ結果のキャッシュ
+# {(シェイプ名, UVセット, 解像度, パディング): (ハッシュ, 三角形ID, 重心座標, 三角形の頂点ID)}
+_raster_cache = {}
+
+# 1回のラスタライズ処理で扱う候補ピクセル数の上限、メモリ使用量の調整用
+RASTER_BATCH_PIXELS = 1 << 22
+
+# ワーカープロセス側で保持するデータ
+_worker_data = {}
+
+
+# ---------------------------------------------------------
+# UVラスタライズ
+# ---------------------------------------------------------
+def rasterize_triangles(uv_tris, width, height):
+    """ UV空間の三角形をラスタライズして、ピクセルごとの三角形IDと重心座標を求める
+        行0がV=0側、MImageのピクセルの並びと同じ
+
+    Args:
+        uv_tris(np.ndarray): (T,3,2)の三角形ごとのUV座標
+        width(int):
+        height(int):
+
+    Returns:
+        np.ndarray, np.ndarray: (H,W)の三角形ID(-1は空)、(H,W,2)の重心座標(b1, b2)
+    """
+    tri_ids = np.full((height, width), -1, dtype=np.int32)
+    bary = np.zeros((height, width, 2), dtype=np.float32)
+
+    # ピクセル中心が整数になる座標系に変換
+    px = uv_tris * np.array([width, height], dtype=np.float64) - 0.5
+    x_min = np.clip(np.ceil(px[:, :, 0].min(axis=1)), 0, width - 1).astype(np.int64)
+    x_max = np.clip(np.floor(px[:, :, 0].max(axis=1)), 0, width - 1).astype(np.int64)
+    y_min = np.clip(np.ceil(px[:, :, 1].min(axis=1)), 0, height - 1).astype(np.int64)
+    y_max = np.clip(np.floor(px[:, :, 1].max(axis=1)), 0, height - 1).astype(np.int64)
+
+    num_x = np.maximum(x_max - x_min + 1, 0)
+    num_y = np.maximum(y_max - y_min + 1, 0)
+    num_pixels = num_x * num_y
+
+    # 候補ピクセル数が上限を超えないように三角形をまとめて処理する
+    cumsum = np.cumsum(num_pixels)
+    start = 0
+    while start < len(uv_tris):
+        base = cumsum[start - 1] if start else 0
+        end = int(np.searchsorted(cumsum, base + RASTER_BATCH_PIXELS, side='right'))
+        end = max(end, start + 1)
+
+        counts = num_pixels[start:end]
+        total = int(counts.sum())
+        if total:
+            local = np.repeat(np.arange(start, end), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            x = x_min[local] + offsets % num_x[local]
+            y = y_min[local] + offsets // num_x[local]
+
+            a, b, c = px[local, 0], px[local, 1], px[local, 2]
+            v0 = b - a
+            v1 = c - a
+            v2x = x - a[:, 0]
+            v2y = y - a[:, 1]
+
+            den = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+            valid = np.abs(den) > 1e-12
+            den[~valid] = 1.0
+            b1 = (v2x * v1[:, 1] - v1[:, 0] * v2y) / den
+            b2 = (v0[:, 0] * v2y - v2x * v0[:, 1]) / den
+
+            eps = 1e-6
+            inside = valid & (b1 >= -eps) & (b2 >= -eps) & (b1 + b2 <= 1.0 + eps)
+            tri_ids[y[inside], x[inside]] = local[inside]
+            bary[y[inside], x[inside], 0] = b1[inside]
+            bary[y[inside], x[inside], 1] = b2[inside]
+
+        start = end
+
+    return tri_ids, bary
+
+
+def dilate_raster(tri_ids, bary, padding):
+    """ UVシェルの外側にpaddingピクセル分、隣接ピクセルの情報を広げる
+    """
+    for _ in range(padding):
+        for dy, dx in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            dst = (slice(max(dy, 0), tri_ids.shape[0] + min(dy, 0)),
+                   slice(max(dx, 0), tri_ids.shape[1] + min(dx, 0)))
+            src = (slice(max(-dy, 0), tri_ids.shape[0] + min(-dy, 0)),
+                   slice(max(-dx, 0), tri_ids.shape[1] + min(-dx, 0)))
+
+            fill = (tri_ids[dst] < 0) & (tri_ids[src] >= 0)
+            tri_ids[dst][fill] = tri_ids[src][fill]
+            bary[dst][fill] = bary[src][fill]
+
+    return tri_ids, bary
+
+
+def get_uv_raster(fn_mesh, resolution=1024, uv_set=None, padding=4):
+    """ UVラスタライズ結果を取得、UVとトポロジーが前回と同じならキャッシュを返す
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray:
+            (H,W)の三角形ID、(H,W,2)の重心座標、(T,3)の三角形の頂点ID
+    """
+    _, tri_fv = get_triangle_face_vertices(fn_mesh)
+    _, vertices = get_face_vertex_ids(fn_mesh)
+    fv_uv_ids = get_face_vertex_uv_ids(fn_mesh, uv_set)
+    uvs = get_uvs(fn_mesh, uv_set)
+
+    tri_vertices = vertices[tri_fv]
+    tri_uv_ids = fv_uv_ids[tri_fv]
+
+    # UVの無い三角形はラスタライズ対象外、UV範囲外に飛ばしておく
+    has_uv = (tri_uv_ids >= 0).all(axis=1)
+    uv_tris = np.full(tri_uv_ids.shape + (2,), -1.0, dtype=np.float64)
+    uv_tris[has_uv] = uvs[tri_uv_ids[has_uv]]
+
+    digest = hashlib.sha1(uv_tris.tobytes())
+    digest.update(tri_vertices.tobytes())
+    digest = digest.hexdigest()
+
+    key = (fn_mesh.fullPathName(), uv_set, resolution, padding)
+    cache = _raster_cache.get(key)
+    if cache is not None and cache[0] == digest:
+        return cache[1], cache[2], cache[3]
+
+    tri_ids, bary = rasterize_triangles(uv_tris, resolution, resolution)
+    tri_ids, bary = dilate_raster(tri_ids, bary, padding)
+    _raster_cache[key] = (digest, tri_ids, bary, tri_vertices)
+
+    return tri_ids, bary, tri_vertices
+
+
+def clear_cache():
+    _raster_cache.clear()
+
+
+# ---------------------------------------------------------
+# タイル処理、ワーカープロセス側でも呼ばれる
+# ---------------------------------------------------------
+def _init_worker(points, tri_vertices):
+    """ ワーカー起動時に頂点座標と三角形を1回だけ受け取る
+    """
+    _worker_data['points'] = points
+    _worker_data['tri_vertices'] = tri_vertices
+
+
+def _bake_tile(tri_ids, bary, noise_kwargs):
+    """ 1タイル分のノイズ値を計算
+
+    Args:
+        tri_ids(np.ndarray): (h,w)の三角形ID
+        bary(np.ndarray): (h,w,2)の重心座標
+        noise_kwargs(dict): normalized_noise()の引数
+
+    Returns:
+        np.ndarray: (h,w)のノイズ値、空ピクセルは0
+    """
+    points = _worker_data['points']
+    tri_vertices = _worker_data['tri_vertices']
+
+    values = np.zeros(tri_ids.shape, dtype=np.float32)
+    mask = tri_ids >= 0
+    if not mask.any():
+        return values
+
+    tris = tri_vertices[tri_ids[mask]]
+    b1 = bary[mask, 0:1].astype(np.float64)
+    b2 = bary[mask, 1:2].astype(np.float64)
+    pos = (1.0 - b1 - b2) * points[tris[:, 0]] + b1 * points[tris[:, 1]] + b2 * points[tris[:, 2]]
+
+    values[mask] = normalized_noise(pos, **noise_kwargs)
+    return values
+
+
+# ---------------------------------------------------------
+# 画像書き出し
+# ---------------------------------------------------------
+def write_image(path, values):
+    """ (H,W)の0.0～1.0の値をグレースケール画像として保存
+        拡張子がexrならfloat、それ以外は8bitで書き出す
+    """
+    height, width = values.shape
+    ext = os.path.splitext(path)[-1][1:].lower()
+
+    rgba = np.empty((height, width, 4), dtype=np.float32)
+    rgba[:, :, :3] = values[:, :, np.newaxis]
+    rgba[:, :, 3] = 1.0
+
+    image = om2.MImage()
+    if ext == 'exr':
+        image.create(width, height, 4, om2.MImage.kFloat)
+        image.setFloatPixels(bytearray(rgba.tobytes()), width, height)
+    else:
+        image.create(width, height, 4, om2.MImage.kByte)
+        pixels = (np.clip(rgba, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+        image.setPixels(bytearray(pixels.tobytes()), width, height)
+
+    image.writeToFile(path, ext)
+
+
+# ---------------------------------------------------------
+# ベイク
+# ---------------------------------------------------------
+def bake_noise_texture(obj, path, resolution=1024, uv_set=None, padding=4,
+                       tile_size=256, max_workers=None, scale=0.03, offset=0.0,
+                       seed=0, octaves=1, lacunarity=2.0, gain=0.5, noise_type='fbm',
+                       time=None):
+    """ HTM_PerlinNoiseと同じノイズをテクスチャとしてベイクする
+        UVラスタライズはキャッシュされるので、ノイズのパラメーターだけ変えた再ベイクは速い
+
+    Args:
+        obj(str): 対象オブジェクト
+        path(str): 出力パス、.exrか.png
+        resolution(int): テクスチャサイズ
+        uv_set(str): UVセット名、Noneなら現在のUVセット
+        padding(int): UVシェル外側に広げるピクセル数
+        tile_size(int): タイル1辺のピクセル数
+        max_workers(int): ワーカープロセス数、1ならMaya内で処理する
+        その他: HTM_NoiseVertexColorと同じノイズのパラメーター
+    """
+    dag = get_dag_path(obj)
+    fn_mesh = om2.MFnMesh(dag)
+
+    with Timer():
+        tri_ids, bary, tri_vertices = get_uv_raster(fn_mesh, resolution, uv_set, padding)
+    points = get_points(fn_mesh, om2.MSpace.kWorld) * scale + offset
+
+    noise_kwargs = {'seed': seed, 'octaves': octaves, 'lacunarity': lacunarity,
+                    'gain': gain, 'noise_type': noise_type, 'time': time}
+
+    tiles = [(y, x) for y in range(0, resolution, tile_size)
+             for x in range(0, resolution, tile_size)]
+    values = np.zeros((resolution, resolution), dtype=np.float32)
+
+    with Timer():
+        if max_workers == 1:
+            _init_worker(points, tri_vertices)
+            for y, x in tiles:
+                tile = (slice(y, y + tile_size), slice(x, x + tile_size))
+                values[tile] = _bake_tile(tri_ids[tile], bary[tile], noise_kwargs)
+
+        else:
+            with create_process_pool(max_workers, _init_worker, (points, tri_vertices)) as pool:
+                futures = {}
+                for y, x in tiles:
+                    tile = (slice(y, y + tile_size), slice(x, x + tile_size))
+                    futures[pool.submit(_bake_tile, tri_ids[tile], bary[tile], noise_kwargs)] = tile
+
+                for future, tile in futures.items():
+                    values[tile] = future.result()
+
+    write_image(path, values)
+    return path
+
+
+def main(resolution=2048, file_format='exr'):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    out_dir = mc.workspace(q=True, rd=True) + 'sourceimages'
+    for s in sel:
+        path = os.path.join(out_dir, '{}_noise.{}'.format(s.split('|')[-1], file_format))
+        bake_noise_texture(s, path, resolution)
+        om2.MGlobal.displayInfo('Baked: {}'.format(path))
+
+
+if '__main__' == __name__:
+    main()
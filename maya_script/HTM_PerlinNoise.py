@@ -1,104 +1,237 @@
-import random
-import math
+# -*- coding: utf-8 -*-
+import numpy as np
 
 import maya.cmds as mc
 import maya.api.OpenMaya as om2
 
-
-def grad3(pos):
-    def fract(x):
-        return x % 1.0
-
-    xyz = [pos * om2.MVector(312.2, 541.6, 234.3),
-           pos * om2.MVector(117.1, 131.4, 339.1),
-           pos * om2.MVector(511.3, 397.3, 113.2)]
-
-    x = 2.0 * fract(math.sin(xyz[0]) * 62145.2137913) - 1.0
-    y = 2.0 * fract(math.sin(xyz[1]) * 62145.2137913) - 1.0
-    z = 2.0 * fract(math.sin(xyz[2]) * 62145.2137913) - 1.0
-
-    return om2.MVector([x, y, z])
-
-
-def floor(pos):
-    x = math.floor(pos.x)
-    y = math.floor(pos.y)
-    z = math.floor(pos.z)
-
-    return om2.MVector([x, y, z])
-
-def fract(pos):
-    x = pos.x % 1.0
-    y = pos.y % 1.0
-    z = pos.z % 1.0
-
-    return om2.MVector([x, y, z])
-
-def lerp(x, y, t):
-    return (y - x) * (3 - t * 2) * t * t + x
-    #return x * t + (1 - t) * y
-
-def perlin_noise(pos):
-    pos_floor = floor(pos)
-    pos_fract = fract(pos)
-
-    # front, back, top, bottom, right, left
-    p_bbl = pos_floor + om2.MVector([0, 0, 0])
-    p_bbr = pos_floor + om2.MVector([1, 0, 0])
-    p_btl = pos_floor + om2.MVector([0, 1, 0])
-    p_btr = pos_floor + om2.MVector([1, 1, 0])
-    p_fbl = pos_floor + om2.MVector([0, 0, 1])
-    p_fbr = pos_floor + om2.MVector([1, 0, 1])
-    p_ftl = pos_floor + om2.MVector([0, 1, 1])
-    p_ftr = pos_floor + om2.MVector([1, 1, 1])
-
-    # gradient
-    grad_bbl = grad3(p_bbl)
-    grad_bbr = grad3(p_bbr)
-    grad_btl = grad3(p_btl)
-    grad_btr = grad3(p_btr)
-    grad_fbl = grad3(p_fbl)
-    grad_fbr = grad3(p_fbr)
-    grad_ftl = grad3(p_ftl)
-    grad_ftr = grad3(p_ftr)
-
-    # dot value
-    val_bbl = grad_bbl * (om2.MPoint(pos) - om2.MPoint(p_bbl))
-    val_bbr = grad_bbr * (om2.MPoint(pos) - om2.MPoint(p_bbr))
-    val_btl = grad_btl * (om2.MPoint(pos) - om2.MPoint(p_btl))
-    val_btr = grad_btr * (om2.MPoint(pos) - om2.MPoint(p_btr))
-    val_fbl = grad_fbl * (om2.MPoint(pos) - om2.MPoint(p_fbl))
-    val_fbr = grad_fbr * (om2.MPoint(pos) - om2.MPoint(p_fbr))
-    val_ftl = grad_ftl * (om2.MPoint(pos) - om2.MPoint(p_ftl))
-    val_ftr = grad_ftr * (om2.MPoint(pos) - om2.MPoint(p_ftr))
-
-    # interpolation
-    intp_bb = lerp(val_bbl, val_bbr, pos_fract.x)
-    intp_bt = lerp(val_btl, val_btr, pos_fract.x)
-    intp_fb = lerp(val_fbl, val_fbr, pos_fract.x)
-    intp_ft = lerp(val_ftl, val_ftr, pos_fract.x)
-
-    intp_b = lerp(intp_bb, intp_bt, pos_fract.y)
-    intp_f = lerp(intp_fb, intp_ft, pos_fract.y)
-
-    intp = lerp(intp_b, intp_f, pos_fract.z)
-
-    #intp = lerp(intp_bb, intp_fb, pos_fract.z)
-    #return intp_b
-
-    return intp * (1.0 / math.sqrt(3/4))
-
-
-scale = 0.03
-offset = 0.0
-
-sel = mc.ls(sl=True)
-for s in sel:
-    vtxs = mc.ls(s + '.vtx[*]', fl=True)
-    for v in vtxs:
-        pos = mc.xform(v, q=True, ws=True, t=True)
-        pos = om2.MVector(pos) * scale + om2.MVector(offset, offset, offset)
-        val = perlin_noise(pos)
+from HTM_Tools.HTM_ArrayUtil import get_points
+from HTM_Tools.HTM_Util import load_plugin, Timer
+
+
+# Improved Perlin Noiseの勾配ベクトル、立方体のエッジ方向12種
+GRAD3 = np.array([[1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+                  [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+                  [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1]], dtype=np.float64)
+
+# 4D用の勾配ベクトル、4次元超立方体のエッジ方向32種
+GRAD4 = np.array([[a, b, c, 0] for a in (1, -1) for b in (1, -1) for c in (1, -1)] +
+                 [[a, b, 0, c] for a in (1, -1) for b in (1, -1) for c in (1, -1)] +
+                 [[a, 0, b, c] for a in (1, -1) for b in (1, -1) for c in (1, -1)] +
+                 [[0, a, b, c] for a in (1, -1) for b in (1, -1) for c in (1, -1)],
+                 dtype=np.float64)
+
+NOISE_TYPES = ('fbm', 'turbulence', 'ridged')
+
+
+def permutation_table(seed=0):
+    """ シードから順列テーブルを生成、オーバーフロー対策で2周分持つ
+
+    Args:
+        seed(int): シード値
+    """
+    perm = np.random.RandomState(seed).permutation(256)
+    return np.concatenate([perm, perm]).astype(np.int64)
+
+
+def fade(t):
+    """ 補間用のエルミート曲線 (3 - 2t)t^2
+    """
+    return (3.0 - 2.0 * t) * t * t
+
+
+class GradientNoise(object):
+    """ 順列テーブルでハッシュするグラディエントノイズ
+        (N,3)か(N,4)の座標を一括で評価する。作業用バッファは点数ごとに使いまわす
+    """
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.perm = permutation_table(seed)
+        self._buffers = {}
+
+    def _get_buffers(self, num, dim):
+        """ 作業用バッファ、同じ点数・次元なら前回のものを返す
+        """
+        key = (num, dim)
+        if key not in self._buffers:
+            self._buffers = {key: {
+                'cell': np.empty((num, dim), dtype=np.int64),
+                'fract': np.empty((num, dim), dtype=np.float64),
+                'weight': np.empty((num, dim), dtype=np.float64),
+                'hash': np.empty(num, dtype=np.int64),
+                'grad': np.empty(num, dtype=np.int64),
+                'dot': np.empty(num, dtype=np.float64),
+                'temp': np.empty(num, dtype=np.float64),
+                'corner_weight': np.empty(num, dtype=np.float64),
+            }}
+        return self._buffers[key]
+
+    def evaluate(self, pos, out=None):
+        """ ノイズ値を計算
+
+        Args:
+            pos(np.ndarray): (N,3)か(N,4)の座標、4列目は時間
+            out(np.ndarray): 結果を書き込む(N,)の配列
+
+        Returns:
+            np.ndarray: (N,)の-1.0～1.0程度のノイズ値
+        """
+        num, dim = pos.shape
+        buf = self._get_buffers(num, dim)
+        if out is None:
+            out = np.empty(num, dtype=np.float64)
+
+        cell, fract, weight = buf['cell'], buf['fract'], buf['weight']
+        np.floor(pos, out=fract)
+        cell[:] = fract
+        np.subtract(pos, fract, out=fract)
+        weight[:] = fade(fract)
+        np.bitwise_and(cell, 255, out=cell)
+
+        grads = GRAD3 if dim == 3 else GRAD4
+        h, g, dot = buf['hash'], buf['grad'], buf['dot']
+        temp, corner_weight = buf['temp'], buf['corner_weight']
+
+        # 2^dim個の格子点ごとに、勾配との内積 * 補間ウェイトを足しこんでいく
+        out.fill(0.0)
+        for corner in range(1 << dim):
+            offsets = [(corner >> axis) & 1 for axis in range(dim)]
+
+            h.fill(0)
+            corner_weight.fill(1.0)
+            dot.fill(0.0)
+            for axis, o in enumerate(offsets):
+                np.add(h, cell[:, axis], out=h)
+                if o:
+                    np.add(h, 1, out=h)
+                np.take(self.perm, h, out=h)
+
+                if o:
+                    np.multiply(corner_weight, weight[:, axis], out=corner_weight)
+                else:
+                    np.subtract(1.0, weight[:, axis], out=temp)
+                    np.multiply(corner_weight, temp, out=corner_weight)
+
+            np.remainder(h, len(grads), out=g)
+            for axis, o in enumerate(offsets):
+                np.subtract(fract[:, axis], o, out=temp)
+                np.multiply(temp, grads[g, axis], out=temp)
+                np.add(dot, temp, out=dot)
+
+            np.multiply(dot, corner_weight, out=dot)
+            np.add(out, dot, out=out)
+
+        return out
+
+
+def fractal_noise(pos, noise=None, octaves=4, lacunarity=2.0, gain=0.5,
+                  noise_type='fbm', time=None):
+    """ オクターブを重ねたフラクタルノイズ
+
+    Args:
+        pos(np.ndarray): (N,3)の座標
+        noise(GradientNoise): Noneならシード0で生成
+        octaves(int): オクターブ数
+        lacunarity(float): オクターブごとの周波数の倍率
+        gain(float): オクターブごとの振幅の倍率
+        noise_type(str): 'fbm', 'turbulence', 'ridged'
+        time(float): 指定した場合は4Dノイズとして時間方向にも変化させる
+
+    Returns:
+        np.ndarray: (N,)のノイズ値、fbmは-1.0～1.0、それ以外は0.0～1.0
+    """
+    assert noise_type in NOISE_TYPES, 'invalid noise type was passed.'
+    if noise is None:
+        noise = GradientNoise()
+
+    pos = np.asarray(pos, dtype=np.float64)
+    num = len(pos)
+
+    # オクターブごとの座標と結果のバッファ、全オクターブで使いまわす
+    if time is None:
+        octave_pos = pos.copy()
+    else:
+        octave_pos = np.empty((num, 4), dtype=np.float64)
+        octave_pos[:, :3] = pos
+        octave_pos[:, 3] = time
+    octave_val = np.empty(num, dtype=np.float64)
+    result = np.zeros(num, dtype=np.float64)
+
+    amp = 1.0
+    amp_total = 0.0
+    for _ in range(max(octaves, 1)):
+        noise.evaluate(octave_pos, out=octave_val)
+
+        if noise_type == 'turbulence':
+            np.abs(octave_val, out=octave_val)
+        elif noise_type == 'ridged':
+            np.abs(octave_val, out=octave_val)
+            np.subtract(1.0, octave_val, out=octave_val)
+            np.multiply(octave_val, octave_val, out=octave_val)
+
+        octave_val *= amp
+        result += octave_val
+        amp_total += amp
+
+        octave_pos *= lacunarity
+        amp *= gain
+
+    result /= amp_total
+    return result
+
+
+def perlin_noise(pos, seed=0):
+    """ (N,3)の座標に対して一括でグラディエントノイズを計算
+
+    Args:
+        pos(np.ndarray): (N,3)の座標
+        seed(int): シード値
+
+    Returns:
+        np.ndarray: (N,)の-1.0～1.0程度のノイズ値
+    """
+    return GradientNoise(seed).evaluate(np.asarray(pos, dtype=np.float64))
+
+
+def normalized_noise(pos, seed=0, octaves=1, lacunarity=2.0, gain=0.5,
+                     noise_type='fbm', time=None):
+    """ 0.0～1.0に正規化したフラクタルノイズ
+
+    Args:
+        pos(np.ndarray): (N,3)のスケール・オフセット適用済みの座標
+
+    Returns:
+        np.ndarray: (N,)の0.0～1.0のノイズ値
+    """
+    val = fractal_noise(pos, GradientNoise(seed), octaves, lacunarity, gain,
+                        noise_type, time)
+
+    if noise_type == 'fbm':
         val = (val + 1.0) * 0.5
-        color = [val, val, val]
-        mc.polyColorPerVertex(v, rgb=color)
+    return np.clip(val, 0.0, 1.0)
+
+
+def compute_vertex_noise(fn_mesh, scale=0.03, offset=0.0, seed=0, octaves=1,
+                         lacunarity=2.0, gain=0.5, noise_type='fbm', time=None):
+    """ ワールド座標から頂点ごとのノイズを計算
+
+    Returns:
+        np.ndarray: (V,)の0.0～1.0のノイズ値
+    """
+    pos = get_points(fn_mesh, om2.MSpace.kWorld) * scale + offset
+    return normalized_noise(pos, seed, octaves, lacunarity, gain, noise_type, time)
+
+
+def main(scale=0.03, offset=0.0, seed=0, octaves=1, noise_type='fbm', channel='rgb'):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    load_plugin('HTM_NoiseVertexColor')
+    with Timer():
+        mc.HTM_NoiseVertexColor(sel, scale=scale, offset=offset, seed=seed,
+                                octaves=octaves, type=noise_type, channel=channel)
+
+
+if '__main__' == __name__:
+    main()
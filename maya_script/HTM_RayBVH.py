@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+""" NumPyで実装した三角形BVHとバッチ処理のレイクエリ
+    レイごとにループせず、(レイ, ノード)のペアをまとめて処理していく
+"""
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_dag_path, get_points, get_face_vertex_ids,
+                                     get_triangle_face_vertices)
+
+
+# 1回のトラバースで扱う(レイ, ノード)ペア数の目安、メモリ使用量の調整用
+RAY_CHUNK = 1 << 16
+
+
+def morton_code(points):
+    """ 0.0～1.0に正規化した座標から30bitのモートンコードを計算
+    """
+    grid = np.clip((points * 1024.0).astype(np.int64), 0, 1023)
+
+    def spread(v):
+        v = (v * 0x00010001) & 0xFF0000FF
+        v = (v * 0x00000101) & 0x0F00F00F
+        v = (v * 0x00000011) & 0xC30C30C3
+        v = (v * 0x00000005) & 0x49249249
+        return v
+
+    return (spread(grid[:, 0]) << 2) | (spread(grid[:, 1]) << 1) | spread(grid[:, 2])
+
+
+class TriangleBVH(object):
+    """ 三角形のBVH、モートンコード順に並べた三角形を二分していくLBVH
+        配列だけで構成されているのでpickleしてワーカープロセスにも渡せる
+
+    Attributes:
+        tris(np.ndarray): (T,3,3)のBVH順に並べた三角形の頂点座標
+        tri_ids(np.ndarray): (T,)のBVH順 -> 元の三角形番号
+        node_min(np.ndarray): (N,3)のノードのAABB
+        node_max(np.ndarray): (N,3)
+        node_child(np.ndarray): (N,2)の子ノード番号、葉は-1
+        node_start(np.ndarray): (N,)の三角形範囲の開始
+        node_count(np.ndarray): (N,)の三角形数
+    """
+    def __init__(self, tris, leaf_size=4):
+        tris = np.asarray(tris, dtype=np.float64).reshape(-1, 3, 3)
+
+        tri_min = tris.min(axis=1)
+        tri_max = tris.max(axis=1)
+        centroid = (tri_min + tri_max) * 0.5
+
+        # モートンコード順に並べ替え
+        lo = centroid.min(axis=0)
+        extent = np.maximum(centroid.max(axis=0) - lo, 1e-12)
+        codes = morton_code((centroid - lo) / extent)
+        order = np.argsort(codes, kind='stable')
+
+        self.codes = codes[order]
+        self.code_lo = lo
+        self.code_extent = extent
+        self.tris = np.ascontiguousarray(tris[order])
+        self.tri_ids = order.astype(np.int64)
+        self.build(tri_min[order], tri_max[order], leaf_size)
+
+    def build(self, tri_min, tri_max, leaf_size):
+        """ 階層ごとにまとめてノードを分割していく
+        """
+        num_tris = len(tri_min)
+
+        # reduceatで末尾を扱うためのダミー行
+        tri_min_pad = np.vstack([tri_min, np.zeros((1, 3))])
+        tri_max_pad = np.vstack([tri_max, np.zeros((1, 3))])
+
+        starts, counts, mins, maxs, children = [], [], [], [], []
+        level_start = np.array([0], dtype=np.int64)
+        level_count = np.array([num_tris], dtype=np.int64)
+        level_parent = np.array([-1], dtype=np.int64)
+        level_side = np.array([0], dtype=np.int64)
+        num_nodes = 0
+
+        while len(level_start) and num_tris:
+            ids = np.arange(num_nodes, num_nodes + len(level_start))
+            num_nodes += len(level_start)
+
+            # ノードのAABB、[start, end)の範囲をreduceatで集計
+            bounds = np.empty(len(level_start) * 2, dtype=np.int64)
+            bounds[0::2] = level_start
+            bounds[1::2] = level_start + level_count
+            mins.append(np.minimum.reduceat(tri_min_pad, bounds, axis=0)[0::2])
+            maxs.append(np.maximum.reduceat(tri_max_pad, bounds, axis=0)[0::2])
+            starts.append(level_start)
+            counts.append(level_count)
+
+            child = np.full((len(level_start), 2), -1, dtype=np.int64)
+            children.append(child)
+
+            # 親ノードに子の番号を登録
+            has_parent = level_parent >= 0
+            if has_parent.any():
+                all_children = np.concatenate(children)
+                all_children[level_parent[has_parent], level_side[has_parent]] = ids[has_parent]
+                children = [all_children]
+
+            # 三角形数がleaf_sizeより多いノードだけ半分に分割
+            split = level_count > leaf_size
+            half = level_count[split] // 2
+            next_start = np.empty(half.size * 2, dtype=np.int64)
+            next_start[0::2] = level_start[split]
+            next_start[1::2] = level_start[split] + half
+            next_count = np.empty(half.size * 2, dtype=np.int64)
+            next_count[0::2] = half
+            next_count[1::2] = level_count[split] - half
+
+            level_parent = np.repeat(ids[split], 2)
+            level_side = np.tile([0, 1], half.size)
+            level_start, level_count = next_start, next_count
+
+        self.node_min = np.concatenate(mins) if mins else np.zeros((0, 3))
+        self.node_max = np.concatenate(maxs) if maxs else np.zeros((0, 3))
+        self.node_child = np.concatenate(children) if children else np.zeros((0, 2), dtype=np.int64)
+        self.node_start = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        self.node_count = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_min)
+
+    # ---------------------------------------------------------
+    # レイクエリ
+    # ---------------------------------------------------------
+    def _intersect_aabb(self, origins, inv_dirs, nodes, t_max):
+        """ (レイ, ノード)ペアのAABB判定、ヒットしたペアのマスクを返す
+        """
+        t0 = (self.node_min[nodes] - origins) * inv_dirs
+        t1 = (self.node_max[nodes] - origins) * inv_dirs
+        t_enter = np.nanmax(np.minimum(t0, t1), axis=1)
+        t_exit = np.nanmin(np.maximum(t0, t1), axis=1)
+        return (t_exit >= np.maximum(t_enter, 0.0)) & (t_enter <= t_max)
+
+    def _intersect_tris(self, origins, dirs, tris, t_max, cull=0):
+        """ Moller-Trumboreでの三角形判定
+
+        Args:
+            cull(int): 1なら裏面、-1なら表面を無視する、0なら両面
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray:
+                ヒットしたかのマスク、t、重心座標u、v
+        """
+        v0 = tris[:, 0]
+        e1 = tris[:, 1] - v0
+        e2 = tris[:, 2] - v0
+
+        p = np.cross(dirs, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        if cull > 0:
+            valid = det > 1e-12
+        elif cull < 0:
+            valid = det < -1e-12
+        else:
+            valid = np.abs(det) > 1e-12
+        inv_det = np.zeros_like(det)
+        inv_det[valid] = 1.0 / det[valid]
+
+        s = origins - v0
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum('ij,ij->i', dirs, q) * inv_det
+        t = np.einsum('ij,ij->i', e2, q) * inv_det
+
+        hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 0.0) & (t <= t_max)
+        return hit, t, u, v
+
+    def _expand_leaves(self, items, leaf_nodes):
+        """ (レイか点, 葉ノード)のペアを(レイか点, 三角形)のペアに展開
+        """
+        counts = self.node_count[leaf_nodes]
+        pair_items = np.repeat(items, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return pair_items, np.repeat(self.node_start[leaf_nodes], counts) + offsets
+
+    def _traverse(self, origins, dirs, t_max, any_hit, cull):
+        """ まとめてトラバースする、any_hitなら最初にヒットした時点でそのレイは終了
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray:
+                (R,)のt(ミスはinf)、(R,)のBVH順の三角形番号(ミスは-1)、(R,2)の重心座標
+        """
+        num_rays = len(origins)
+        t_best = np.array(t_max, dtype=np.float64, copy=True)
+        hit_tri = np.full(num_rays, -1, dtype=np.int64)
+        hit_uv = np.zeros((num_rays, 2), dtype=np.float64)
+        done = np.zeros(num_rays, dtype=bool)
+
+        if not self.num_nodes:
+            return np.full(num_rays, np.inf), hit_tri, hit_uv
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_dirs = 1.0 / dirs
+
+        rays = np.arange(num_rays, dtype=np.int64)
+        nodes = np.zeros(num_rays, dtype=np.int64)
+
+        while len(rays):
+            if any_hit:
+                keep = ~done[rays]
+                rays, nodes = rays[keep], nodes[keep]
+
+            with np.errstate(invalid='ignore'):
+                mask = self._intersect_aabb(origins[rays], inv_dirs[rays], nodes, t_best[rays])
+            rays, nodes = rays[mask], nodes[mask]
+
+            # 葉ノードは三角形判定
+            is_leaf = self.node_child[nodes, 0] < 0
+            leaf_rays, leaf_nodes = rays[is_leaf], nodes[is_leaf]
+            if len(leaf_rays):
+                pair_rays, pair_tris = self._expand_leaves(leaf_rays, leaf_nodes)
+                hit, t, u, v = self._intersect_tris(origins[pair_rays], dirs[pair_rays],
+                                                    self.tris[pair_tris], t_best[pair_rays],
+                                                    cull)
+                if hit.any():
+                    pair_rays, pair_tris = pair_rays[hit], pair_tris[hit]
+                    t, u, v = t[hit], u[hit], v[hit]
+
+                    # レイごとに最も近いヒットを採用
+                    order = np.lexsort((t, pair_rays))
+                    first = np.ones(len(order), dtype=bool)
+                    first[1:] = pair_rays[order[1:]] != pair_rays[order[:-1]]
+                    best = order[first]
+
+                    r = pair_rays[best]
+                    closer = t[best] < t_best[r]
+                    r, best = r[closer], best[closer]
+                    t_best[r] = t[best]
+                    hit_tri[r] = pair_tris[best]
+                    hit_uv[r, 0] = u[best]
+                    hit_uv[r, 1] = v[best]
+                    done[r] = True
+
+            # 内部ノードは子ノードに展開
+            inner_rays, inner_nodes = rays[~is_leaf], nodes[~is_leaf]
+            rays = np.repeat(inner_rays, 2)
+            nodes = self.node_child[inner_nodes].reshape(-1)
+
+        t_best[hit_tri < 0] = np.inf
+        return t_best, hit_tri, hit_uv
+
+    def _query(self, origins, dirs, max_distance, any_hit, cull):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        dirs = np.asarray(dirs, dtype=np.float64).reshape(-1, 3)
+        num_rays = len(origins)
+
+        t_max = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (num_rays,))
+        t_hit = np.full(num_rays, np.inf)
+        tri_hit = np.full(num_rays, -1, dtype=np.int64)
+        uv_hit = np.zeros((num_rays, 2))
+
+        # レイをチャンクに分けてメモリ使用量を抑える
+        for start in range(0, num_rays, RAY_CHUNK):
+            end = min(start + RAY_CHUNK, num_rays)
+            t, tri, uv = self._traverse(origins[start:end], dirs[start:end],
+                                        t_max[start:end], any_hit, cull)
+            t_hit[start:end] = t
+            tri_hit[start:end] = tri
+            uv_hit[start:end] = uv
+
+        # BVH順の三角形番号を元の番号に戻す
+        hit = tri_hit >= 0
+        tri_hit[hit] = self.tri_ids[tri_hit[hit]]
+        return t_hit, tri_hit, uv_hit
+
+    @staticmethod
+    def _cull_mode(cull_backface, cull_frontface):
+        if cull_backface:
+            return 1
+        return -1 if cull_frontface else 0
+
+    def intersect_any(self, origins, dirs, max_distance=np.inf, cull_backface=False,
+                      cull_frontface=False):
+        """ いずれかの三角形にヒットするかどうか、遮蔽判定用
+
+        Args:
+            origins(np.ndarray): (R,3)のレイの始点
+            dirs(np.ndarray): (R,3)のレイの方向、正規化しておけばtが距離になる
+            max_distance(float or np.ndarray): 最大距離、レイごとに指定も可
+
+        Returns:
+            np.ndarray: (R,)のbool
+        """
+        t_hit, _, _ = self._query(origins, dirs, max_distance, True,
+                                  self._cull_mode(cull_backface, cull_frontface))
+        return np.isfinite(t_hit)
+
+    def intersect_closest(self, origins, dirs, max_distance=np.inf, cull_backface=False,
+                          cull_frontface=False):
+        """ 最も近いヒット
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray:
+                (R,)の距離t(ミスはinf)、(R,)の三角形番号(ミスは-1)、
+                (R,2)の重心座標(u, v)、三角形の頂点1, 2に対するウェイト
+        """
+        return self._query(origins, dirs, max_distance, False,
+                           self._cull_mode(cull_backface, cull_frontface))
+
+
+    # ---------------------------------------------------------
+    # 最近接点クエリ
+    # ---------------------------------------------------------
+    def _aabb_distance2(self, points, nodes):
+        """ 点とノードのAABBの距離の2乗
+        """
+        d = (np.maximum(self.node_min[nodes] - points, 0.0) +
+             np.maximum(points - self.node_max[nodes], 0.0))
+        return np.einsum('ij,ij->i', d, d)
+
+    def _aabb_far_distance2(self, points, nodes):
+        """ 点とノードのAABBの最も遠い角の距離の2乗
+            ノード内の三角形はすべてAABBの中にあるので、最近接点の距離の上限になる
+        """
+        d = np.maximum(np.abs(self.node_min[nodes] - points), np.abs(self.node_max[nodes] - points))
+        return np.einsum('ij,ij->i', d, d)
+
+    def _morton_neighbors(self, points, num_neighbors=4):
+        """ モートンコード順で前後にある三角形を候補にする、最近接点の距離の初期の上限を求める用
+
+        Returns:
+            np.ndarray, np.ndarray: (M,)の点の番号、(M,)のBVH順の三角形番号
+        """
+        codes = morton_code((points - self.code_lo) / self.code_extent)
+        pos = np.searchsorted(self.codes, codes)
+        offsets = np.arange(-num_neighbors, num_neighbors)
+        tris = np.clip(pos[:, np.newaxis] + offsets, 0, len(self.codes) - 1)
+        items = np.repeat(np.arange(len(points), dtype=np.int64), len(offsets))
+        return items, tris.reshape(-1)
+
+    def _update_closest(self, points, items, leaf_nodes, best_d2, best_tri, best_bary,
+                        pair_tris=None):
+        """ 葉ノードの三角形との最近接点を求めて、点ごとの最良値を更新する
+            pair_trisを指定した場合は(点, 三角形)のペアをそのまま使う
+        """
+        if pair_tris is None:
+            pair_items, pair_tris = self._expand_leaves(items, leaf_nodes)
+        else:
+            pair_items = items
+        if not len(pair_items):
+            return
+
+        bary, dist = closest_point_barycentric(points[pair_items], self.tris[pair_tris])
+        d2 = dist * dist
+
+        order = np.lexsort((d2, pair_items))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_items[order[1:]] != pair_items[order[:-1]]
+        best = order[first]
+
+        p = pair_items[best]
+        closer = d2[best] <= best_d2[p]
+        p, best = p[closer], best[closer]
+        best_d2[p] = d2[best]
+        best_tri[p] = pair_tris[best]
+        best_bary[p] = bary[best]
+
+    def _closest_traverse(self, points, max_distance):
+        num = len(points)
+        best_d2 = np.array(max_distance, dtype=np.float64, copy=True) ** 2
+        best_tri = np.full(num, -1, dtype=np.int64)
+        best_bary = np.zeros((num, 3), dtype=np.float64)
+        if not self.num_nodes:
+            return best_d2, best_tri, best_bary
+
+        # 先にモートンコードが近い三角形で上限を決めておくと、その後の枝刈りがよく効く
+        items, tris = self._morton_neighbors(points)
+        self._update_closest(points, items, None, best_d2, best_tri, best_bary, pair_tris=tris)
+
+        items = np.arange(num, dtype=np.int64)
+        nodes = np.zeros(num, dtype=np.int64)
+        while len(items):
+            keep = self._aabb_distance2(points[items], nodes) <= best_d2[items]
+            items, nodes = items[keep], nodes[keep]
+
+            # 降りるにつれてAABBが小さくなるので、上限も詰めていく
+            np.minimum.at(best_d2, items, self._aabb_far_distance2(points[items], nodes))
+
+            is_leaf = self.node_child[nodes, 0] < 0
+            if is_leaf.any():
+                self._update_closest(points, items[is_leaf], nodes[is_leaf],
+                                     best_d2, best_tri, best_bary)
+
+            items = np.repeat(items[~is_leaf], 2)
+            nodes = self.node_child[nodes[~is_leaf]].reshape(-1)
+
+        return best_d2, best_tri, best_bary
+
+    def closest_point(self, points, max_distance=np.inf):
+        """ 各点から最も近い三角形上の点
+
+        Args:
+            points(np.ndarray): (N,3)
+            max_distance(float or np.ndarray): 最大距離、これより遠い点はミス扱い
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray:
+                (N,)の距離(ミスはinf)、(N,)の三角形番号(ミスは-1)、(N,3)の重心座標
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        num = len(points)
+        limit = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (num,))
+
+        dist = np.full(num, np.inf)
+        tri = np.full(num, -1, dtype=np.int64)
+        bary = np.zeros((num, 3))
+        for start in range(0, num, RAY_CHUNK):
+            end = min(start + RAY_CHUNK, num)
+            d2, t, b = self._closest_traverse(points[start:end], limit[start:end])
+            dist[start:end] = np.sqrt(d2)
+            tri[start:end] = t
+            bary[start:end] = b
+
+        hit = tri >= 0
+        dist[~hit] = np.inf
+        tri[hit] = self.tri_ids[tri[hit]]
+        return dist, tri, bary
+
+
+# ---------------------------------------------------------
+# メッシュからのBVH構築
+# ---------------------------------------------------------
+def get_mesh_triangles(obj, space=om2.MSpace.kWorld):
+    """ メッシュの三角形を取得
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray:
+            (T,3,3)の三角形の頂点座標、(T,3)の三角形の頂点ID、(T,)のフェースID
+    """
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    points = get_points(fn_mesh, space)
+    _, vertices = get_face_vertex_ids(fn_mesh)
+    tri_faces, tri_fv = get_triangle_face_vertices(fn_mesh)
+
+    tri_vertices = vertices[tri_fv]
+    return points[tri_vertices], tri_vertices, tri_faces
+
+
+def build_mesh_bvh(objs, leaf_size=4):
+    """ 複数メッシュの三角形をまとめたワールド空間のBVHを作成
+
+    Args:
+        objs(list[str]): メッシュのリスト
+
+    Returns:
+        TriangleBVH, np.ndarray: BVHと、(T,)の三角形ごとのメッシュ番号(objsのインデックス)
+    """
+    all_tris = []
+    mesh_ids = []
+    for i, obj in enumerate(objs):
+        tris, _, _ = get_mesh_triangles(obj)
+        all_tris.append(tris)
+        mesh_ids.append(np.full(len(tris), i, dtype=np.int32))
+
+    if not all_tris:
+        return TriangleBVH(np.zeros((0, 3, 3)), leaf_size), np.zeros(0, dtype=np.int32)
+
+    return TriangleBVH(np.concatenate(all_tris), leaf_size), np.concatenate(mesh_ids)
+
+
+def nearest_point_ids(src_points, points, max_distance=np.inf):
+    """ 各点に最も近いsrc_pointsの点の番号、点を大きさ0の三角形としたBVHで探す
+
+    Args:
+        src_points(np.ndarray): (M,3)の探す対象の点
+        points(np.ndarray): (N,3)のクエリ点
+
+    Returns:
+        np.ndarray, np.ndarray: (N,)の点番号(ミスは-1)、(N,)の距離
+    """
+    src_points = np.asarray(src_points, dtype=np.float64).reshape(-1, 3)
+    bvh = TriangleBVH(np.repeat(src_points[:, np.newaxis], 3, axis=1))
+    dist, ids, _ = bvh.closest_point(points, max_distance)
+    return ids, dist
+
+
+# ---------------------------------------------------------
+# 投影
+# ---------------------------------------------------------
+def closest_point_barycentric(points, tris):
+    """ 各点から三角形上の最近接点を求め、その重心座標を返す (Ericson, Real-Time Collision Detection)
+
+    Args:
+        points(np.ndarray): (N,3)
+        tris(np.ndarray): (N,3,3)の点ごとの三角形
+
+    Returns:
+        np.ndarray, np.ndarray: (N,3)の重心座標、(N,)の距離
+    """
+    a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+
+    def dot(x, y):
+        return np.einsum('ij,ij->i', x, y)
+
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 面の内側
+        denom = va + vb + vc
+        v = np.where(denom != 0.0, vb / denom, 0.0)
+        w = np.where(denom != 0.0, vc / denom, 0.0)
+        bary = np.column_stack([1.0 - v - w, v, w])
+
+        # 辺上、後に判定したものほど優先度が高いので内側 -> 辺 -> 頂点の順に上書きする
+        edge_bc = (va <= 0.0) & (d4 - d3 >= 0.0) & (d5 - d6 >= 0.0)
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        bary[edge_bc] = np.column_stack([np.zeros_like(t), 1.0 - t, t])[edge_bc]
+
+        edge_ac = (vb <= 0.0) & (d2 >= 0.0) & (d6 <= 0.0)
+        t = d2 / (d2 - d6)
+        bary[edge_ac] = np.column_stack([1.0 - t, np.zeros_like(t), t])[edge_ac]
+
+        edge_ab = (vc <= 0.0) & (d1 >= 0.0) & (d3 <= 0.0)
+        t = d1 / (d1 - d3)
+        bary[edge_ab] = np.column_stack([1.0 - t, t, np.zeros_like(t)])[edge_ab]
+
+    vtx_c = (d6 >= 0.0) & (d5 <= d6)
+    vtx_b = (d3 >= 0.0) & (d4 <= d3)
+    vtx_a = (d1 <= 0.0) & (d2 <= 0.0)
+    for mask, k in ((vtx_c, 2), (vtx_b, 1), (vtx_a, 0)):
+        bary[mask] = 0.0
+        bary[mask, k] = 1.0
+
+    bary = np.nan_to_num(bary)
+    closest = np.einsum('ij,ijk->ik', bary, tris)
+    return bary, np.linalg.norm(points - closest, axis=1)
+
+
+class MeshProjector(object):
+    """ 転送元メッシュへの投影、法線の正負両方向にまとめてレイを飛ばし
+        ミスした点は最近接点にフォールバックする
+
+    Example:
+        projector = MeshProjector('pCube1')
+        vertex_ids, weights = projector.project(points, normals, max_distance=1.0)
+        values = (src_values[vertex_ids] * weights[:, :, np.newaxis]).sum(axis=1)
+    """
+    def __init__(self, obj, leaf_size=4):
+        self.fn_mesh = om2.MFnMesh(get_dag_path(obj))
+        self.tris, self.tri_vertices, self.tri_faces = get_mesh_triangles(self.fn_mesh.fullPathName())
+        self.bvh = TriangleBVH(self.tris, leaf_size)
+
+    def project(self, points, normals, max_distance=np.inf, cull_backface=True, fallback=True):
+        """ 点ごとに転送元の三角形と重心座標を求める
+
+        Args:
+            points(np.ndarray): (N,3)のワールド座標
+            normals(np.ndarray): (N,3)の正規化済みワールド法線
+            max_distance(float): 投影する最大距離
+            cull_backface(bool): 法線と逆を向いている転送元の面を無視する
+            fallback(bool): ミスした点を最近接点で埋める、Falseならミスした点の頂点IDは-1
+
+        Returns:
+            np.ndarray, np.ndarray: (N,3)の転送元の頂点ID、(N,3)の重心座標
+        """
+        num = len(points)
+
+        # 法線方向のレイは法線と同じ向きの面(レイから見て裏面)、逆方向のレイは表面だけ当てる
+        t_out, tri_out, uv_out = self.bvh.intersect_closest(
+            points, normals, max_distance, cull_frontface=cull_backface)
+        t_in, tri_in, uv_in = self.bvh.intersect_closest(
+            points, -normals, max_distance, cull_backface=cull_backface)
+
+        use_in = t_in < t_out
+        tri = np.where(use_in, tri_in, tri_out)
+        uv = np.where(use_in[:, np.newaxis], uv_in, uv_out)
+        bary = np.column_stack([1.0 - uv[:, 0] - uv[:, 1], uv[:, 0], uv[:, 1]])
+
+        miss = tri < 0
+        if fallback and miss.any():
+            tri[miss], bary[miss] = self.closest_point(points[miss])
+
+        vertex_ids = np.full((num, 3), -1, dtype=np.int64)
+        hit = tri >= 0
+        vertex_ids[hit] = self.tri_vertices[tri[hit]]
+        return vertex_ids, bary
+
+    def closest_point(self, points, max_distance=np.inf):
+        """ BVHで最近接点の三角形と重心座標を求める
+
+        Returns:
+            np.ndarray, np.ndarray: (N,)の三角形番号(ミスは-1)、(N,3)の重心座標
+        """
+        _, tri, bary = self.bvh.closest_point(points, max_distance)
+        return tri, bary
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+""" 現在のジョイント位置をバインドポーズ位置にするコマンド
+    ジョイントごとにlistConnections、getAttrを繰り返さず、接続はMPlugで1回だけたどり
+    行列はまとめて計算して、1つのMDGModifierで書き込むので1回でUndoできる
+"""
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+
+def maya_useNewAPI():
+    pass
+
+
+def _destinations(plug, fn_type, attr_name):
+    """ plugの接続先のうち、指定したタイプのノードの指定したアトリビュートの(ノード, 論理インデックス)
+    """
+    result = []
+    for dst in plug.connectedTo(False, True):
+        node = dst.node()
+        if not node.hasFn(fn_type):
+            continue
+        if dst.isElement and om2.MFnAttribute(dst.attribute()).name == attr_name:
+            result.append((node, dst.logicalIndex()))
+    return result
+
+
+def get_bind_connections(dags):
+    """ ジョイントごとのスキンクラスター、dagPoseの接続先をまとめて取得
+        スキンクラスターに繋がっていないジョイントは除く
+
+    Args:
+        dags(list[MDagPath]): ジョイント
+
+    Returns:
+        list[tuple[MDagPath, list, list]]:
+            (ジョイント, [(スキンクラスター, matrixの論理インデックス)], [(dagPose, membersの論理インデックス)])
+    """
+    result = []
+    for dag in dags:
+        fn_node = om2.MFnDependencyNode(dag.node())
+        world_plug = fn_node.findPlug('worldMatrix', False).elementByLogicalIndex(0)
+        skin_clusters = _destinations(world_plug, om2.MFn.kSkinClusterFilter, 'matrix')
+        if not skin_clusters:
+            continue
+
+        dag_poses = _destinations(fn_node.findPlug('message', False), om2.MFn.kDagPose, 'members')
+        result.append((dag, skin_clusters, dag_poses))
+    return result
+
+
+def compute_bind_matrices(dags):
+    """ ワールド行列、ローカル行列、ワールド逆行列をまとめて計算
+
+    Returns:
+        np.ndarray, np.ndarray, np.ndarray: (N,4,4)のワールド、ローカル、ワールド逆行列
+    """
+    world = np.array([list(dag.inclusiveMatrix()) for dag in dags]).reshape(-1, 4, 4)
+    parent = np.array([list(dag.exclusiveMatrix()) for dag in dags]).reshape(-1, 4, 4)
+
+    # Mayaは行ベクトルなので world = local * parent
+    local = np.matmul(world, np.linalg.inv(parent))
+    return world, local, np.linalg.inv(world)
+
+
+class HTM_ReinitializeSkinnedJoint(om2.MPxCommand):
+    """ ジョイントのbindPose、dagPoseのxformMatrix、スキンクラスターのbindPreMatrixを
+        現在のジョイントの行列で更新する、メッシュ形状はそのまま
+    """
+    kPluginCmdName = 'HTM_ReinitializeSkinnedJoint'
+
+    def __init__(self):
+        om2.MPxCommand.__init__(self)
+        self.modifier = om2.MDGModifier()
+
+    def doIt(self, args):
+        arg_data = om2.MArgDatabase(self.syntax(), args)
+        sel_list = arg_data.getObjectList()
+        dags = [sel_list.getDagPath(i) for i in range(sel_list.length())]
+
+        targets = get_bind_connections([dag for dag in dags if dag.hasFn(om2.MFn.kJoint)])
+        if targets:
+            world, local, inverse = compute_bind_matrices([dag for dag, _, _ in targets])
+            for i, (dag, skin_clusters, dag_poses) in enumerate(targets):
+                self.set_matrix(om2.MFnDependencyNode(dag.node()).findPlug('bindPose', False),
+                                world[i])
+
+                for node, index in dag_poses:
+                    plug = om2.MFnDependencyNode(node).findPlug('xformMatrix', False)
+                    self.set_matrix(plug.elementByLogicalIndex(index), local[i])
+
+                for node, index in skin_clusters:
+                    plug = om2.MFnDependencyNode(node).findPlug('bindPreMatrix', False)
+                    self.set_matrix(plug.elementByLogicalIndex(index), inverse[i])
+
+        self.setResult(len(targets))
+        self.redoIt()
+
+    def redoIt(self):
+        self.modifier.doIt()
+
+    def undoIt(self):
+        self.modifier.undoIt()
+
+    def isUndoable(self):
+        return True
+
+    def set_matrix(self, plug, matrix):
+        data = om2.MFnMatrixData().create(om2.MMatrix(matrix.reshape(-1).tolist()))
+        self.modifier.newPlugValue(plug, data)
+
+    @staticmethod
+    def syntaxCreator():
+        """ Add arguments, keyword arguments.
+
+        Flag:
+            Positional:
+                joint names: Str
+        """
+        syntax = om2.MSyntax()
+
+        # Positional Args
+        # setObjectTypeした時点でコマンド引数が設定される。オブジェクトはstringでしか渡せない。
+        syntax.setObjectType(om2.MSyntax.kSelectionList, 1)
+        return syntax
+
+    @staticmethod
+    def cmdCreator():
+        return HTM_ReinitializeSkinnedJoint()
+
+
+def initializePlugin(mobject):
+    plugin = om2.MFnPlugin(mobject)
+    plugin.registerCommand(HTM_ReinitializeSkinnedJoint.kPluginCmdName,
+                           HTM_ReinitializeSkinnedJoint.cmdCreator,
+                           HTM_ReinitializeSkinnedJoint.syntaxCreator)
+
+
+def uninitializePlugin(mobject):
+    pluginFn = om2.MFnPlugin(mobject)
+    pluginFn.deregisterCommand(HTM_ReinitializeSkinnedJoint.kPluginCmdName)
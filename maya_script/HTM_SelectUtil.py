@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from collections import defaultdict, OrderedDict
+import numpy as np
 import maya.api.OpenMaya as om2
 import maya.cmds as cmds
 
@@ -146,4 +147,63 @@ def get_soft_sel_weights():
     if symmetry_state:
         cmds.symmetricModelling(symmetry=False)
         
-    return weights
\ No newline at end of file
+    return weights
+
+
+def get_selection_weights():
+    """ 選択からオブジェクトごとの頂点ウェイトを取得
+        ソフト選択が有効ならそのウェイト、コンポーネント選択なら選択頂点が1.0
+        オブジェクトごと選択されている場合はNone(全体)
+
+    Returns:
+        list[tuple[str, np.ndarray]]: (シェイプのフルパス, (V,)のウェイトかNone)のリスト
+    """
+    if cmds.softSelect(q=True, sse=True):
+        sel = om2.MGlobal.getRichSelection().getSelection()
+    else:
+        components = cmds.ls(sl=True, fl=False) or []
+        converted = cmds.polyListComponentConversion(
+            [c for c in components if '.' in c], toVertex=True) or []
+        sel = om2.MSelectionList()
+        for name in [c for c in components if not '.' in c] + converted:
+            sel.add(name)
+
+    result = []
+    index = {}
+    for i in range(sel.length()):
+        dag, comp = sel.getComponent(i)
+        try:
+            dag.extendToShape()
+        except RuntimeError:
+            continue
+        if not dag.hasFn(om2.MFn.kMesh):
+            continue
+
+        shape = dag.fullPathName()
+        if comp.isNull():
+            if shape in index:
+                result[index[shape]] = (shape, None)
+            else:
+                index[shape] = len(result)
+                result.append((shape, None))
+            continue
+        if not comp.hasFn(om2.MFn.kMeshVertComponent):
+            continue
+
+        if shape not in index:
+            index[shape] = len(result)
+            result.append((shape, np.zeros(om2.MFnMesh(dag).numVertices, dtype=np.float32)))
+        weights = result[index[shape]][1]
+        if weights is None:
+            continue
+
+        fn_comp = om2.MFnSingleIndexedComponent(comp)
+        vtx_ids = np.array(fn_comp.getElements(), dtype=np.int64)
+        if fn_comp.hasWeights:
+            influence = np.array([fn_comp.weight(j).influence for j in range(len(vtx_ids))],
+                                 dtype=np.float32)
+        else:
+            influence = np.ones(len(vtx_ids), dtype=np.float32)
+        weights[vtx_ids] = np.maximum(weights[vtx_ids], influence)
+
+    return result
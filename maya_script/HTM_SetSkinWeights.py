@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import maya.api.OpenMaya as om2
+
+import HTM_Tools.HTM_SkinWeightPayload as payload_store
+from HTM_Tools.HTM_SkinWeights import get_skin_cluster, get_skin_weights, set_skin_weights
+
+
+kShort_flag_payload = '-pl'
+kLong_flag_payload = '-payload'
+
+
+def maya_useNewAPI():
+    pass
+
+
+class HTM_SetSkinWeights(om2.MPxCommand):
+    """ MFnSkinCluster.setWeights()のUndo対応をしたいがために作ったプラグイン
+        ウェイトはHTM_SkinWeightPayloadに登録したハンドル経由で受け取る
+        Undo用には設定する頂点の元のウェイトだけを疎な形式で保持する
+    """
+    kPluginCmdName = 'HTM_SetSkinWeights'
+
+    def __init__(self):
+        om2.MPxCommand.__init__(self)
+        self.obj = ''
+        self.payload = None
+        self.fn_sc = None
+
+        # Undo用
+        self.weights_old = None
+
+    def doIt(self, args):
+        self.parseArguments(args)
+        self.redoIt()
+
+    def redoIt(self):
+        _, self.fn_sc = get_skin_cluster(self.obj)
+        if self.fn_sc is None:
+            raise RuntimeError('{} has no skinCluster.'.format(self.obj))
+
+        # Redoの時は元のウェイトに戻っているので、最初に取得したものをそのまま使う
+        if self.weights_old is None:
+            self.weights_old = self.payload.previous
+        if self.weights_old is None:
+            self.weights_old = get_skin_weights(self.obj, self.fn_sc, threshold=0.0,
+                                                vertex_ids=self.payload.vertex_ids)
+        set_skin_weights(self.obj, self.payload.weights, self.fn_sc, self.payload.normalize,
+                         self.payload.vertex_ids)
+
+    def undoIt(self):
+        set_skin_weights(self.obj, self.weights_old, self.fn_sc,
+                         vertex_ids=self.payload.vertex_ids)
+
+    def isUndoable(self):
+        return True
+
+    def parseArguments(self, args):
+        arg_data = om2.MArgDatabase(self.syntax(), args)
+
+        # MSelectionListで取得される、1個しか扱えないので加工、あと文字列に変換
+        sel_list = arg_data.getObjectList()
+        self.obj = sel_list.getDagPath(0).fullPathName()
+
+        # ペイロードはここで取り出して、ストアからは解放しておく
+        if not arg_data.isFlagSet(kShort_flag_payload):
+            raise ValueError('-payload flag is required.')
+        self.payload = payload_store.take(arg_data.flagArgumentString(kShort_flag_payload, 0))
+
+    @staticmethod
+    def syntaxCreator():
+        """ Add arguments, keyword arguments.
+
+        Flag:
+            Positional:
+                shape name: Str
+            payload(pl): str, HTM_SkinWeightPayload.submit()で得たハンドル
+        """
+        syntax = om2.MSyntax()
+
+        # Positional Args
+        # setObjectTypeした時点でコマンド引数が設定される。オブジェクトはstringでしか渡せない。
+        syntax.setObjectType(om2.MSyntax.kSelectionList)
+
+        syntax.addFlag(kShort_flag_payload, kLong_flag_payload, om2.MSyntax.kString)
+        return syntax
+
+    @staticmethod
+    def cmdCreator():
+        return HTM_SetSkinWeights()
+
+
+def initializePlugin(mobject):
+    plugin = om2.MFnPlugin(mobject)
+    plugin.registerCommand(HTM_SetSkinWeights.kPluginCmdName,
+                           HTM_SetSkinWeights.cmdCreator,
+                           HTM_SetSkinWeights.syntaxCreator)
+
+
+def uninitializePlugin(mobject):
+    pluginFn = om2.MFnPlugin(mobject)
+    pluginFn.deregisterCommand(HTM_SetSkinWeights.kPluginCmdName)
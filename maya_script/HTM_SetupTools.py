@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import sys
+import time
 from tempfile import gettempdir
-import math
 from functools import wraps
 from contextlib import contextmanager
 
+import numpy as np
+
 from PySide2.QtWidgets import *
 from PySide2.QtCore import *
 from PySide2.QtGui import QImage, QIcon
@@ -12,7 +14,6 @@ from shiboken2 import wrapInstance
 
 import maya.cmds as mc
 import maya.api.OpenMaya as om2
-import maya.api.OpenMayaAnim as oma2
 import maya.OpenMaya as om
 import maya.OpenMayaAnim as omaz
 
@@ -22,6 +23,12 @@ from maya.app.general.mayaMixin import MayaQWidgetBaseMixin
 from maya.mel import eval
 import maya.utils
 
+from HTM_Tools.HTM_Util import load_plugin
+from HTM_Tools.HTM_JointHierarchy import get_joint_hierarchy
+from HTM_Tools.HTM_JointAudit import JointAudit, freeze_joints, matrices_to_euler
+from HTM_Tools.HTM_SkinWeights import get_skin_cluster, get_skin_weights, get_influences
+from HTM_Tools.HTM_SkinWeightPayload import apply_skin_weights
+
 python_version = sys.version_info.major
 win_title = 'HTM Setup Tools'
 
@@ -313,21 +320,18 @@ class HTM_SetupMiscFuncSet:
         """
         assert target in ['hierarchy', 'selection', 'all'], 'invalid argument was passed.'
 
-        joints = []
+        hierarchy = get_joint_hierarchy()
         if target == 'all':
-            joints = mc.ls(type='joint')
-
-        elif target == 'selection':
-            joints = mc.ls(sl=True, type='joint', l=True)
-
-        elif target == 'hierarchy':
-            joints = mc.ls(sl=True, type='joint', l=True)
-            if joints:
-                joints += mc.listRelatives(joints, ad=True, type='joint', f=True)
-                joints = set(joints)
+            ids = range(len(hierarchy))
+        else:
+            ids = hierarchy.indices(mc.ls(sl=True, type='joint', l=True))
+            if target == 'hierarchy':
+                ids = hierarchy.descendants(ids)
+        joints = hierarchy.names(ids)
 
         if not joints:
             om2.MGlobal.displayError('Pleaes select joint to show axis.')
+            return
 
         # Show flag switch
         axis_flag = [mc.getAttr(j + '.displayLocalAxis') for j in joints]
@@ -352,47 +356,28 @@ class HTM_FreezeJoint:
             freeze_rot(bool):回転値をフリーズ(ゼロにする)かどうか
             hierarchy(bool):階層で実行するかどうか
         """
-        joints = mc.ls(sl=1, type='joint', l=1)
+        joint_hierarchy = get_joint_hierarchy()
+        ids = joint_hierarchy.indices(mc.ls(sl=1, type='joint', l=1))
         if hierarchy:
-            joints += mc.listRelatives(mc.ls(sl=1), ad=1, type='joint', f=1)
-            joints = set(joints)  # delete redundant nodes
-
-        for joint in joints:
-            # 一旦回転値に値を全て逃がす（ジョイントの方向のフリーズ）
-            mtx = mc.getAttr('{}.worldMatrix[0]'.format(joint))
-            mtx = om2.MMatrix(mtx)
-            rot_rad = om2.MTransformationMatrix(mtx).rotation()
-            rot_deg = [math.degrees(x) for x in rot_rad]
+            # ジョイント以外のノードが選択されている場合は、その下のジョイントも対象にする
+            others = [node for node in mc.ls(sl=1, l=1) if not mc.nodeType(node) == 'joint']
+            ids = np.union1d(joint_hierarchy.descendants(ids), joint_hierarchy.below(others))
 
-            mc.setAttr('%s.jointOrient' % joint, 0, 0, 0)
-            mc.xform(joint, ws=True, ro=rot_deg)
-
-            # ジョイントの回転のフリーズ(逃がした回転地をジョイントの方向に入れ直すだけ)
-            if freeze_rot:
-                rot = mc.xform(joint, q=True, ws=False, ro=True)
-                mc.xform(joint, ro=(0, 0, 0))
-                mc.setAttr('{}.jointOrient'.format(joint), *rot)
+        # 読み込み、計算、書き込みはHTM_FreezeJointコマンドでまとめて行う
+        freeze_joints(joint_hierarchy.names(ids), mode='rotation' if freeze_rot else 'orientation')
 
     @classmethod
     def search_unfreezed_joint(cls, mode='rotation'):
-        """ 回転とジョイントの方向両方に値が入っているジョイントを選択する
+        """ 回転 or ジョイントの方向に値が入っているジョイントを選択する
+            チャンネルはJointAuditでまとめて取得して判定する
 
         Param:
-            mode(str): モード切替
+            mode(str): モード切替、'rotation', 'orientation', 'scale'
 
         Return:
             unfreezed(list): フリーズされていないジョイントのリスト
         """
-        joints = mc.ls(type='joint', l=True)
-        unfreezed = []
-        if mode == 'rotation':
-            for joint in joints:
-                if not [0.0, 0.0, 0.0] == mc.xform(joint, q=True, ws=False, ro=True):
-                    unfreezed.append(joint)
-        elif mode == 'orientation':
-            for joint in joints:
-                if not (0.0, 0.0, 0.0) == mc.getAttr(joint + '.jointOrient')[0]:
-                    unfreezed.append(joint)
+        unfreezed = JointAudit.from_joints().unfrozen_joints(mode)
         mc.select(unfreezed, r=True)
         return unfreezed
 
@@ -406,57 +391,21 @@ class HTM_ReinitializeSkinnedJoint:
     @undo_ctx
     def reinitialize(cls):
         """ Set current joint toransformation as BindPose
+            接続の取得、行列の計算、書き込みはHTM_ReinitializeSkinnedJointコマンドでまとめて行う
         """
         selected = mc.ls(sl=True, type='joint', l=1)
-        childlen = mc.listRelatives(ad=True, type='joint', f=1)
-        parents = mc.listRelatives(p=True, type='joint', f=1)
-
-        joints = []
-        joints += selected
-        joints += childlen if childlen else []
-        joints += parents if parents else []
-
         if not selected:
             om2.MGlobal.displayError(u'ジョイントを選択して実行してください')
             return
 
-        for j in joints:
-            # get all skin cluster connecting to the joint
-            sc_temp_list = mc.listConnections('{}.worldMatrix'.format(j), d=True, p=True, type='skinCluster')
-            if not sc_temp_list:
-                continue
-
-            # get joint's matrix
-            mtx_ws = mc.getAttr('{}.worldMatrix'.format(j))
-            mtx_os = mc.xform(j, q=1, os=1, m=1)
-            mtx_inv = mc.getAttr('{}.worldInverseMatrix'.format(j))
-
-            # process per joints
-            mc.setAttr('{}.bindPose'.format(j), mtx_ws, type='matrix')
-
-            # bind pose info
-            plugs = mc.listConnections(j, d=True, p=True, type = 'dagPose')
-            dagpose = mc.listConnections(f'{j}.message', type='dagPose')
-            if len(dagpose) == 0:
-                continue
-            elif len(dagpose) > 1:
-                om2.MGlobal.displayError(u'複数バインドポーズには対応していません')
-                return
-
-            plug_id = int(plugs[0].split('[')[-1][:-1])
-
-            # バインドポーズのリセット
-            # dagPoseが一つしかない前提で処理
-            mc.setAttr('{}.xformMatrix[{}]'.format(dagpose[0], plug_id), mtx_os, type='matrix')
-
-            for sc_temp in sc_temp_list:
-                # skin cluster info
-                sc = sc_temp.split('.')[0]
-                sc_plug_id = int(sc_temp.split('[')[-1][:-1])
+        childlen = mc.listRelatives(selected, ad=True, type='joint', f=1)
+        parents = mc.listRelatives(selected, p=True, type='joint', f=1)
 
-                # reset initial position
-                mc.setAttr('{}.bindPreMatrix[{}]'.format(sc, sc_plug_id), mtx_inv, type='matrix')
+        # 重複を取り除く、順番は維持
+        joints = list(dict.fromkeys(selected + (childlen or []) + (parents or [])))
 
+        load_plugin('HTM_ReinitializeSkinnedJoint')
+        mc.HTM_ReinitializeSkinnedJoint(joints)
         mc.select(selected, r=1)
 
     @classmethod
@@ -481,273 +430,298 @@ class HTM_ReinitializeSkinnedJoint:
 class HTM_RecreateBindPose:
     @classmethod
     def get_all_root_joints(cls):
-        # ルートジョイント取得用再帰関数
-        def get_root_joint(joint, processed):
-            parent_temp = mc.listRelatives(joint, p=True, type='joint', f=True)
-            if parent_temp == None:
-                return joint
-
-            processed.append(parent_temp[0])
-            return get_root_joint(parent_temp[0], processed)
-
+        """ 選択しているジョイントのルートジョイントを重複なしで取得
+        """
         joints = mc.ls(sl=True, type='joint', l=True)
         if not joints:
             om2.MGlobal.displayError(u'ジョイントの最低1つは選択して実行してください')
+            return []
 
-        processed = []
-        root_joints = []
-        for j in joints:
-            if j in processed:
-                continue
-            root_joints.append(get_root_joint(j, processed))
-
-        # 一回セットにして重複を取り除いて返す
-        return list(set(root_joints))
+        hierarchy = get_joint_hierarchy()
+        return hierarchy.names(hierarchy.roots(hierarchy.indices(joints)))
 
     @classmethod
     def recreate_bind_pose(cls):
         roots = cls.get_all_root_joints()
 
         for root in roots:
-            childlen = mc.listRelatives(root, ad=True, type='joint', f=1)
-            dagpose = mc.listConnections(root, type='dagPose')
-            dagpose = list(set(dagpose))
+            dagpose = list(set(mc.listConnections(root, type='dagPose') or []))
 
             # dagPoseノードの削除と作り直し
-            mc.delete(dagpose)
+            if dagpose:
+                mc.delete(dagpose)
             mc.dagPose(root, bp=True, save=True)
 
 
 class HTM_DeleteHistoryWithoutSC:
     @classmethod
-    def get_sc(cls, obj_name_str):
-        sc = mc.ls(mc.listHistory(obj_name_str, pdo=True), type='skinCluster')[0]
-        sel_sc = om2.MGlobal.getSelectionListByName(sc)
-        mo_sc= sel_sc.getDependNode(0)
-        fn_sc = oma2.MFnSkinCluster(mo_sc)
-        return sc, fn_sc
-
-    @classmethod
-    @undo_ctx
-    def del_history_without_sc(cls):
-        sel = om2.MGlobal.getActiveSelectionList()
-        it_sel = om2.MItSelectionList(sel)
-        selection = mc.ls(sl=True)
-
-        for it_s in it_sel:
-            dag, comp = it_s.getComponent()
+    def get_skinned_meshes(cls, sel):
+        """ 選択からスキンクラスターが付いているメッシュのシェイプを取得
+        """
+        shapes = []
+        for i in range(sel.length()):
+            try:
+                dag = sel.getDagPath(i)
+            except TypeError:
+                continue
 
             # トランスフォームノード以外が選択されていたらスルー
             # シェイプがない場合もスルー
             if not dag.hasFn(om2.MFn.kTransform):
                 continue
-
-            fn_trans = om2.MFnTransform(dag)
-            has_shape = False
-            for i in range(fn_trans.childCount()):
-                child = fn_trans.child(i)
-                if child.hasFn(om2.MFn.kMesh):
-                    has_shape = True
-            if not has_shape:
+            try:
+                dag.extendToShape()
+            except RuntimeError:
+                continue
+            if not dag.hasFn(om2.MFn.kMesh):
                 continue
 
-            # シェイプの取得
-            dp_shape = dag.extendToShape()
-            obj_name_str = dag.fullPathName()
-
-            # スキンクラスター関連情報取得
-            sc, fn_sc = cls.get_sc(obj_name_str)
-
-            infs = mc.skinCluster(sc, q=True, inf=True)
-            max_inf = mc.getAttr(sc + '.maxInfluences')
-            normalize_weights = mc.getAttr(sc + '.normalizeWeights')
-            maintain_max_inf = mc.getAttr(sc + '.maintainMaxInfluences')
+            shape = dag.fullPathName()
+            if get_skin_cluster(shape)[0] is None:
+                om2.MGlobal.displayWarning(u'{} にスキンクラスターがありません'.format(shape))
+                continue
+            if shape not in shapes:
+                shapes.append(shape)
 
-            # ウェイト保存
-            weights, num_inf = fn_sc.getWeights(dp_shape, comp)
+        return shapes
 
-            # ヒストリ削除
-            mc.skinCluster(obj_name_str, e=True, ub=True)
-            mc.delete(obj_name_str, ch=True)
-            mc.skinCluster(obj_name_str, infs, tsb=True, mi=max_inf,
-                           omi=maintain_max_inf, nw=normalize_weights)
+    @classmethod
+    @undo_ctx
+    def del_history_without_sc(cls):
+        """ 選択した全メッシュのヒストリをスキンクラスターを残したまま削除する
+            ウェイトは疎な形式で保存し、再バインド後にインフルエンス名で対応付けて戻す
+        """
+        sel = om2.MGlobal.getActiveSelectionList()
+        shapes = cls.get_skinned_meshes(sel)
+        if not shapes:
+            om2.MGlobal.displayError(u'スキンクラスターが付いたメッシュを選択して実行してください')
+            return
 
-            # バインド情報復旧
-            _, fn_sc_new = cls.get_sc(obj_name_str)
-            inf_ids = om2.MIntArray(range(num_inf))
-            fn_sc_new.setWeights(dp_shape, comp, inf_ids, weights)
+        timings = []
+        start = time.perf_counter()
+
+        # スキンクラスター関連情報とウェイトの保存
+        captured = []
+        for shape in shapes:
+            sc, fn_sc = get_skin_cluster(shape)
+            options = {'mi': mc.getAttr(sc + '.maxInfluences'),
+                       'omi': mc.getAttr(sc + '.maintainMaxInfluences'),
+                       'nw': mc.getAttr(sc + '.normalizeWeights')}
+            captured.append((shape, options, get_skin_weights(shape, fn_sc)))
+        timings.append((u'ウェイト保存', time.perf_counter() - start))
+
+        # ヒストリ削除、アンバインドしてからまとめて削除
+        start = time.perf_counter()
+        for shape, _, _ in captured:
+            mc.skinCluster(shape, e=True, ub=True)
+        mc.delete([shape for shape, _, _ in captured], ch=True)
+        timings.append((u'ヒストリ削除', time.perf_counter() - start))
+
+        # 再バインド
+        start = time.perf_counter()
+        for shape, options, weights in captured:
+            mc.skinCluster(shape, weights.influences, tsb=True, **options)
+        timings.append((u'再バインド', time.perf_counter() - start))
+
+        # バインド情報復旧、Undo/Redoでウェイトも戻るようにコマンド経由で書き込む
+        start = time.perf_counter()
+        load_plugin('HTM_SetSkinWeights')
+        for shape, _, weights in captured:
+            mapping = weights.remap(get_influences(get_skin_cluster(shape)[1]))
+            missing = [weights.influences[i] for i in np.unique(weights.indices) if mapping[i] < 0]
+            apply_skin_weights(shape, weights)
+            if missing:
+                om2.MGlobal.displayWarning(u'{}: インフルエンスが見つかりませんでした: {}'.format(
+                    shape, ', '.join(missing)))
+        timings.append((u'ウェイト復旧', time.perf_counter() - start))
+
+        total_bytes = sum(weights.nbytes for _, _, weights in captured)
+        print(u'// {} オブジェクトのヒストリを削除しました (ウェイト {:.2f} MB)'.format(
+            len(captured), total_bytes / (1024.0 * 1024.0)))
+        for name, elapsed in timings:
+            print(u'//   {}: {:.3f} 秒'.format(name, elapsed))
 
         om2.MGlobal.setActiveSelectionList(sel)
 
 
 class HTM_JointOrient:
+    """ ジョイントの方向付け、チェーン全体の位置をまとめて取得して全ジョイントの向きを一括で計算する
+    """
+    axis_table = {'x': 0, 'y': 1, 'z': 2}
+
     @staticmethod
-    def get_n_vector(joint_0, joint_1, joint_2):
-        """
-        Param:
-            pos_0: float list or MPoint list
-            pos_1: float list or MPoint list
-            pos_2: float list or MPoint list
+    def normalize(vectors):
+        """ (N,3)のベクトルを正規化、長さ0のベクトルは0のまま
         """
-        pos_0 = om2.MPoint(mc.xform(joint_0, q=True, ws=True, t=True))
-        pos_1 = om2.MPoint(mc.xform(joint_1, q=True, ws=True, t=True))
-        pos_2 = om2.MPoint(mc.xform(joint_2, q=True, ws=True, t=True))
+        length = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, length, out=np.zeros_like(vectors), where=length > 1e-12)
 
-        vector_0 = (pos_1 - pos_0).normal()
-        vector_1 = (pos_2 - pos_1).normal()
-
-        n_vector = (vector_0 ^ vector_1).normal()
-
-        return n_vector
+    @classmethod
+    def get_n_vectors(cls, pos_0, pos_1, pos_2):
+        """ 3点がなす平面の法線(曲げ方向の軸)
 
-    @staticmethod
-    def get_aim_vector(joint_0, joint_1):
-        """
         Param:
-            jiont_0(str): fullpath
-            jiont_1(str): fullpath
+            pos_0, pos_1, pos_2: (N,3)の位置
         """
-        pos_base = om2.MPoint(mc.xform(joint_0, q=True, ws=True, t=True))
-        pos_aim = om2.MPoint(mc.xform(joint_1, q=True, ws=True, t=True))
-        vec_aim = (pos_aim - pos_base).normal()
-        return vec_aim
-
-    @staticmethod
-    def aim_transform(joint, vec_aim, vec_sec,
-                      prm_axis='x', sec_axis='z', sec_target='y'):
-        """
-        """
-        vector_table = {'x' : om2.MVector(1, 0, 0),
-                        'y' : om2.MVector(0, 1, 0),
-                        'z' : om2.MVector(0, 0, 1),
-                        '-x': om2.MVector(1, 0, 0),
-                        '-y': om2.MVector(0, 1, 0),
-                        '-z': om2.MVector(0, 0, 1)}
-
-        pos = mc.xform(joint, q=True, ws=True, t=True)
+        return cls.normalize(np.cross(pos_1 - pos_0, pos_2 - pos_1))
 
-        # Secondary axis world orientation
-        sec_axis_target = vector_table[sec_target]
-        vec_temp = (vec_aim ^ sec_axis_target).normal()
-        if not vec_sec:
-            vec_sec = (vec_temp ^ vec_aim).normal()
+    @classmethod
+    def get_aim_vectors(cls, pos_base, pos_aim):
+        return cls.normalize(pos_aim - pos_base)
 
-        # Init primary/secondary base vecotr to calculate rotation.
-        vec_prm_base = vector_table[prm_axis]
-        vec_sec_base = vector_table[sec_axis]
+    @classmethod
+    def get_frames(cls, vec_aim, vec_sec, prm_axis='x', sec_axis='z'):
+        """ プライマリ軸がvec_aim、セカンダリ軸がvec_secを向く回転行列
 
-        # Get quaternion that can rotate "vec_prm_base" to "vec_aim".
-        quaternion_aim = om2.MQuaternion(vec_prm_base, vec_aim)
-        vec_sec_base = vec_sec_base.rotateBy(quaternion_aim)
+        Param:
+            vec_aim: (N,3)の正規化済みベクトル
+            vec_sec: (N,3)のvec_aimと直交する正規化済みベクトル
 
-        # Get quaternion about secondary vector
-        quaternion_sec = vec_sec_base.rotateTo(vec_sec)
+        Return:
+            np.ndarray: (N,3,3)の回転行列、Mayaと同じく行がそれぞれの軸のワールド方向
+        """
+        prm = cls.axis_table[prm_axis.strip('-')]
+        sec = cls.axis_table[sec_axis.strip('-')]
+        third = 3 - prm - sec
 
-        rot_mtx = om2.MMatrix()
-        if '-' in sec_target:
-            quaternion_inverse = om2.MQuaternion(math.radians(180), vec_aim)
-            rot_mtx = (quaternion_aim * quaternion_sec * quaternion_inverse).asMatrix()
-        else:
-            rot_mtx = (quaternion_aim * quaternion_sec).asMatrix()
+        frames = np.zeros((len(vec_aim), 3, 3))
+        frames[:, prm] = vec_aim
+        frames[:, sec] = vec_sec
+        frames[:, third] = np.cross(frames[:, (third + 1) % 3], frames[:, (third + 2) % 3])
+        return frames
 
-        parent_inv_mtx = om2.MMatrix(mc.getAttr(joint + '.parentInverseMatrix'))
-        matrix = rot_mtx * parent_inv_mtx
+    @staticmethod
+    def euler_xyz(matrices):
+        """ (N,3,3)の回転行列をXYZ順のオイラー角(度)に変換、ジョイントの方向は常にXYZ順
+        """
+        return np.degrees(matrices_to_euler(matrices))
 
-        mc.xform(joint, ws=False, m=matrix)
-        mc.xform(joint, ws=True, t=pos)
+    @classmethod
+    def get_secondary_vectors(cls, positions, vec_aim, parent, child, grandchild,
+                              bend_direction=False, sec_target='y'):
+        """ セカンダリ軸のワールド方向、vec_aimと直交させて返す
+            曲げ方向モードでは親、自身、子(チェーンの先頭は自身、子、孫)の平面の法線を使い
+            チェーンに沿って法線の向きが反転しないように揃える
 
+        Param:
+            positions: (N,3)のワールド位置
+            vec_aim: (N,3)のプライマリ軸の方向
+            parent, child, grandchild: (N,)の番号、無ければ-1
+        """
+        target = np.zeros(3)
+        target[cls.axis_table[sec_target.strip('-')]] = 1.0
+        vec_up = np.broadcast_to(target, vec_aim.shape)
+
+        # ワールド方向をプライマリ軸と直交させる
+        vec_world = cls.normalize(np.cross(np.cross(vec_aim, vec_up), vec_aim))
+        if not bend_direction:
+            return vec_world
+
+        has_parent = parent >= 0
+        has_child = child >= 0
+        p0 = np.where(has_parent[:, np.newaxis], positions[parent], positions)
+        p1 = np.where(has_parent[:, np.newaxis], positions, positions[child])
+        p2 = np.where(has_parent[:, np.newaxis], positions[child], positions[grandchild])
+        valid = has_child & (has_parent | (grandchild >= 0))
+        normals = np.where(valid[:, np.newaxis], cls.get_n_vectors(p0, p1, p2), 0.0)
+
+        # 親から順に、一直線で法線が求まらない場合は親の法線を引き継ぎ、逆向きなら反転する
+        depth = np.zeros(len(parent), dtype=np.int64)
+        for i in range(len(parent)):
+            if parent[i] >= 0:
+                depth[i] = depth[parent[i]] + 1
+        for d in range(1, int(depth.max()) + 1 if len(depth) else 0):
+            level = np.flatnonzero(depth == d)
+            parent_normals = normals[parent[level]]
+            missing = np.linalg.norm(normals[level], axis=1) < 1e-8
+            normals[level[missing]] = parent_normals[missing]
+            flip = np.einsum('ij,ij->i', normals[level], parent_normals) < 0.0
+            normals[level[flip]] *= -1.0
+
+        vec_sec = cls.normalize(normals - np.einsum('ij,ij->i', normals, vec_aim)[:, np.newaxis] * vec_aim)
+        missing = np.linalg.norm(vec_sec, axis=1) < 1e-8
+        vec_sec[missing] = vec_world[missing]
+        return vec_sec
 
     @classmethod
     @undo_ctx
     def joint_orient(cls, bend_direction=False,
                      prm_axis='x', sec_axis='z', sec_target='y'):
-        """
+        """ 選択ジョイント以下の階層の向きを、最初の子ジョイントに向ける
+            子が無いジョイントは親と同じ向きにする。ワールド位置はすべて維持する
+            ジョイント以外の子(メッシュ、ロケーター、グループなど)は元のワールド行列に戻すので
+            グループの下のジョイントも元の親の行列のまま計算できる
         """
         joints = mc.ls(sl=True, type='joint', l=True)
         if not joints:
             om2.MGlobal.displayError('Please select one ore more joints.')
             return
 
-        hierarchy = True
-        if hierarchy:
-            joints_child = mc.listRelatives(joints, ad=True, type='joint', f=True)
-            if joints_child:
-                joints_child.extend(joints)
-                joints_child.reverse()
-                joints = joints_child
-
-        joints_peak = []
-        for joint in joints:
-
-            vec_sec = None
-            if bend_direction:
-                # Bend direction mode
-                parent = mc.listRelatives(joint, p=True, f=True) or []
-                child  = mc.listRelatives(joint, c=True, f=True) or []
-
-                # if there's multiple child joint
-                """
-                if len(child) > 1:
-                    om2.MGlobal.displayWarning('"{}" skipped because of multiple child joints found.')
-                    continue
-                """
-
-                # if not child joint exists
-                if not len(child):
-                    joints_peak.append(joint)
-                    continue
-
-                # if not parent joint exists
-                elif not len(parent) or parent[0] not in joints:
-                    joint_0 = joint
-                    joint_1 = child[0]
-                    joint_2 = mc.listRelatives(child, c=True, f=True)[0]
-
-                    if not joint_2:
-                        # If there's less than two joints in the selection.
-                        mc.error('There\'s no enough number of joints.')
-
-                else:
-                    joint_0 = parent
-                    joint_1 = joint
-                    joint_2 = child[0]
-
-                # Get a vector of bend axis
-                vec_sec = cls.get_n_vector(joint_0, joint_1, joint_2)
-
-            else:
-                child = mc.listRelatives(joint, c=True, f=True)
-
-                # If multiple child joints were found.
-                #if len(child) > 1:
-                #    om2.MGlobal.displayWarning('"{}" skipped because of multiple child joints found.')
-                #    continue
-
-                # If no child joints were found.
-                if not child:
-                    joints_peak.append(joint)
-                    continue
-
-            # Restore child's pos/rot
-            child_rot = []
-            child_pos = []
-            for c in child:
-                child_rot.append(mc.xform(c, q=True, ws=True, ro=True))
-                child_pos.append(mc.xform(c, q=True, ws=True, t=True))
-
-            # Execute aim_transform
-            vec_aim = cls.get_aim_vector(joint, child[0])
-            cls.aim_transform(joint, vec_aim, vec_sec, prm_axis, sec_axis, sec_target)
-
-            # Reset child pos/rot
-            for c, rot, pos in zip(child, child_rot, child_pos):
-                mc.xform(c, ws=True, ro=rot)
-                mc.xform(c, ws=True,  t=pos)
-
-        # For peak joints
-        for joint in joints_peak:
-            mc.setAttr('%s.rotate' % joint, 0, 0, 0)
-            mc.setAttr('%s.jointOrient' % joint, 0, 0, 0)
+        hierarchy = get_joint_hierarchy()
+        ids = hierarchy.descendants(hierarchy.indices(joints))
+        names = hierarchy.names(ids)
+        num = len(ids)
+
+        # 処理対象の中での番号に振り直す、子孫はすべて対象に含まれる
+        local_of = np.full(len(hierarchy) + 1, -1, dtype=np.int64)
+        local_of[ids] = np.arange(num)
+        parent = local_of[hierarchy.parent[ids]]
+        has_child = hierarchy.child_ptr[ids + 1] > hierarchy.child_ptr[ids]
+        child = np.full(num, -1, dtype=np.int64)
+        child[has_child] = local_of[hierarchy.child_ids[hierarchy.child_ptr[ids[has_child]]]]
+        grandchild = np.where(has_child, child[np.maximum(child, 0)], -1)
+
+        # 行列はAPIでまとめて取得
+        sel = om2.MSelectionList()
+        for name in names:
+            sel.add(name)
+        dags = [sel.getDagPath(i) for i in range(num)]
+        world = np.array([list(dag.inclusiveMatrix()) for dag in dags]).reshape(-1, 4, 4)
+        parent_world = np.array([list(dag.exclusiveMatrix()) for dag in dags]).reshape(-1, 4, 4)
+        positions = world[:, 3, :3]
+        scales = np.linalg.norm(world[:, :3, :3], axis=2)
+
+        # ジョイント以外の子は書き込む前のワールド行列を保存しておく
+        children = mc.listRelatives(names, c=True, type='transform', f=True) or []
+        # エフェクター、コンストレイントもtransformの派生だが、接続で動くので戻さない
+        skipped = set(mc.ls(children, type=['joint', 'ikEffector', 'constraint'], l=True))
+        others = [node for node in dict.fromkeys(children) if node not in skipped]
+        others_world = [mc.xform(node, q=True, ws=True, m=True) for node in others]
+
+        # 全ジョイントの新しいワールドの向き
+        vec_aim = cls.get_aim_vectors(positions, np.where(has_child[:, np.newaxis],
+                                                          positions[child], positions))
+        vec_sec = cls.get_secondary_vectors(positions, vec_aim, parent, child, grandchild,
+                                            bend_direction, sec_target)
+        if '-' in sec_target:
+            vec_sec = -vec_sec
+        rotations = cls.get_frames(vec_aim, vec_sec, prm_axis, sec_axis)
+
+        # 子が無いジョイントは親の向き、親から順に決める
+        parent_rot = cls.normalize(parent_world[:, :3, :3].reshape(-1, 3)).reshape(-1, 3, 3)
+        for i in range(num):
+            if parent[i] >= 0:
+                parent_rot[i] = rotations[parent[i]]
+            if not has_child[i]:
+                rotations[i] = parent_rot[i]
+
+        # 親の新しいワールド行列で、ローカルの向きと移動値を求める
+        parent_mtx = parent_world[:, :3, :3].copy()
+        in_set = parent >= 0
+        parent_mtx[in_set] = scales[parent[in_set], :, np.newaxis] * rotations[parent[in_set]]
+        parent_pos = parent_world[:, 3, :3]
+
+        orients = cls.euler_xyz(np.matmul(rotations, np.transpose(parent_rot, (0, 2, 1))))
+        orients[~has_child] = 0.0
+        translates = np.einsum('ij,ijk->ik', positions - parent_pos, np.linalg.inv(parent_mtx))
+
+        for name, orient, translate in zip(names, orients.tolist(), translates.tolist()):
+            mc.setAttr(name + '.rotate', 0, 0, 0)
+            mc.setAttr(name + '.jointOrient', *orient)
+            mc.setAttr(name + '.translate', *translate)
+
+        for node, matrix in zip(others, others_world):
+            mc.xform(node, ws=True, m=matrix)
 
 
 def main():
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+""" スキンウェイトのバイナリファイルの書き出し、読み込み
+    deformerWeightsのXMLの代わり、CSR形式で頂点ごとのインフルエンス番号とウェイトを保存する
+    ファイルはメモリマップで開くので、必要な頂点の行だけ読み込める
+
+    ファイルの構成:
+        MAGIC(8byte) + ヘッダーのバイト数(uint32) + ヘッダー(JSON) + 各セクション(64byte境界)
+        ヘッダーにはインフルエンス名、頂点数、トポロジーのハッシュ、各セクションの位置と型を入れる
+        セクションはindptr、indices、weights、points(任意)、uvs(任意)、uv_valid(任意)
+"""
+import json
+import struct
+import hashlib
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import get_dag_path, get_points, get_vertex_uvs
+from HTM_Tools.HTM_RayBVH import nearest_point_ids
+from HTM_Tools.HTM_Util import undo_ctx, load_plugin
+from HTM_Tools.HTM_SkinWeightPayload import apply_skin_weights
+from HTM_Tools.HTM_SkinWeights import (SparseWeights, gather_rows, get_skin_cluster,
+                                       get_skin_weights, get_influences)
+
+
+MAGIC = b'HTMSKW\x00\x01'
+ALIGNMENT = 64
+IMPORT_METHODS = ('index', 'closest', 'uv')
+
+
+def topology_hash(fn_mesh):
+    """ フェースごとの頂点数と頂点IDからハッシュを作る、頂点IDで読み込めるかの判定用
+    """
+    counts, vertices = fn_mesh.getVertices()
+    h = hashlib.sha1()
+    h.update(np.asarray(counts, dtype=np.int32).tobytes())
+    h.update(np.asarray(vertices, dtype=np.int32).tobytes())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------
+# 書き出し、読み込み
+# ---------------------------------------------------------
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_weight_file(path, sparse, points=None, uvs=None, topology=None, options=None,
+                      weight_dtype=np.float16, uv_valid=None):
+    """ 疎なウェイトをファイルに書き出す
+
+    Args:
+        path(str): 書き出し先
+        sparse(SparseWeights): ウェイト
+        points(np.ndarray): (V,3)の頂点座標、最近接点での読み込みに使う
+        uvs(np.ndarray): (V,2)の頂点ごとのUV、UVでの読み込みに使う
+        uv_valid(np.ndarray): (V,)のUVがあるかどうか、UVの無い頂点はUVでの読み込みで対応付けない
+        topology(str): トポロジーのハッシュ
+        options(dict): スキンクラスターの設定など、そのままヘッダーに入れる
+        weight_dtype(type): ウェイトの型、np.float16かnp.float32
+    """
+    indptr, indices, weights = sparse.to_csr()
+    num_inf = len(sparse.influences)
+
+    # インフルエンス数、要素数に応じて最小の型にする
+    sections = [
+        ('indptr', indptr.astype(np.uint32 if indptr[-1] < (1 << 32) else np.uint64)),
+        ('indices', indices.astype(np.uint16 if num_inf < (1 << 16) else np.uint32)),
+        ('weights', weights.astype(weight_dtype)),
+    ]
+    if points is not None:
+        sections.append(('points', np.asarray(points, dtype=np.float32).reshape(-1, 3)))
+    if uvs is not None:
+        sections.append(('uvs', np.asarray(uvs, dtype=np.float32).reshape(-1, 2)))
+    if uv_valid is not None:
+        sections.append(('uv_valid', np.asarray(uv_valid, dtype=np.uint8)))
+
+    # セクションの位置はデータ領域の先頭からの相対位置
+    layout = {}
+    offset = 0
+    for name, array in sections:
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        'num_vertices': sparse.num_vertices,
+        'influences': sparse.influences,
+        'topology': topology,
+        'options': options or {},
+        'sections': layout,
+    }).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        data_start = _align(f.tell())
+        for name, array in sections:
+            f.write(b'\x00' * (data_start + layout[name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+class SkinWeightFile(object):
+    """ メモリマップで開いたウェイトファイル、各セクションは読み込み専用のnp.memmap
+
+    Example:
+        weight_file = SkinWeightFile(path)
+        sparse = weight_file.read_rows([0, 1, 2])
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if not f.read(len(MAGIC)) == MAGIC:
+                raise ValueError('Not a skin weight file: {}'.format(path))
+            header_size, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            data_start = _align(f.tell())
+
+        self.num_vertices = header['num_vertices']
+        self.influences = header['influences']
+        self.topology = header['topology']
+        self.options = header['options']
+
+        self.sections = {}
+        for name, info in header['sections'].items():
+            shape = tuple(info['shape'])
+            if not np.prod(shape):
+                self.sections[name] = np.zeros(shape, dtype=info['dtype'])
+                continue
+            self.sections[name] = np.memmap(path, dtype=info['dtype'], mode='r', shape=shape,
+                                            offset=data_start + info['offset'])
+
+    def get(self, name):
+        return self.sections.get(name)
+
+    def read_rows(self, rows, vertex_ids=None):
+        """ 指定した頂点の行だけ読み込む
+
+        Args:
+            rows(np.ndarray): (N,)のファイル側の頂点ID
+            vertex_ids(np.ndarray): (N,)の読み込み先での頂点ID、Noneならrowsと同じ
+
+        Returns:
+            SparseWeights: 頂点数はファイルの頂点数、vertex_idsを渡した場合はその最大値+1
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        owner, positions = gather_rows(self.sections['indptr'], rows)
+        if vertex_ids is None:
+            vertex_ids, num_vertices = rows, self.num_vertices
+        else:
+            vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+            num_vertices = int(vertex_ids.max()) + 1 if len(vertex_ids) else 0
+        return SparseWeights(num_vertices, self.influences, vertex_ids[owner],
+                             self.sections['indices'][positions],
+                             self.sections['weights'][positions])
+
+    def read_all(self):
+        return SparseWeights.from_csr(self.num_vertices, self.influences,
+                                      self.sections['indptr'],
+                                      np.asarray(self.sections['indices']),
+                                      np.asarray(self.sections['weights']))
+
+    def close(self):
+        # np.memmapは参照がなくなった時点で閉じられる
+        self.sections = {}
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def export_skin_weights(obj, path, weight_dtype=np.float16, uv_set=None):
+    """ スキンウェイトをファイルに書き出す
+
+    Args:
+        obj(str): スキンクラスターの付いたメッシュ
+        path(str): 書き出し先
+        weight_dtype(type): ウェイトの型、np.float16かnp.float32
+        uv_set(str): 保存するUVセット、Noneならカレント
+    """
+    sc, fn_sc = get_skin_cluster(obj)
+    if sc is None:
+        raise RuntimeError('{} has no skinCluster.'.format(obj))
+
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    options = {'mi': mc.getAttr(sc + '.maxInfluences'),
+               'omi': mc.getAttr(sc + '.maintainMaxInfluences'),
+               'nw': mc.getAttr(sc + '.normalizeWeights')}
+
+    uvs, valid = get_vertex_uvs(fn_mesh, uv_set)
+    write_weight_file(path, get_skin_weights(obj, fn_sc),
+                      points=get_points(fn_mesh, om2.MSpace.kWorld), uvs=uvs,
+                      topology=topology_hash(fn_mesh), options=options,
+                      weight_dtype=weight_dtype, uv_valid=valid)
+
+
+def _import_weights(weight_file, obj, method, vertex_ids, uv_set, bind):
+    """ import_skin_weights()の本体、見つからなかったインフルエンスを返す
+    """
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    shape = fn_mesh.fullPathName()
+    num_vertices = fn_mesh.numVertices
+    if vertex_ids is None:
+        vertex_ids = np.arange(num_vertices)
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+
+    sc, fn_sc = get_skin_cluster(shape)
+    if sc is None:
+        if not bind:
+            raise RuntimeError('{} has no skinCluster.'.format(obj))
+        existing = [inf for inf in weight_file.influences if mc.objExists(inf)]
+        mc.skinCluster(shape, existing, tsb=True, **weight_file.options)
+        sc, fn_sc = get_skin_cluster(shape)
+
+    if method == 'index':
+        if not weight_file.num_vertices == num_vertices:
+            raise ValueError('Vertex count does not match: {} / {}'.format(
+                weight_file.num_vertices, num_vertices))
+        if not weight_file.topology == topology_hash(fn_mesh):
+            om2.MGlobal.displayWarning(u'{}: トポロジーが書き出し時と異なります'.format(obj))
+        rows = vertex_ids
+
+    elif method == 'closest':
+        points = get_points(fn_mesh, om2.MSpace.kWorld)[vertex_ids]
+        rows, _ = nearest_point_ids(np.asarray(weight_file.get('points'), dtype=np.float64),
+                                    points)
+
+    else:
+        uvs, valid = get_vertex_uvs(fn_mesh, uv_set)
+        vertex_ids = vertex_ids[valid[vertex_ids]]
+        src_uvs = np.asarray(weight_file.get('uvs'), dtype=np.float64)
+
+        # UVの無い頂点は(0,0)で保存されているので対応付けの候補から除く
+        src_valid = weight_file.get('uv_valid')
+        src_rows = (np.arange(len(src_uvs)) if src_valid is None else
+                    np.flatnonzero(np.asarray(src_valid)))
+        if not len(src_rows):
+            raise ValueError('{} has no uvs.'.format(weight_file.path))
+        src_uvs = src_uvs[src_rows]
+        nearest, _ = nearest_point_ids(np.column_stack([src_uvs, np.zeros(len(src_uvs))]),
+                                       np.column_stack([uvs[vertex_ids],
+                                                        np.zeros(len(vertex_ids))]))
+        rows = src_rows[nearest]
+
+    sparse = weight_file.read_rows(rows, vertex_ids).normalize()
+    sparse.num_vertices = num_vertices
+
+    mapping = sparse.remap(get_influences(fn_sc))
+    missing = [sparse.influences[i] for i in np.unique(sparse.indices) if mapping[i] < 0]
+    apply_skin_weights(shape, sparse, vertex_ids)
+    return missing
+
+
+def import_skin_weights(obj, path, method='index', vertex_ids=None, uv_set=None, bind=True):
+    """ ファイルからスキンウェイトを読み込む
+        ウェイトはHTM_SetSkinWeights経由で書き込むのでUndo可能、プラグインは読み込んでおく
+
+    Args:
+        obj(str): 読み込み先のメッシュ
+        path(str): ファイル
+        method(str): 'index'なら頂点ID、'closest'なら最も近い頂点、'uv'なら最も近いUVで対応付ける
+        vertex_ids(list[int]): 読み込む頂点、Noneなら全頂点
+        uv_set(str): 'uv'の時に使うUVセット、Noneならカレント
+        bind(bool): スキンクラスターが無い場合にファイルのインフルエンスでバインドする
+
+    Returns:
+        list[str]: 見つからなかったインフルエンス
+    """
+    assert method in IMPORT_METHODS, 'invalid method was passed.'
+    weight_file = SkinWeightFile(path)
+    try:
+        missing = _import_weights(weight_file, obj, method, vertex_ids, uv_set, bind)
+    finally:
+        weight_file.close()
+
+    if missing:
+        om2.MGlobal.displayWarning(u'{}: インフルエンスが見つかりませんでした: {}'.format(
+            obj, ', '.join(missing)))
+    return missing
+
+
+@undo_ctx
+def import_selection(path, method='index'):
+    """ 選択しているオブジェクトにまとめて読み込む、バインドも含めて1回でUndoできる
+    """
+    load_plugin('HTM_SetSkinWeights')
+    for obj in mc.ls(sl=True, tr=True):
+        import_skin_weights(obj, path, method)
+
+
+def main(mode='export', method='index'):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    file_filter = 'Skin Weights (*.skw)'
+    if mode == 'export':
+        result = mc.fileDialog2(fm=0, ff=file_filter)
+        if result:
+            export_skin_weights(sel[0], result[0])
+    else:
+        result = mc.fileDialog2(fm=1, ff=file_filter)
+        if result:
+            import_selection(result[0], method)
+
+
+if '__main__' == __name__:
+    main()
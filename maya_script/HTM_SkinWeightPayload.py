@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+""" HTM_SetSkinWeightsにウェイトを渡すためのプロセス内ストア
+    コマンドのフラグで大量の値を渡すと重いので、SparseWeightsはここに登録してハンドル文字列だけ渡す
+"""
+import itertools
+
+import numpy as np
+
+import maya.cmds as mc
+
+
+_payloads = {}
+_counter = itertools.count(1)
+
+
+class SkinWeightPayload(object):
+    """ スキンウェイトの編集内容
+
+    Attributes:
+        weights(SparseWeights): 設定するウェイト
+        vertex_ids(np.ndarray): (N,)の設定する頂点、Noneなら全頂点
+        normalize(bool): 設定時に正規化するかどうか
+        previous(SparseWeights): 設定する頂点の現在のウェイト、Undo用
+            既に読み込んでいる場合に渡すと、コマンド側で読み直さない
+    """
+    def __init__(self, weights, vertex_ids=None, normalize=False, previous=None):
+        self.weights = weights
+        self.vertex_ids = None if vertex_ids is None else np.unique(
+            np.asarray(vertex_ids, dtype=np.int64))
+        self.normalize = normalize
+        self.previous = previous
+
+
+def submit(weights, vertex_ids=None, normalize=False, previous=None):
+    """ ペイロードを登録してハンドルを返す
+
+    Returns:
+        str: コマンドの-payloadフラグに渡すハンドル
+    """
+    handle = 'HTM_SkinWeightPayload{}'.format(next(_counter))
+    _payloads[handle] = SkinWeightPayload(weights, vertex_ids, normalize, previous)
+    return handle
+
+
+def take(handle):
+    """ ペイロードを取り出してストアからは解放する
+    """
+    try:
+        return _payloads.pop(handle)
+    except KeyError:
+        raise KeyError('Skin weight payload "{}" was not found.'.format(handle))
+
+
+def release(handle):
+    _payloads.pop(handle, None)
+
+
+def apply_skin_weights(obj, weights, vertex_ids=None, normalize=False, previous=None):
+    """ HTM_SetSkinWeightsをペイロード経由で実行する、Undo可能
+
+    Args:
+        obj(str): 対象メッシュ
+        weights(SparseWeights): 設定するウェイト
+        vertex_ids(np.ndarray): 設定する頂点、Noneなら全頂点
+        normalize(bool): 設定時に正規化するかどうか
+        previous(SparseWeights): 設定する頂点の現在のウェイト、Noneならコマンド側で読み込む
+    """
+    handle = submit(weights, vertex_ids, normalize, previous)
+    try:
+        mc.HTM_SetSkinWeights(obj, payload=handle)
+    finally:
+        release(handle)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+""" スキンウェイトの問い合わせ
+    選択頂点にウェイトを持つインフルエンスの一覧(合計、最大ウェイト順)と
+    その逆の、あるインフルエンスにウェイトを持つ頂点の一覧を疎なキャッシュから返す
+    キャッシュはメッシュごとに頂点 -> インフルエンス(CSR)、インフルエンス -> 頂点(CSC)の索引を持ち
+    ペイントなどでウェイトが変わった頂点の行だけを読み直すので、繰り返しの問い合わせは配列の参照だけで済む
+"""
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import SceneCache, scene_callbacks
+from HTM_Tools.HTM_ArrayUtil import get_dag_path
+from HTM_Tools.HTM_SelectUtil import get_selection_weights
+from HTM_Tools.HTM_SkinWeights import (SparseWeights, gather_rows, get_skin_cluster,
+                                       get_skin_weights, add_weights_changed_callback)
+
+
+SORT_KEYS = ('total', 'max')
+
+
+# ---------------------------------------------------------
+# 疎なウェイトの索引
+# ---------------------------------------------------------
+class SparseWeightIndex(object):
+    """ 頂点 -> インフルエンス、インフルエンス -> 頂点の両方向から引ける疎なウェイト
+
+    Attributes:
+        num_vertices(int): メッシュの頂点数
+        influences(list[str]): インフルエンスのフルパス
+        indptr(np.ndarray): (V+1,)の頂点ごとの開始位置
+        indices(np.ndarray): インフルエンス番号
+        weights(np.ndarray): ウェイト
+    """
+    def __init__(self, sparse):
+        """
+        Args:
+            sparse(SparseWeights): ウェイト
+        """
+        self.num_vertices = sparse.num_vertices
+        self.influences = list(sparse.influences)
+        self.indptr, self.indices, self.weights = sparse.to_csr()
+        self._columns = None
+
+    def _get_columns(self):
+        """ インフルエンスごとの(開始位置, 頂点ID, ウェイト)、最初の逆引きの時に作る
+        """
+        if self._columns is None:
+            vertices = np.repeat(np.arange(self.num_vertices, dtype=np.int32), np.diff(self.indptr))
+
+            # 頂点ID順なので安定ソートでインフルエンスごとに頂点ID順になる
+            order = np.argsort(self.indices, kind='stable')
+            colptr = np.zeros(len(self.influences) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.influences)), out=colptr[1:])
+            self._columns = (colptr, vertices[order], self.weights[order])
+        return self._columns
+
+    def influence_id(self, influence):
+        """ インフルエンスのフルパスか名前から番号を求める、見つからない場合は-1
+        """
+        if influence in self.influences:
+            return self.influences.index(influence)
+        leaf = influence.split('|')[-1]
+        for i, path in enumerate(self.influences):
+            if path.split('|')[-1] == leaf:
+                return i
+        return -1
+
+    def rows(self, vertex_ids):
+        """ 指定した頂点の行だけの疎なウェイト、頂点IDは元のまま
+
+        Returns:
+            SparseWeights:
+        """
+        vertex_ids = np.unique(np.asarray(vertex_ids, dtype=np.int64))
+        owner, positions = gather_rows(self.indptr, vertex_ids)
+        return SparseWeights(self.num_vertices, self.influences, vertex_ids[owner],
+                             self.indices[positions], self.weights[positions])
+
+    def rank_influences(self, vertex_ids=None, sort_by='total', threshold=0.0):
+        """ 頂点にウェイトを持つインフルエンスを、ウェイトの合計か最大値の大きい順に並べる
+
+        Args:
+            vertex_ids(np.ndarray): 対象の頂点、Noneなら全頂点
+            sort_by(str): 'total'なら合計、'max'なら最大値の順
+            threshold(float): 最大値がこれ以下のインフルエンスは除く
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray: (K,)のインフルエンス番号、ウェイトの合計、最大値
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError('sort_by must be one of {}.'.format(SORT_KEYS))
+
+        if vertex_ids is None:
+            indices, weights = self.indices, self.weights
+        else:
+            _, positions = gather_rows(self.indptr, np.unique(np.asarray(vertex_ids, dtype=np.int64)))
+            indices, weights = self.indices[positions], self.weights[positions]
+
+        num_inf = len(self.influences)
+        totals = np.bincount(indices, weights, minlength=num_inf)
+        maxima = np.zeros(num_inf)
+        np.maximum.at(maxima, indices, weights)
+
+        ids = np.flatnonzero(maxima > threshold)
+        keys = totals[ids] if sort_by == 'total' else maxima[ids]
+        ids = ids[np.argsort(-keys, kind='stable')]
+        return ids, totals[ids], maxima[ids]
+
+    def influence_vertices(self, influence, threshold=0.0):
+        """ インフルエンスのウェイトがthresholdより大きい頂点
+
+        Args:
+            influence(int or str): インフルエンス番号かフルパス、名前
+
+        Returns:
+            np.ndarray, np.ndarray: (K,)の頂点ID順の頂点ID、ウェイト
+        """
+        inf_id = influence if isinstance(influence, (int, np.integer)) else self.influence_id(influence)
+        if inf_id < 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        colptr, vertices, weights = self._get_columns()
+        vertices = vertices[colptr[inf_id]:colptr[inf_id + 1]]
+        weights = weights[colptr[inf_id]:colptr[inf_id + 1]]
+        valid = weights > threshold
+        return vertices[valid], weights[valid]
+
+    def update_rows(self, vertex_ids, sparse):
+        """ 指定した頂点の行を読み直したウェイトで置き換える
+
+        Args:
+            vertex_ids(np.ndarray): 置き換える頂点
+            sparse(SparseWeights): 読み直したウェイト、インフルエンスの並びは同じ
+        """
+        is_row = np.zeros(self.num_vertices, dtype=np.bool_)
+        is_row[vertex_ids] = True
+
+        vertices = np.repeat(np.arange(self.num_vertices, dtype=np.int32), np.diff(self.indptr))
+        keep = ~is_row[vertices]
+        new = is_row[sparse.vertices]
+        merged = SparseWeights(self.num_vertices, self.influences,
+                               np.concatenate([vertices[keep], sparse.vertices[new]]),
+                               np.concatenate([self.indices[keep], sparse.indices[new]]),
+                               np.concatenate([self.weights[keep], sparse.weights[new]]))
+        self.indptr, self.indices, self.weights = merged.to_csr()
+        self._columns = None
+
+
+# ---------------------------------------------------------
+# Maya側の処理、キャッシュ
+# ---------------------------------------------------------
+class _CacheEntry(object):
+    """ メッシュ1つ分のキャッシュ
+
+    Attributes:
+        handle(MObjectHandle): スキンクラスター、削除されていないかの確認用
+        fn_sc(MFnSkinCluster): スキンクラスター
+        index(SparseWeightIndex): ウェイトの索引
+        dirty(set[int]): 読み直す必要のある頂点ID、Noneなら全体を作り直す
+        callback_id(int): スキンクラスターのアトリビュート変更のコールバック
+    """
+    def __init__(self, shape):
+        sc, self.fn_sc = get_skin_cluster(shape)
+        if sc is None:
+            raise RuntimeError('{} has no skinCluster.'.format(shape))
+
+        node = self.fn_sc.object()
+        self.handle = om2.MObjectHandle(node)
+        self.index = SparseWeightIndex(get_skin_weights(shape, self.fn_sc, threshold=0.0))
+        self.dirty = set()
+        self.callback_id = om2.MNodeMessage.addAttributeChangedCallback(
+            node, _attribute_changed, shape)
+
+
+def _release_entries(entries):
+    """ 破棄するキャッシュのスキンクラスターのコールバックを削除する
+    """
+    for entry in entries.values():
+        om2.MMessage.removeCallback(entry.callback_id)
+
+
+# {シェイプのフルパス: _CacheEntry}、シーンを開く前やインフルエンスの名前が変わった時に全て破棄する
+_cache = SceneCache(dict, [
+    om2.MDagMessage.addAllDagChangesCallback,
+    lambda func: om2.MNodeMessage.addNameChangedCallback(om2.MObject.kNullObj, func),
+] + scene_callbacks(om2.MSceneMessage.kBeforeOpen, om2.MSceneMessage.kBeforeNew),
+    release=_release_entries)
+
+invalidate = _cache.invalidate
+remove_callbacks = _cache.remove_callbacks
+
+
+def _weight_list_index(plug):
+    """ weightList[i]以下のプラグならiを返す、weightList全体や他のアトリビュートなら-1
+    """
+    while True:
+        if plug.isElement:
+            if om2.MFnAttribute(plug.attribute()).name == 'weightList':
+                return plug.logicalIndex()
+            plug = plug.array()
+        elif plug.isChild:
+            plug = plug.parent()
+        else:
+            return -1
+
+
+def _attribute_changed(msg, plug, other_plug, shape):
+    """ スキンクラスターのアトリビュート変更のコールバック
+        ウェイトが変わった頂点は読み直す対象にし、接続が変わった場合はインフルエンスが
+        変わっている可能性があるのでキャッシュごと破棄する
+    """
+    if msg & (om2.MNodeMessage.kConnectionMade | om2.MNodeMessage.kConnectionBroken):
+        mark_dirty(shape)
+        return
+    if not msg & om2.MNodeMessage.kAttributeSet:
+        return
+
+    name = om2.MFnAttribute(plug.attribute()).name
+    if name not in ('weightList', 'weights'):
+        return
+    vertex_id = _weight_list_index(plug)
+    if vertex_id >= 0:
+        mark_dirty(shape, [vertex_id])
+    else:
+        mark_dirty(shape)
+
+
+def mark_dirty(obj, vertex_ids=None):
+    """ 頂点のウェイトが変わったことを通知する、次の問い合わせでその行だけ読み直す
+
+    Args:
+        obj(str): メッシュ
+        vertex_ids(list[int]): 変わった頂点、Noneなら全頂点
+    """
+    caches = _cache.value
+    if not caches:
+        return
+    entry = caches.get(obj) or caches.get(get_dag_path(obj).fullPathName())
+    if entry is None:
+        return
+
+    # コールバックの中から呼ばれるので、ここではコールバックを削除せず次の問い合わせで作り直す
+    if vertex_ids is None or entry.dirty is None:
+        entry.dirty = None
+    else:
+        entry.dirty.update(np.asarray(vertex_ids, dtype=np.int64).tolist())
+
+
+def release(shape=None):
+    """ キャッシュを破棄する
+
+    Args:
+        shape(str): シェイプのフルパス、Noneなら全て
+    """
+    if shape is None:
+        _cache.invalidate()
+        return
+
+    entry = (_cache.value or {}).pop(shape, None)
+    if entry is not None:
+        om2.MMessage.removeCallback(entry.callback_id)
+
+
+def get_weight_index(obj):
+    """ キャッシュ済みのウェイトの索引を取得、変わった頂点の行だけ読み直す
+
+    Args:
+        obj(str): スキンクラスターの付いたメッシュ
+
+    Returns:
+        SparseWeightIndex:
+    """
+    add_weights_changed_callback(mark_dirty)
+    caches = _cache.get()
+    shape = get_dag_path(obj).fullPathName()
+    entry = caches.get(shape)
+    if entry is not None and (entry.dirty is None or not entry.handle.isAlive()):
+        release(shape)
+        entry = None
+
+    if entry is None:
+        entry = _CacheEntry(shape)
+        caches[shape] = entry
+    elif entry.dirty:
+        vertex_ids = np.array(sorted(entry.dirty), dtype=np.int64)
+        entry.dirty.clear()
+        entry.index.update_rows(vertex_ids, get_skin_weights(shape, entry.fn_sc, threshold=0.0,
+                                                             vertex_ids=vertex_ids))
+    return entry.index
+
+
+def _selected_vertices():
+    """ 選択からスキンクラスターの付いたメッシュごとの頂点ID
+
+    Returns:
+        list[tuple[str, np.ndarray]]: (シェイプのフルパス, 頂点IDかNone(全体))
+    """
+    result = []
+    for shape, weights in get_selection_weights():
+        if get_skin_cluster(shape)[0] is None:
+            continue
+        result.append((shape, None if weights is None else np.flatnonzero(weights > 0.0)))
+    return result
+
+
+def get_selection_skin_weights():
+    """ 選択頂点のスキンウェイトを疎な形式で取得
+
+    Returns:
+        list[tuple[str, SparseWeights]]: (シェイプのフルパス, 選択頂点の行だけのウェイト)
+    """
+    result = []
+    for shape, vertex_ids in _selected_vertices():
+        index = get_weight_index(shape)
+        if vertex_ids is None:
+            vertex_ids = np.arange(index.num_vertices)
+        result.append((shape, index.rows(vertex_ids)))
+    return result
+
+
+def rank_selection_influences(sort_by='total', threshold=0.0):
+    """ 選択頂点にウェイトを持つインフルエンスを、ウェイトの大きい順に取得
+        複数のメッシュを選択している場合は、インフルエンスごとに合計、最大値をまとめる
+
+    Args:
+        sort_by(str): 'total'なら合計、'max'なら最大値の順
+        threshold(float): 最大値がこれ以下のインフルエンスは除く
+
+    Returns:
+        list[tuple[str, float, float]]: (インフルエンスのフルパス, 合計, 最大値)
+    """
+    if sort_by not in SORT_KEYS:
+        raise ValueError('sort_by must be one of {}.'.format(SORT_KEYS))
+
+    ranking = {}
+    for shape, vertex_ids in _selected_vertices():
+        index = get_weight_index(shape)
+        for i, total, maximum in zip(*index.rank_influences(vertex_ids, sort_by, threshold)):
+            influence = index.influences[i]
+            prev_total, prev_max = ranking.get(influence, (0.0, 0.0))
+            ranking[influence] = (prev_total + float(total), max(prev_max, float(maximum)))
+
+    key = 0 if sort_by == 'total' else 1
+    return sorted(((inf, total, maximum) for inf, (total, maximum) in ranking.items()),
+                  key=lambda item: -item[1 + key])
+
+
+def get_influence_vertices(obj, influence, threshold=0.0):
+    """ インフルエンスのウェイトがthresholdより大きい頂点
+
+    Args:
+        obj(str): スキンクラスターの付いたメッシュ
+        influence(str): インフルエンス名
+
+    Returns:
+        np.ndarray, np.ndarray: (K,)の頂点ID、ウェイト
+    """
+    return get_weight_index(obj).influence_vertices(influence, threshold)
+
+
+def select_influence_vertices(influence, objs=None, threshold=0.0):
+    """ インフルエンスのウェイトがthresholdより大きい頂点を選択する
+
+    Args:
+        influence(str): インフルエンス名
+        objs(list[str]): 対象のメッシュ、Noneなら選択しているメッシュ
+        threshold(float): これ以下のウェイトの頂点は選択しない
+    """
+    shapes = [shape for shape, _ in _selected_vertices()] if objs is None else objs
+    sel = om2.MSelectionList()
+    for shape in shapes:
+        vertex_ids, _ = get_influence_vertices(shape, influence, threshold)
+        if not len(vertex_ids):
+            continue
+        fn_comp = om2.MFnSingleIndexedComponent()
+        comp = fn_comp.create(om2.MFn.kMeshVertComponent)
+        fn_comp.addElements(vertex_ids.tolist())
+        sel.add((get_dag_path(shape), comp))
+    om2.MGlobal.setActiveSelectionList(sel)
+
+
+def main():
+    for influence, total, maximum in rank_selection_influences():
+        print('{}: total {:.4f}, max {:.4f}'.format(influence, total, maximum))
+
+
+if '__main__' == __name__:
+    main()
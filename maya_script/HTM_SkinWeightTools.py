@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+""" スキンウェイトのスムース、刈り込み、インフルエンス数の制限、正規化
+    skinPercentで頂点ごとに処理せず、疎な形式(SparseWeights)のまま全頂点を一括で計算して
+    変更のあった頂点だけをHTM_SetSkinWeights経由でまとめて書き込むのでUndo可能
+    ソフト選択のウェイトがあればマスクとして使う
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import undo_ctx, load_plugin
+from HTM_Tools.HTM_ArrayUtil import get_dag_path, get_edges
+from HTM_Tools.HTM_SelectUtil import get_selection_weights
+from HTM_Tools.HTM_SkinWeights import (SparseWeights, gather_rows, get_skin_cluster,
+                                       get_skin_weights, get_influences)
+from HTM_Tools.HTM_SkinWeightPayload import apply_skin_weights
+
+
+# ---------------------------------------------------------
+# 疎なウェイトの処理
+# ---------------------------------------------------------
+def _select(sparse, mask):
+    return sparse.vertices[mask], sparse.indices[mask], sparse.weights[mask]
+
+
+def _take_rows(sparse, rows):
+    """ rowsの頂点の行だけを取り出す、頂点IDはrowsでの番号に振り直す
+    """
+    indptr, indices, weights = sparse.to_csr()
+    owner, positions = gather_rows(indptr, rows)
+    return SparseWeights(len(rows), sparse.influences, owner, indices[positions],
+                         weights[positions])
+
+
+def _replace_rows(sparse, rows, new):
+    """ rowsの頂点の行だけを新しい要素で置き換えたウェイトを作る
+
+    Args:
+        new(tuple[np.ndarray]): 置き換える(頂点ID, インフルエンス番号, ウェイト)
+    """
+    is_row = np.zeros(sparse.num_vertices, dtype=np.bool_)
+    is_row[rows] = True
+    keep = _select(sparse, ~is_row[sparse.vertices])
+    return SparseWeights(sparse.num_vertices, sparse.influences,
+                         *[np.concatenate(arrays) for arrays in zip(keep, new)])
+
+
+def smooth_weights(sparse, edges, iterations=1, strength=0.5, mask=None):
+    """ 隣接頂点のウェイトの平均に近づけるラプラシアンスムース
+        マスクが0の頂点の行は変わらないので、対象の頂点とその隣接頂点の行だけを取り出して計算する
+
+    Args:
+        sparse(SparseWeights): ウェイト
+        edges(np.ndarray): (E,2)のエッジ
+        iterations(int): 繰り返し回数
+        strength(float): 1回あたりに隣接頂点の平均に近づける割合
+        mask(np.ndarray): (V,)の頂点ごとの強さの倍率、Noneなら全頂点1.0
+
+    Returns:
+        SparseWeights: 合計は元の行の合計を保つ
+    """
+    num_vtx = sparse.num_vertices
+    factor = np.full(num_vtx, strength, dtype=np.float64)
+    if mask is not None:
+        factor *= np.asarray(mask, dtype=np.float64)
+
+    # 対象の頂点に向かう有向エッジだけ使う
+    dst = np.concatenate([edges[:, 0], edges[:, 1]]).astype(np.int64)
+    src = np.concatenate([edges[:, 1], edges[:, 0]]).astype(np.int64)
+    active = factor[dst] > 0.0
+    dst, src = dst[active], src[active]
+
+    degree = np.bincount(dst, minlength=num_vtx)
+    rows = np.flatnonzero(degree > 0)
+    if not len(rows):
+        return sparse
+    edge_factor = factor[dst] / degree[dst]
+
+    # 計算に必要な行だけの番号に振り直す
+    work = np.union1d(rows, src)
+    local_of = np.full(num_vtx, -1, dtype=np.int64)
+    local_of[work] = np.arange(len(work))
+    local = _take_rows(sparse, work)
+    l_dst, l_src, l_rows = local_of[dst], local_of[src], local_of[rows]
+    own_factor = 1.0 - factor[work]
+
+    for _ in range(iterations):
+        indptr, indices, weights = local.to_csr()
+
+        # 隣接頂点の行 * 強さ / 隣接数
+        owner, positions = gather_rows(indptr, l_src)
+        neighbor = (l_dst[owner], indices[positions], weights[positions] * edge_factor[owner])
+
+        # 自身の行 * (1 - 強さ)
+        owner, positions = gather_rows(indptr, l_rows)
+        own_vertices = l_rows[owner]
+        own = (own_vertices, indices[positions], weights[positions] * own_factor[own_vertices])
+
+        smoothed = SparseWeights.accumulate(
+            len(work), sparse.influences, *[np.concatenate(arrays) for arrays in zip(neighbor, own)])
+        local = _replace_rows(local, l_rows, (smoothed.vertices, smoothed.indices,
+                                              smoothed.weights))
+
+    smoothed = _take_rows(local, l_rows)
+    return _replace_rows(sparse, rows, (rows[smoothed.vertices], smoothed.indices,
+                                        smoothed.weights))
+
+
+def redistribute_locked(sparse, original, locked):
+    """ ロックされたインフルエンスのウェイトを元に戻し、残りのウェイトの合計が
+        1.0 - ロックされたウェイトの合計になるようにスケールする
+        ロックされていないウェイトが残っていない頂点は元の行のまま
+
+    Args:
+        sparse(SparseWeights): 処理後のウェイト
+        original(SparseWeights): 処理前のウェイト、インフルエンスの並びはsparseと同じ
+        locked(np.ndarray): (J,)のbool、インフルエンスごとのロック状態
+
+    Returns:
+        SparseWeights:
+    """
+    num_vtx = sparse.num_vertices
+    locked = np.asarray(locked, dtype=np.bool_)
+
+    orig_locked = locked[original.indices]
+    locked_sum = np.bincount(original.vertices[orig_locked], original.weights[orig_locked],
+                             minlength=num_vtx)
+    free = np.maximum(1.0 - locked_sum, 0.0)
+
+    new_free = ~locked[sparse.indices]
+    free_sum = np.bincount(sparse.vertices[new_free], sparse.weights[new_free],
+                           minlength=num_vtx)
+    scalable = free_sum > 0.0
+    scale = np.where(scalable, free / np.where(scalable, free_sum, 1.0), 0.0)
+
+    # ロックされたウェイトは元の値、それ以外はスケールした値、スケールできない頂点は元の行
+    unlocked = _select(sparse, new_free & scalable[sparse.vertices])
+    restored = _select(original, orig_locked | ~scalable[original.vertices])
+    vertices, indices, weights = [np.concatenate(arrays) for arrays in zip(restored, unlocked)]
+    weights = weights.astype(np.float64)
+    weights[len(restored[0]):] *= scale[unlocked[0]]
+
+    order = np.argsort(vertices, kind='stable')
+    return SparseWeights(num_vtx, sparse.influences, vertices[order], indices[order],
+                         weights[order])
+
+
+def blend_weights(original, processed, mask):
+    """ 頂点ごとにmaskの割合で処理前と処理後のウェイトを混ぜる
+
+    Args:
+        mask(np.ndarray): (V,)の処理後のウェイトの割合
+    """
+    mask = np.asarray(mask, dtype=np.float64)
+    return SparseWeights.accumulate(
+        original.num_vertices, original.influences,
+        np.concatenate([original.vertices, processed.vertices]),
+        np.concatenate([original.indices, processed.indices]),
+        np.concatenate([original.weights * (1.0 - mask[original.vertices]),
+                        processed.weights * mask[processed.vertices]]))
+
+
+def clean_weights(sparse, edges=None, iterations=0, strength=0.5, threshold=0.0,
+                  max_influences=None, normalize=True, locked=None, mask=None):
+    """ スムース -> 刈り込み -> インフルエンス数の制限 -> 正規化 をまとめて行う
+        マスクが0の頂点の行は変えない
+
+    Args:
+        sparse(SparseWeights): ウェイト
+        edges(np.ndarray): (E,2)のエッジ、スムースする場合に必要
+        iterations(int): スムースの繰り返し回数、0ならスムースしない
+        strength(float): スムースの強さ
+        threshold(float): これ以下のウェイトを捨てる
+        max_influences(int): 頂点ごとのインフルエンス数の上限、Noneなら制限しない
+        normalize(bool): 合計を1.0にする、lockedがある場合は常に正規化する
+        locked(np.ndarray): (J,)のbool、ロックされたインフルエンスは値を変えない
+        mask(np.ndarray): (V,)の頂点ごとの強さ、Noneなら全頂点1.0
+
+    Returns:
+        SparseWeights, np.ndarray: 処理後のウェイト、(N,)の変更した頂点ID
+    """
+    num_vtx = sparse.num_vertices
+    mask = np.ones(num_vtx) if mask is None else np.clip(np.asarray(mask, dtype=np.float64),
+                                                         0.0, 1.0)
+    vertex_ids = np.flatnonzero(mask > 0.0)
+    if locked is not None:
+        locked = np.asarray(locked, dtype=np.bool_)
+        if not locked.any():
+            locked = None
+
+    result = sparse
+    if iterations > 0:
+        result = smooth_weights(sparse, edges, iterations, strength, mask > 0.0)
+
+    # 以降は対象の頂点の行だけで計算する
+    original = _take_rows(sparse, vertex_ids)
+    result = _take_rows(result, vertex_ids)
+    sub_mask = mask[vertex_ids]
+
+    def cleanup(weights):
+        keep = None if locked is None else locked[weights.indices]
+        weights.prune(max_influences, threshold, keep)
+        if locked is not None:
+            return redistribute_locked(weights, original, locked)
+        return weights.normalize() if normalize else weights
+
+    result = cleanup(result)
+    if (sub_mask < 1.0).any():
+        # 混ぜるとインフルエンス数が増えることがあるので、もう一度制限する
+        result = cleanup(blend_weights(original, result, sub_mask))
+
+    result = _replace_rows(sparse, vertex_ids, (vertex_ids[result.vertices], result.indices,
+                                                result.weights))
+    return result, vertex_ids
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def get_locked_influences(fn_sc):
+    """ インフルエンスごとのロック状態(lockInfluenceWeights)を取得
+    """
+    locked = []
+    for inf in get_influences(fn_sc):
+        attr = inf + '.liw'
+        locked.append(bool(mc.getAttr(attr)) if mc.objExists(attr) else False)
+    return np.array(locked, dtype=np.bool_)
+
+
+def clean_skin_weights(obj, weights=None, iterations=0, strength=0.5, threshold=0.0,
+                       max_influences=None, normalize=True, respect_locks=True):
+    """ 1オブジェクトのスキンウェイトを処理して、対象の頂点だけ書き込む、Undo可能
+        対象の頂点と、スムースする場合はその隣接頂点の行だけを読み込む
+        スムースで変わるのは対象の頂点の行だけなので、繰り返し回数によらず隣接1リングで足りる
+
+    Args:
+        obj(str): スキンクラスターの付いたメッシュ
+        weights(np.ndarray): (V,)の頂点ごとの強さ、Noneなら全頂点
+        respect_locks(bool): ロックされたインフルエンスの値を変えない
+        その他はclean_weights()と同じ
+    """
+    sc, fn_sc = get_skin_cluster(obj)
+    if sc is None:
+        om2.MGlobal.displayWarning('{} has no skinCluster.'.format(obj))
+        return
+
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    edges = get_edges(fn_mesh) if iterations > 0 else None
+    locked = get_locked_influences(fn_sc) if respect_locks else None
+
+    read_ids = None
+    if weights is not None:
+        target = np.asarray(weights) > 0.0
+        if not target.any():
+            return
+        read_ids = np.flatnonzero(target)
+        if edges is not None:
+            ring = edges[target[edges[:, 0]] | target[edges[:, 1]]]
+            read_ids = np.union1d(read_ids, ring.ravel())
+
+    sparse = get_skin_weights(obj, fn_sc, threshold=0.0, vertex_ids=read_ids)
+    result, vertex_ids = clean_weights(sparse, edges, iterations, strength, threshold,
+                                       max_influences, normalize, locked, weights)
+    if len(vertex_ids):
+        apply_skin_weights(obj, result, vertex_ids, previous=sparse)
+
+
+@undo_ctx
+def clean_selection(iterations=0, strength=0.5, threshold=0.0, max_influences=None,
+                    normalize=True, respect_locks=True):
+    """ 選択しているオブジェクト、頂点のスキンウェイトを処理する、まとめて1回でUndoできる
+
+    Example:
+        clean_selection(iterations=3)
+        clean_selection(threshold=0.01, max_influences=4)
+    """
+    targets = get_selection_weights()
+    if not targets:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    load_plugin('HTM_SetSkinWeights')
+    for shape, weights in targets:
+        clean_skin_weights(shape, weights, iterations, strength, threshold, max_influences,
+                           normalize, respect_locks)
+
+
+def main():
+    clean_selection(iterations=1)
+
+
+if '__main__' == __name__:
+    main()
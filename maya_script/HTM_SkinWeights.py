@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+""" スキンウェイトを疎な形式(頂点ID, インフルエンス番号, ウェイト)で扱う
+    MFnSkinCluster.getWeights()の配列は頂点数×インフルエンス数の密な配列になるので
+    取得したらすぐにfloat32の疎な形式に変換して、密な配列は1オブジェクト分しか持たない
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as oma2
+
+from HTM_Tools.HTM_ArrayUtil import get_dag_path
+
+
+class SparseWeights(object):
+    """ 疎なスキンウェイト、頂点ID順に並べた三つ組で持つ
+
+    Attributes:
+        num_vertices(int): メッシュの頂点数
+        influences(list[str]): インフルエンスのフルパス
+        vertices(np.ndarray): (N,)のint32の頂点ID
+        indices(np.ndarray): (N,)のint32のインフルエンス番号、influencesのインデックス
+        weights(np.ndarray): (N,)のfloat32のウェイト
+    """
+    def __init__(self, num_vertices, influences, vertices, indices, weights):
+        self.num_vertices = int(num_vertices)
+        self.influences = list(influences)
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.int32)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+
+    @classmethod
+    def from_dense(cls, dense, influences, threshold=1e-6):
+        """ (V,J)の密な配列から作る、threshold以下のウェイトは捨てる
+        """
+        dense = np.asarray(dense).reshape(-1, len(influences))
+        vertices, indices = np.nonzero(dense > threshold)
+        return cls(len(dense), influences, vertices, indices, dense[vertices, indices])
+
+    @classmethod
+    def from_csr(cls, num_vertices, influences, indptr, indices, weights, rows=None):
+        """ CSR形式の行から作る
+
+        Args:
+            indptr(np.ndarray): (R+1,)の行ごとの開始位置
+            indices(np.ndarray): インフルエンス番号
+            weights(np.ndarray): ウェイト
+            rows(np.ndarray): (R,)の各行の頂点ID、Noneなら行番号がそのまま頂点ID
+        """
+        counts = np.diff(indptr)
+        vertices = np.repeat(np.arange(len(counts)) if rows is None else rows, counts)
+        return cls(num_vertices, influences, vertices, indices, weights)
+
+    @classmethod
+    def accumulate(cls, num_vertices, influences, vertices, indices, weights):
+        """ 同じ(頂点, インフルエンス)の値を合計して作る、要素は頂点ID、インフルエンス番号順に並ぶ
+        """
+        num_inf = max(len(influences), 1)
+        keys = np.asarray(vertices, dtype=np.int64) * num_inf + indices
+        if not len(keys):
+            return cls(num_vertices, influences, keys, keys, np.zeros(0))
+
+        order = np.argsort(keys)
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        weights = np.add.reduceat(np.asarray(weights, dtype=np.float64)[order], starts)
+        vertices, indices = np.divmod(keys[starts], num_inf)
+        return cls(num_vertices, influences, vertices, indices, weights)
+
+    @property
+    def nbytes(self):
+        return self.vertices.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    def to_csr(self):
+        """ CSR形式に変換、行は頂点ID
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray:
+                (V+1,)の行ごとの開始位置、インフルエンス番号、ウェイト
+        """
+        counts = np.bincount(self.vertices, minlength=self.num_vertices)
+        indptr = np.zeros(self.num_vertices + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        # 既に頂点ID順に並んでいる場合は並べ替えない
+        if (self.vertices[1:] >= self.vertices[:-1]).all():
+            return indptr, self.indices, self.weights
+        order = np.argsort(self.vertices, kind='stable')
+        return indptr, self.indices[order], self.weights[order]
+
+    def normalize(self):
+        """ 頂点ごとにウェイトの合計を1.0にする、合計が0の頂点はそのまま
+        """
+        totals = np.bincount(self.vertices, self.weights, minlength=self.num_vertices)
+        totals[totals == 0.0] = 1.0
+        self.weights = (self.weights / totals[self.vertices]).astype(np.float32)
+        return self
+
+    def prune(self, max_influences=None, threshold=0.0, keep=None):
+        """ threshold以下のウェイトを捨て、頂点ごとにウェイトの大きい順にmax_influences個だけ残す
+            正規化はしないので、必要ならnormalize()を続けて呼ぶ
+
+        Args:
+            keep(np.ndarray): (N,)のbool、Trueの要素は捨てずに優先して残す(ロックされたウェイトなど)
+        """
+        keep = np.zeros(len(self.weights), dtype=np.bool_) if keep is None else np.asarray(keep)
+        valid = keep | (self.weights > threshold)
+        vertices, indices, weights = self.vertices[valid], self.indices[valid], self.weights[valid]
+        keep = keep[valid]
+
+        counts = np.bincount(vertices, minlength=self.num_vertices)
+        if max_influences is not None and max_influences > 0 and counts.max() > max_influences:
+            # 上限を超えている頂点の要素だけ、頂点ごとにウェイトの降順に並べて順位で切る
+            over = np.flatnonzero(counts[vertices] > max_influences)
+            # lexsortは遅いので、頂点IDの整数部とウェイトの降順の小数部を合わせた1つのキーで並べる
+            # 優先する要素の小数部は0にして先頭に来るようにする
+            sub_weights = weights[over].astype(np.float64)
+            fraction = 1.0 - sub_weights / (sub_weights.max() * (1.0 + 1e-6))
+            fraction[keep[over]] = 0.0
+            order = over[np.argsort(vertices[over] + fraction)]
+            sorted_vertices = vertices[order]
+            first = np.flatnonzero(np.r_[True, sorted_vertices[1:] != sorted_vertices[:-1]])
+            rank = np.arange(len(order)) - np.repeat(first, np.diff(np.r_[first, len(order)]))
+
+            valid = np.ones(len(vertices), dtype=np.bool_)
+            valid[order[(rank >= max_influences) & ~keep[order]]] = False
+            vertices, indices, weights = vertices[valid], indices[valid], weights[valid]
+
+        self.vertices, self.indices, self.weights = vertices, indices, weights
+        return self
+
+    def blend(self, src_ids, factors):
+        """ 頂点ごとに複数の元の頂点の行を係数付きで足し合わせた、新しいウェイトを作る
+            三角形の重心座標での補間などに使う、密な配列は作らない
+
+        Args:
+            src_ids(np.ndarray): (N,K)の元の頂点ID、-1は無視する
+            factors(np.ndarray): (N,K)の係数
+
+        Returns:
+            SparseWeights: 頂点数N、インフルエンスの並びは自身と同じ
+        """
+        src_ids = np.asarray(src_ids, dtype=np.int64)
+        factors = np.asarray(factors, dtype=np.float32)
+        num, k = src_ids.shape
+
+        dst = np.repeat(np.arange(num, dtype=np.int64), k)
+        src, factors = src_ids.reshape(-1), factors.reshape(-1)
+        valid = (src >= 0) & (factors > 0.0)
+        dst, src, factors = dst[valid], src[valid], factors[valid]
+
+        indptr, indices, weights = self.to_csr()
+        owner, positions = gather_rows(indptr, src)
+        return SparseWeights.accumulate(num, self.influences, dst[owner], indices[positions],
+                                        weights[positions] * factors[owner])
+
+    def remap(self, influences):
+        """ 自身のインフルエンス番号を、別のインフルエンスの並びでの番号に変換する配列を作る
+
+        Args:
+            influences(list[str]): 変換先のインフルエンス名
+
+        Returns:
+            np.ndarray: (J,)の変換先の番号、見つからないインフルエンスは-1
+        """
+        return match_influences(self.influences, influences)
+
+    def to_dense(self, influences=None, dtype=np.float64):
+        """ 密な配列に戻す
+
+        Args:
+            influences(list[str]): 列の並び、Noneなら自身の並びのまま
+                                   名前で対応付けて、見つからないインフルエンスのウェイトは捨てる
+
+        Returns:
+            np.ndarray: (V,len(influences))
+        """
+        if influences is None:
+            influences = self.influences
+            columns = self.indices
+            valid = slice(None)
+        else:
+            columns = self.remap(influences)[self.indices]
+            valid = columns >= 0
+            columns = columns[valid]
+
+        dense = np.zeros((self.num_vertices, len(influences)), dtype=dtype)
+        dense[self.vertices[valid], columns] = self.weights[valid]
+        return dense
+
+
+def gather_rows(indptr, rows):
+    """ CSR形式の指定した行の要素の位置を求める、必要な行だけ読み込む用
+
+    Args:
+        indptr(np.ndarray): (R+1,)の行ごとの開始位置
+        rows(np.ndarray): (N,)の読み込む行
+
+    Returns:
+        np.ndarray, np.ndarray: (M,)の要素ごとのrowsでの番号、(M,)のindices, weightsでの位置
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = np.asarray(indptr[rows], dtype=np.int64)
+    counts = np.asarray(indptr[rows + 1], dtype=np.int64) - starts
+    owner = np.repeat(np.arange(len(rows)), counts)
+    positions = (np.repeat(starts, counts) + np.arange(counts.sum()) -
+                 np.repeat(np.cumsum(counts) - counts, counts))
+    return owner, positions
+
+
+def _leaf_name(name, strip_namespace=False):
+    leaf = name.split('|')[-1]
+    return leaf.split(':')[-1] if strip_namespace else leaf
+
+
+def match_influences(src, dst):
+    """ インフルエンス名の対応付け、フルパス、末尾の名前、ネームスペースを除いた名前の順に探す
+
+    Args:
+        src(list[str]): 元のインフルエンス名
+        dst(list[str]): 対応先のインフルエンス名
+
+    Returns:
+        np.ndarray: (len(src),)のdstでの番号、見つからない場合は-1
+    """
+    result = np.full(len(src), -1, dtype=np.int64)
+    for key in (lambda n: n,
+                lambda n: _leaf_name(n),
+                lambda n: _leaf_name(n, strip_namespace=True)):
+        table = {}
+        for i, name in enumerate(dst):
+            table.setdefault(key(name), i)
+
+        for i, name in enumerate(src):
+            if result[i] < 0:
+                result[i] = table.get(key(name), -1)
+
+    return result
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+# set_skin_weights()で書き込んだ後に呼ぶ関数、ウェイトのキャッシュを更新する用
+_weights_changed_callbacks = []
+
+
+def add_weights_changed_callback(func):
+    """ set_skin_weights()の後に呼ぶ関数を登録する
+
+    Args:
+        func(callable): func(obj, vertex_ids)、vertex_idsは書き込んだ頂点ID
+    """
+    if func not in _weights_changed_callbacks:
+        _weights_changed_callbacks.append(func)
+
+
+def get_skin_cluster(obj):
+    """ オブジェクトに接続されているスキンクラスターを取得
+
+    Returns:
+        str, MFnSkinCluster: スキンクラスター名、見つからない場合は(None, None)
+    """
+    scs = mc.ls(mc.listHistory(obj, pdo=True) or [], type='skinCluster')
+    if not scs:
+        return None, None
+
+    sel = om2.MGlobal.getSelectionListByName(scs[0])
+    return scs[0], oma2.MFnSkinCluster(sel.getDependNode(0))
+
+
+def get_influences(fn_sc):
+    """ インフルエンスのフルパスをgetWeights()の列の並びで取得
+    """
+    return [dag.fullPathName() for dag in fn_sc.influenceObjects()]
+
+
+def get_vertex_component(num_vertices):
+    """ 全頂点のコンポーネントを作る
+    """
+    fn_comp = om2.MFnSingleIndexedComponent()
+    comp = fn_comp.create(om2.MFn.kMeshVertComponent)
+    fn_comp.setCompleteData(num_vertices)
+    return comp
+
+
+def get_skin_weights(obj, fn_sc=None, threshold=1e-6, vertex_ids=None, chunk_size=1 << 22):
+    """ スキンウェイトを疎な形式で取得
+        getWeights()は密な配列を返すので、頂点数×インフルエンス数がchunk_sizeを超える場合は
+        頂点を分けて取得する
+
+    Args:
+        obj(str): メッシュ
+        fn_sc(MFnSkinCluster): スキンクラスター、Noneなら探す
+        threshold(float): これ以下のウェイトは捨てる
+        vertex_ids(np.ndarray): 取得する頂点、Noneなら全頂点
+        chunk_size(int): 1回のgetWeights()で取得する値の数の上限
+
+    Returns:
+        SparseWeights: 頂点数はメッシュの頂点数
+    """
+    if fn_sc is None:
+        _, fn_sc = get_skin_cluster(obj)
+
+    dag = get_dag_path(obj)
+    num_vertices = om2.MFnMesh(dag).numVertices
+    influences = get_influences(fn_sc)
+    num_inf = len(influences)
+
+    step = max(chunk_size // max(num_inf, 1), 1)
+    if vertex_ids is None and step >= num_vertices:
+        weights, _ = fn_sc.getWeights(dag, get_vertex_component(num_vertices))
+        return SparseWeights.from_dense(np.array(weights, dtype=np.float32), influences,
+                                        threshold)
+
+    if vertex_ids is None:
+        vertex_ids = np.arange(num_vertices)
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+
+    inf_ids = om2.MIntArray(list(range(num_inf)))
+    parts = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))]
+    for start in range(0, len(vertex_ids), step):
+        chunk = vertex_ids[start:start + step]
+        fn_comp = om2.MFnSingleIndexedComponent()
+        comp = fn_comp.create(om2.MFn.kMeshVertComponent)
+        fn_comp.addElements(chunk.tolist())
+
+        # getWeights()の行はコンポーネントの要素順(頂点ID順)になる
+        chunk = np.array(fn_comp.getElements(), dtype=np.int64)
+        dense = np.array(fn_sc.getWeights(dag, comp, inf_ids), dtype=np.float32)
+        part = SparseWeights.from_dense(dense, influences, threshold)
+        parts.append((chunk[part.vertices], part.indices, part.weights))
+
+    vertices, indices, weights = [np.concatenate(arrays) for arrays in zip(*parts)]
+    return SparseWeights(num_vertices, influences, vertices, indices, weights)
+
+
+def set_skin_weights(obj, sparse, fn_sc=None, normalize=False, vertex_ids=None,
+                     chunk_size=1 << 22):
+    """ 疎な形式のスキンウェイトを一括で設定する
+        インフルエンスは名前で対応付けるので、並びが変わっていても問題ない
+        setWeights()には密な配列を渡す必要があるので、頂点数×インフルエンス数がchunk_sizeを
+        超える場合だけ頂点を分けて設定する
+
+    Args:
+        obj(str): メッシュ
+        sparse(SparseWeights): 設定するウェイト
+        fn_sc(MFnSkinCluster): スキンクラスター、Noneなら探す
+        normalize(bool): 設定時に正規化するかどうか
+        vertex_ids(np.ndarray): 設定する頂点、Noneなら全頂点
+        chunk_size(int): 1回のsetWeights()で渡す値の数の上限
+
+    Returns:
+        list[str]: 対応するインフルエンスが見つからず、ウェイトを捨てたインフルエンス
+    """
+    if fn_sc is None:
+        _, fn_sc = get_skin_cluster(obj)
+
+    dag = get_dag_path(obj)
+    influences = get_influences(fn_sc)
+    num_inf = len(influences)
+    mapping = sparse.remap(influences)
+
+    if vertex_ids is None:
+        vertex_ids = np.arange(sparse.num_vertices)
+    vertex_ids = np.unique(np.asarray(vertex_ids, dtype=np.int64))
+
+    # 設定する頂点の中での行番号
+    row_of = np.full(sparse.num_vertices, -1, dtype=np.int64)
+    row_of[vertex_ids] = np.arange(len(vertex_ids))
+    rows = row_of[sparse.vertices]
+    columns = mapping[sparse.indices]
+    valid = (rows >= 0) & (columns >= 0)
+    rows, columns, weights = rows[valid], columns[valid], sparse.weights[valid]
+
+    order = np.argsort(rows, kind='stable')
+    rows, columns, weights = rows[order], columns[order], weights[order]
+
+    inf_ids = om2.MIntArray(list(range(num_inf)))
+    step = max(chunk_size // max(num_inf, 1), 1)
+    for start in range(0, len(vertex_ids), step):
+        end = min(start + step, len(vertex_ids))
+        lo, hi = np.searchsorted(rows, [start, end])
+
+        dense = np.zeros((end - start, num_inf), dtype=np.float64)
+        dense[rows[lo:hi] - start, columns[lo:hi]] = weights[lo:hi]
+
+        fn_comp = om2.MFnSingleIndexedComponent()
+        comp = fn_comp.create(om2.MFn.kMeshVertComponent)
+        fn_comp.addElements(vertex_ids[start:end].tolist())
+        fn_sc.setWeights(dag, comp, inf_ids, om2.MDoubleArray(dense.ravel().tolist()), normalize)
+
+    for func in _weights_changed_callbacks:
+        func(obj, vertex_ids)
+
+    used = np.unique(sparse.indices)
+    return [sparse.influences[i] for i in used if mapping[i] < 0]
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+""" テクスチャをフェース頂点のUVでサンプリングして頂点カラーに書き込む
+    ペイントツールのインポート(artAttrPaintVertexCtx -importfileload)の代わり
+"""
+import os
+import ctypes
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_dag_path, get_face_vertex_ids, get_face_vertex_colors,
+                                     get_face_vertex_uv_ids, get_uvs)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+
+
+# 読み込んだ画像のキャッシュ {パス: (更新時刻, 画像)}
+_image_cache = {}
+
+
+def read_image(path):
+    """ 画像(EXR/PNG/TGAなど)を読み込んで(H,W,4)のfloat32の配列にする
+        行0がV=0側、MImageのピクセルの並びのまま
+        ファイルが更新されていなければキャッシュを返す
+    """
+    mtime = os.path.getmtime(path)
+    cached = _image_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    image = om2.MImage()
+    image.readFromFile(path)
+    width, height = image.getSize()
+    num_values = width * height * 4
+
+    if image.pixelType() == om2.MImage.kFloat:
+        buf = (ctypes.c_float * num_values).from_address(image.floatPixels())
+        pixels = np.ctypeslib.as_array(buf).astype(np.float32)
+    else:
+        buf = (ctypes.c_ubyte * num_values).from_address(image.pixels())
+        pixels = np.ctypeslib.as_array(buf).astype(np.float32) * (1.0 / 255.0)
+
+    pixels = pixels.reshape(height, width, 4)
+    _image_cache[path] = (mtime, pixels)
+    return pixels
+
+
+def clear_cache():
+    _image_cache.clear()
+
+
+def bilinear_sample(image, uvs, wrap=True):
+    """ UV座標で画像をバイリニアサンプリング、全点まとめて処理する
+
+    Args:
+        image(np.ndarray): (H,W,C)の画像
+        uvs(np.ndarray): (N,2)のUV座標
+        wrap(bool): Trueなら0～1の範囲外をリピート、Falseなら端の値で埋める
+
+    Returns:
+        np.ndarray: (N,C)
+    """
+    height, width = image.shape[:2]
+
+    # ピクセル中心が整数になる座標系に変換
+    x = uvs[:, 0] * width - 0.5
+    y = uvs[:, 1] * height - 0.5
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0).astype(np.float32)[:, np.newaxis]
+    fy = (y - y0).astype(np.float32)[:, np.newaxis]
+
+    x0 = x0.astype(np.int64)
+    y0 = y0.astype(np.int64)
+    if wrap:
+        x1 = np.mod(x0 + 1, width)
+        y1 = np.mod(y0 + 1, height)
+        x0 = np.mod(x0, width)
+        y0 = np.mod(y0, height)
+    else:
+        x1 = np.clip(x0 + 1, 0, width - 1)
+        y1 = np.clip(y0 + 1, 0, height - 1)
+        x0 = np.clip(x0, 0, width - 1)
+        y0 = np.clip(y0, 0, height - 1)
+
+    top = image[y0, x0] * (1.0 - fx) + image[y0, x1] * fx
+    bottom = image[y1, x0] * (1.0 - fx) + image[y1, x1] * fx
+    return top * (1.0 - fy) + bottom * fy
+
+
+def average_per_vertex(colors, vertices, num_vertices):
+    """ 同じ頂点に属するフェース頂点のカラーを平均する、UVの継ぎ目の段差を消す用
+
+    Args:
+        colors(np.ndarray): (FV,C)のカラー
+        vertices(np.ndarray): (FV,)の頂点ID
+    """
+    counts = np.bincount(vertices, minlength=num_vertices).astype(np.float64)
+    counts[counts == 0] = 1.0
+    averaged = np.column_stack([np.bincount(vertices, colors[:, i], minlength=num_vertices)
+                                for i in range(colors.shape[1])]) / counts[:, np.newaxis]
+    return averaged[vertices].astype(colors.dtype)
+
+
+def sample_face_vertex_colors(fn_mesh, image, uv_set=None, average_seams=False):
+    """ フェース頂点ごとのUVで画像をサンプリング
+
+    Args:
+        fn_mesh(MFnMesh):
+        image(np.ndarray): (H,W,4)の画像
+        uv_set(str): UVセット名、Noneならカレント
+        average_seams(bool): 頂点ごとに平均して継ぎ目をなくす
+
+    Returns:
+        np.ndarray, np.ndarray: (FV,4)のカラー、(FV,)のUVがあるかどうか
+    """
+    fv_uv_ids = get_face_vertex_uv_ids(fn_mesh, uv_set)
+    uvs = get_uvs(fn_mesh, uv_set)
+    has_uv = fv_uv_ids >= 0
+
+    colors = np.zeros((len(fv_uv_ids), 4), dtype=np.float32)
+    colors[has_uv] = bilinear_sample(image, uvs[fv_uv_ids[has_uv]])
+
+    if average_seams:
+        _, vertices = get_face_vertex_ids(fn_mesh)
+        vertices = vertices[has_uv]
+        colors[has_uv] = average_per_vertex(colors[has_uv], vertices, fn_mesh.numVertices)
+
+    return colors, has_uv
+
+
+def texture_to_vertex_colors(obj, path, uv_set=None, average_seams=False, channel='rgba'):
+    """ テクスチャを頂点カラーとして読み込む、Undo可能
+
+    Args:
+        obj(str): 対象オブジェクト
+        path(str): 画像のパス
+        uv_set(str): サンプリングに使うUVセット、Noneならカレント
+        average_seams(bool): UVの継ぎ目で頂点ごとに平均する
+        channel(str): 書き込むチャンネル
+    """
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    image = read_image(path)
+    colors, has_uv = sample_face_vertex_colors(fn_mesh, image, uv_set, average_seams)
+
+    # UVが無いフェース頂点は元のカラーのまま
+    if not has_uv.all():
+        colors_orig = get_face_vertex_colors(fn_mesh)
+        colors[~has_uv] = colors_orig[~has_uv]
+
+    set_face_vertex_colors(fn_mesh.fullPathName(), colors, channel=channel)
+
+
+def main(path=None, uv_set=None, average_seams=False):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    if path is None:
+        result = mc.fileDialog2(fm=1, ff='Image Files (*.exr *.png *.tga *.tif *.jpg)')
+        if not result:
+            return
+        path = result[0]
+
+    for obj in sel:
+        texture_to_vertex_colors(obj, path, uv_set, average_seams)
+
+
+if '__main__' == __name__:
+    main()
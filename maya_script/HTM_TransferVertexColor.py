@@ -1,11 +1,18 @@
 import math
 
+import numpy as np
+
 import maya.api.OpenMaya as om2
 import maya.cmds as mc
 
 from PySide2.QtWidgets import QMainWindow, QPushButton, QVBoxLayout, QWidget
 from maya.app.general.mayaMixin import MayaQWidgetBaseMixin
 
+from HTM_Tools.HTM_ArrayUtil import get_points, get_edges, from_color_array, to_color_array
+from HTM_Tools.HTM_HarmonicFill import harmonic_fill
+from HTM_Tools.HTM_RayBVH import MeshProjector
+from HTM_Tools.HTM_VertexAO import get_vertex_normals
+
 
 class CustomUI(MayaQWidgetBaseMixin, QMainWindow):
     def __init__(self, parent=None):
@@ -22,6 +29,11 @@ class CustomUI(MayaQWidgetBaseMixin, QMainWindow):
         self.button1.clicked.connect(self.print_button1)
         self.layout.addWidget(self.button1)
 
+        # 法線方向に投影して転送
+        self.button3 = QPushButton('頂点カラーを転送する (法線方向に投影)')
+        self.button3.clicked.connect(lambda: transfer_vertex_color(mode='projection'))
+        self.layout.addWidget(self.button3)
+
         # ボタン2の作成と接続
         self.button2 = QPushButton('カラーセット1の削除')
         self.button2.clicked.connect(self.print_button2)
@@ -94,8 +106,42 @@ def get_vertex_pos_weight(base_point, points):
 
 
 
-def transfer_vertex_color():
+def transfer_vertex_color_projection(fn_mesh_src, fn_mesh_dst, max_distance=np.inf,
+                                     cull_backface=True, fill=False):
+    u""" 転送先の各頂点から法線の正負方向に転送元へレイを飛ばし、ヒットした位置のカラーを補間する
+        ミスした頂点は最近接点で補う
+    param:
+        fn_mesh_src(MFnMesh): 転送元
+        fn_mesh_dst(MFnMesh): 転送先
+        max_distance(float): 投影する最大距離
+        cull_backface(bool): 転送先の法線と逆を向いている転送元の面を無視する
+        fill(bool): ミスした頂点を最近接点ではなく、周りのヒットした頂点のカラーから補間する
+    """
+    colors_src = from_color_array(fn_mesh_src.getVertexColors())
+    colors_src[colors_src[:, 0] < 0.0] = (0.0, 0.0, 0.0, 1.0) # 未設定のカラー
+
+    points = get_points(fn_mesh_dst, om2.MSpace.kWorld)
+    normals = get_vertex_normals(fn_mesh_dst)
+
+    projector = MeshProjector(fn_mesh_src.fullPathName())
+    vertex_ids, weights = projector.project(points, normals, max_distance, cull_backface,
+                                            fallback=not fill)
+
+    hit = vertex_ids[:, 0] >= 0
+    new_colors = np.zeros((len(points), 4))
+    new_colors[hit] = (colors_src[vertex_ids[hit]] * weights[hit, :, np.newaxis]).sum(axis=1)
+    if not hit.all():
+        new_colors = harmonic_fill(new_colors, hit, get_edges(fn_mesh_dst))
+
+    fn_mesh_dst.setVertexColors(to_color_array(new_colors), list(range(len(points))))
+
+
+def transfer_vertex_color(mode='closest', max_distance=np.inf, fill=True):
     u""" 頂点カラー転送
+    param:
+        mode(str): 'closest'なら最近接点、'projection'なら転送先の法線方向に投影
+        max_distance(float): 'projection'の時の最大距離
+        fill(bool): 転送に失敗した頂点を、周りの頂点のカラーから補間して埋める
     """
     sel = om2.MGlobal.getActiveSelectionList()
 
@@ -103,6 +149,12 @@ def transfer_vertex_color():
         om2.MGlobal.displayError(u'転送元・転送先となるオブジェクトを選択して実行してください')
         return
 
+    if mode == 'projection':
+        transfer_vertex_color_projection(om2.MFnMesh(sel.getDagPath(0)),
+                                         om2.MFnMesh(sel.getDagPath(1)), max_distance,
+                                         fill=fill and max_distance < np.inf)
+        return
+
     # ------------------------------------
     # 転送元
     dag_src = sel.getDagPath(0)
@@ -140,6 +192,7 @@ def transfer_vertex_color():
     # 交差判定取って頂点カラーを転送する処理
     index = 0
     new_colors = []
+    failed = []
     for pos, nrm in zip(vtxs_pos_dst, vtxs_nrm_dst):
         # 一旦最短距離の点を取ってきて、そこへ向けたベクトルで交差を取る
         closest_pos, face_id = fn_mesh_src.getClosestPoint(pos, om2.MSpace.kWorld)
@@ -158,6 +211,7 @@ def transfer_vertex_color():
                 not_found = False
                 break
         else:
+            failed.append(len(new_colors))
             new_colors.append(om2.MColor([0, 0, 0, 1]))
 
         #return
@@ -182,6 +236,12 @@ def transfer_vertex_color():
         """
 
     print(len(new_colors), len(vtxs_pos_dst))
+    if fill and failed:
+        colors = from_color_array(om2.MColorArray(new_colors))
+        known = np.ones(len(colors), dtype=np.bool_)
+        known[failed] = False
+        new_colors = to_color_array(harmonic_fill(colors, known, get_edges(fn_mesh_dst)))
+
     fn_mesh_dst.setVertexColors(new_colors, range(len(vtxs_pos_dst)))
 
 
@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
+import numpy as np
+
 import maya.cmds as cmds
 import maya.api.OpenMaya as om2
 from time import time
 
+from HTM_Tools.HTM_ArrayUtil import get_points
+from HTM_Tools.HTM_RayBVH import MeshProjector
+from HTM_Tools.HTM_VertexAO import get_vertex_normals
+
 
 kShort_flag_base_weight = '-bw'
 kLong_flag_base_weight = '-baseWeight'
+kShort_flag_mode = '-m'
+kLong_flag_mode = '-mode'
+kShort_flag_max_distance = '-md'
+kLong_flag_max_distance = '-maxDistance'
 
 
 def maya_useNewAPI():
@@ -18,6 +28,9 @@ class HTM_TransferVertexNormals(om2.MPxCommand):
     def __init__(self):
         om2.MPxCommand.__init__(self)
         self.sel = om2.MSelectionList # Undo用の対象メッシュ情報
+        self.base_weight = 1.0
+        self.mode = 'closest'
+        self.max_distance = np.inf
 
     @staticmethod
     def cmdCreator():
@@ -91,57 +104,68 @@ class HTM_TransferVertexNormals(om2.MPxCommand):
                 # ------------------------------------------------------------
                 # 転送処理
                 normal_edit = fn_mesh_dst.getVertexNormals(False, om2.MSpace.kWorld) # 編集用法線
-                new_normals = om2.MVectorArray()
-                new_vtxs = []
 
-                # コンポーネント選択かどうかで処理を分岐させる
+                # コンポーネント選択かどうかで対象頂点とウェイトを決める
                 if sel.hasComponents():
                     dst_fn_comp = om2.MFnSingleIndexedComponent(comp)
                     it_vtx = om2.MItMeshVertex(dag, comp)
-                    sel_comp = [vtx.index() for vtx in it_vtx]
+                    sel_comp = set(vtx.index() for vtx in it_vtx)
 
+                    new_vtxs = []
+                    weights = []
                     for j, vtx_id in enumerate(dst_fn_comp.getElements()):
                         if vtx_id not in sel_comp:
                             continue
 
                         if soft_sel_state == 1:
-                            if self.base_weight == 1.0:
-                                # ベースのウェイトが1.0ならself.base_weightをかける処理は省略できる
-                                weight = dst_fn_comp.weight(j).influence
-                            else:
-                                weight = dst_fn_comp.weight(j).influence * self.base_weight
+                            weight = dst_fn_comp.weight(j).influence * self.base_weight
                         else:
                             # ソフト選択がOFFなら各コンポーネントのウェイトを考えなくていい
                             weight = self.base_weight
-
-                        pos = fn_mesh_dst.getPoint(vtx_id, om2.MSpace.kWorld)
-                        temp = normal_edit[vtx_id] * (1.0 - weight) + weight *\
-                               om2.MFloatVector(fn_mesh_src.getClosestNormal(pos, om2.MSpace.kWorld)[0])
-                        new_normals.append(temp)
                         new_vtxs.append(vtx_id)
-
+                        weights.append(weight)
                 else:
                     # オブジェクト選択の場合
-                    points = fn_mesh_dst.getPoints(om2.MSpace.kWorld)
-
-                    if self.base_weight == 1.0:
-                        for j, pos in enumerate(points):
-                            temp = fn_mesh_src.getClosestNormal(pos, om2.MSpace.kWorld)[0]
-                            new_normals.append(temp)
-                            new_vtxs.append(j)
-                    else:
-                        for j, pos in enumerate(points):
-                            temp = normal_edit[j] * (1.0 - self.base_weight) + self.base_weight * \
-                                   om2.MFloatVector(fn_mesh_src.getClosestNormal(pos, om2.MSpace.kWorld)[0])
-                            new_normals.append(temp)
-                            new_vtxs.append(j)
-                            
+                    new_vtxs = list(range(num_vtx))
+                    weights = [self.base_weight] * num_vtx
+
+                src_normals = self.get_source_normals(fn_mesh_src, fn_mesh_dst, new_vtxs)
+
+                # 元の法線と転送元の法線をウェイトでブレンド
+                weights = np.array(weights, dtype=np.float64)[:, np.newaxis]
+                orig_normals = np.array(normal_edit, dtype=np.float64).reshape(-1, 3)[new_vtxs]
+                blended = orig_normals * (1.0 - weights) + src_normals * weights
+                new_normals = om2.MVectorArray(blended.tolist())
+
             # 法線転送
             fn_mesh_dst.setVertexNormals(new_normals, new_vtxs, om2.MSpace.kWorld)
 
             end = time()
             print(f'# HTM_TransferVertexNormals : {end - sta:.3f} sec')
 
+    def get_source_normals(self, fn_mesh_src, fn_mesh_dst, vtx_ids):
+        """ 転送先の頂点ごとに転送元の法線を求める
+
+        Returns:
+            np.ndarray: (N,3)のワールド法線
+        """
+        if self.mode == 'projection':
+            # 転送先の法線の正負方向にまとめてレイを飛ばし、ミスした頂点は最近接点で補う
+            points = get_points(fn_mesh_dst, om2.MSpace.kWorld)[vtx_ids]
+            normals = get_vertex_normals(fn_mesh_dst)[vtx_ids]
+            src_normals = get_vertex_normals(fn_mesh_src)
+
+            projector = MeshProjector(fn_mesh_src.fullPathName())
+            vertex_ids, weights = projector.project(points, normals, self.max_distance)
+            result = (src_normals[vertex_ids] * weights[:, :, np.newaxis]).sum(axis=1)
+            length = np.linalg.norm(result, axis=1)
+            length[length == 0.0] = 1.0
+            return result / length[:, np.newaxis]
+
+        points = fn_mesh_dst.getPoints(om2.MSpace.kWorld)
+        return np.array([fn_mesh_src.getClosestNormal(points[i], om2.MSpace.kWorld)[0]
+                         for i in vtx_ids], dtype=np.float64).reshape(-1, 3)
+
     def undoIt(self):
         it_sel = om2.MItSelectionList(self.sel)
 
@@ -170,6 +194,14 @@ class HTM_TransferVertexNormals(om2.MPxCommand):
         if arg_data.isFlagSet(kShort_flag_base_weight):
             self.base_weight = arg_data.flagArgumentFloat(kShort_flag_base_weight, 0)
 
+        if arg_data.isFlagSet(kShort_flag_mode):
+            self.mode = arg_data.flagArgumentString(kShort_flag_mode, 0)
+            if self.mode not in ('closest', 'projection'):
+                raise ValueError('Invalid mode: {}'.format(self.mode))
+
+        if arg_data.isFlagSet(kShort_flag_max_distance):
+            self.max_distance = arg_data.flagArgumentDouble(kShort_flag_max_distance, 0)
+
     def isUndoable(self):
         return True
 
@@ -178,9 +210,13 @@ class HTM_TransferVertexNormals(om2.MPxCommand):
         """
         Args:
             baseWeight(bw): float
+            mode(m): str, 'closest'なら最近接点、'projection'なら転送先の法線方向に投影
+            maxDistance(md): float, 'projection'の時の最大距離
         """
         syntax = om2.MSyntax()
         syntax.addFlag(kShort_flag_base_weight, kLong_flag_base_weight, om2.MSyntax.kLong) # kLong == int
+        syntax.addFlag(kShort_flag_mode, kLong_flag_mode, om2.MSyntax.kString)
+        syntax.addFlag(kShort_flag_max_distance, kLong_flag_max_distance, om2.MSyntax.kDouble)
         return syntax
 
 
@@ -8,6 +8,8 @@ from contextlib import contextmanager
 from functools import wraps
 from re import fullmatch
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 import maya.cmds as mc
 import maya.mel as mel
@@ -148,3 +150,117 @@ def undo_ctx(func):
     return wrapper
 
 
+# ---------------------------------------------------------
+# シーンの変更で破棄するキャッシュ
+# ---------------------------------------------------------
+class SceneCache(object):
+    """ 作るのが重い値をキャッシュし、登録したMayaのメッセージが来たら破棄する
+        コールバックは最初にget()した時に登録する
+
+    Args:
+        builder(callable): 引数なしで呼んでキャッシュする値を作る
+        callbacks(list[callable]): 破棄する関数を受け取ってコールバックを登録し、IDを返す
+            例: om2.MDagMessage.addAllDagChangesCallback
+                lambda func: om2.MDGMessage.addNodeAddedCallback(func, 'joint')
+        release(callable): 破棄する時に古い値を渡して呼ぶ、値が持つコールバックの削除など
+
+    Attributes:
+        value: キャッシュしている値、無ければNone
+    """
+    def __init__(self, builder, callbacks, release=None):
+        self.builder = builder
+        self.callbacks = callbacks
+        self.release = release
+        self.value = None
+        self.callback_ids = []
+
+    def get(self):
+        """ キャッシュしている値を取得、無ければ作る
+        """
+        if self.value is None:
+            self.add_callbacks()
+            self.value = self.builder()
+        return self.value
+
+    def invalidate(self, *args):
+        """ キャッシュを破棄する、コールバックから呼ばれる
+        """
+        value, self.value = self.value, None
+        if value is not None and self.release is not None:
+            self.release(value)
+
+    def add_callbacks(self):
+        if self.callback_ids:
+            return
+        self.callback_ids = [add_callback(self.invalidate) for add_callback in self.callbacks]
+
+    def remove_callbacks(self):
+        """ コールバックを削除してキャッシュも破棄する、モジュールのリロード前などに
+        """
+        for callback_id in self.callback_ids:
+            om2.MMessage.removeCallback(callback_id)
+        del self.callback_ids[:]
+        self.invalidate()
+
+
+def scene_callbacks(*messages):
+    """ シーンを開いた時などに破棄するためのSceneCacheのcallbacksを作る
+
+    Args:
+        messages(int): om2.MSceneMessage.kAfterOpenなど
+    """
+    return [lambda func, message=message: om2.MSceneMessage.addCallback(message, func)
+            for message in messages]
+
+
+# ---------------------------------------------------------
+# マルチプロセス関連
+# ---------------------------------------------------------
+def get_mayapy_path():
+    """ mayapyのパスを取得、Maya本体から子プロセスを立ち上げるときに使う
+    """
+    bin_dir = os.path.dirname(sys.executable)
+    name = 'mayapy.exe' if os.name == 'nt' else 'mayapy'
+    path = os.path.join(bin_dir, name)
+    if os.path.exists(path):
+        return path
+    return sys.executable
+
+
+def create_process_pool(max_workers=None, initializer=None, initargs=()):
+    """ ワーカープロセスのプールを作成
+        Maya(GUI)のsys.executableはmaya.exeなので、子プロセスはmayapyで起動させる
+
+    Args:
+        max_workers(int): ワーカー数、Noneなら論理コア数 - 1
+        initializer(callable): 各ワーカーの起動時に1回だけ呼ばれる関数
+        initargs(tuple): initializerの引数、大きい配列はここで1回だけ渡す
+    """
+    if max_workers is None:
+        max_workers = max(multiprocessing.cpu_count() - 1, 1)
+
+    ctx = multiprocessing.get_context('spawn')
+    ctx.set_executable(get_mayapy_path())
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx,
+                               initializer=initializer, initargs=initargs)
+
+
+# ---------------------------------------------------------
+# プログレスバー
+# ---------------------------------------------------------
+class ProgressBar:
+    """ Mayaのメインプログレスバーを使った進捗表示
+    """
+    def __init__(self, max_count, status=u'処理中...'):
+        self.bar = mel.eval('$tmp = $gMainProgressBar')
+        mc.progressBar(self.bar, edit=True, beginProgress=True, isInterruptable=False,
+                       status=status, minValue=0, maxValue=max(max_count, 1))
+
+    def step(self, status=None):
+        if status is None:
+            mc.progressBar(self.bar, edit=True, step=1)
+        else:
+            mc.progressBar(self.bar, edit=True, step=1, status=status)
+
+    def end(self):
+        mc.progressBar(self.bar, edit=True, endProgress=True)
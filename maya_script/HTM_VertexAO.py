@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+""" 頂点から直接レイを飛ばして計算するアンビエントオクルージョン
+    テクスチャへのレンダリングとファイル経由のインポートを経由せずに頂点カラーに書き込む
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import get_dag_path, get_points, get_face_vertex_ids
+from HTM_Tools.HTM_RayBVH import build_mesh_bvh
+from HTM_Tools.HTM_Util import create_process_pool, Timer
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+
+
+# 1タスクあたりの頂点数
+VERTEX_CHUNK = 4096
+
+# ワーカープロセス側で保持するデータ
+_worker_data = {}
+
+
+# ---------------------------------------------------------
+# サンプリング
+# ---------------------------------------------------------
+def hash_uint32(values, seed=0):
+    """ 整数から決定的な疑似乱数を生成、0.0～1.0を返す
+    """
+    h = (np.asarray(values, dtype=np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B9)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(16)
+    h = (h * np.uint64(0x7FEB352D)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(15)
+    h = (h * np.uint64(0x846CA68B)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(16)
+    return h.astype(np.float64) / 4294967296.0
+
+
+def hammersley(num_samples):
+    """ Hammersley点列、(S,2)の0.0～1.0
+    """
+    i = np.arange(num_samples, dtype=np.uint32)
+    bits = i.copy()
+    bits = ((bits << 16) | (bits >> 16)) & 0xFFFFFFFF
+    bits = ((bits & 0x55555555) << 1) | ((bits & 0xAAAAAAAA) >> 1)
+    bits = ((bits & 0x33333333) << 2) | ((bits & 0xCCCCCCCC) >> 2)
+    bits = ((bits & 0x0F0F0F0F) << 4) | ((bits & 0xF0F0F0F0) >> 4)
+    bits = ((bits & 0x00FF00FF) << 8) | ((bits & 0xFF00FF00) >> 8)
+    return np.column_stack([(i + 0.5) / num_samples, bits.astype(np.float64) / 4294967296.0])
+
+
+def tangent_frames(normals):
+    """ 法線から正規直交基底を作成 (Duff et al. 2017)
+
+    Returns:
+        np.ndarray, np.ndarray: (N,3)の接線、(N,3)の従法線
+    """
+    nx, ny, nz = normals[:, 0], normals[:, 1], normals[:, 2]
+    sign = np.where(nz >= 0.0, 1.0, -1.0)
+    a = -1.0 / (sign + nz)
+    b = nx * ny * a
+    tangent = np.column_stack([1.0 + sign * nx * nx * a, sign * b, -sign * nx])
+    binormal = np.column_stack([b, sign + ny * ny * a, -ny])
+    return tangent, binormal
+
+
+def cosine_hemisphere_dirs(normals, vertex_ids, num_samples, seed=0):
+    """ 頂点ごとにコサイン重み付きの半球方向を生成
+        頂点IDとシードから決まるので、処理の分割方法によらず同じ結果になる
+
+    Returns:
+        np.ndarray: (N,S,3)の方向
+    """
+    base = hammersley(num_samples)
+
+    # 頂点ごとにサンプルパターンをずらす(Cranley-Patterson回転)
+    shift_u = hash_uint32(vertex_ids, seed)
+    shift_v = hash_uint32(vertex_ids, seed + 1)
+    u1 = np.mod(base[np.newaxis, :, 0] + shift_u[:, np.newaxis], 1.0)
+    u2 = np.mod(base[np.newaxis, :, 1] + shift_v[:, np.newaxis], 1.0)
+
+    r = np.sqrt(u1)
+    phi = 2.0 * np.pi * u2
+    x = r * np.cos(phi)
+    y = r * np.sin(phi)
+    z = np.sqrt(np.maximum(1.0 - u1, 0.0))
+
+    tangent, binormal = tangent_frames(normals)
+    return (x[:, :, np.newaxis] * tangent[:, np.newaxis] +
+            y[:, :, np.newaxis] * binormal[:, np.newaxis] +
+            z[:, :, np.newaxis] * normals[:, np.newaxis])
+
+
+# ---------------------------------------------------------
+# AO計算、ワーカープロセス側でも呼ばれる
+# ---------------------------------------------------------
+def compute_ao(bvh, points, normals, vertex_ids, samples=64, max_distance=10.0,
+               seed=0, bias=1e-3):
+    """ 頂点ごとのAOを計算
+
+    Args:
+        bvh(TriangleBVH): 遮蔽物のBVH
+        points(np.ndarray): (N,3)のワールド座標
+        normals(np.ndarray): (N,3)の正規化済みワールド法線
+        vertex_ids(np.ndarray): (N,)の頂点ID、サンプルパターンの決定に使う
+        samples(int): 頂点あたりのレイ数
+        max_distance(float): 遮蔽とみなす最大距離
+        seed(int): シード値
+        bias(float): 自己交差を避けるためのレイの始点のオフセット
+
+    Returns:
+        np.ndarray: (N,)の0.0(完全に遮蔽)～1.0(遮蔽なし)
+    """
+    dirs = cosine_hemisphere_dirs(normals, vertex_ids, samples, seed)
+    origins = np.repeat(points + normals * bias, samples, axis=0)
+
+    hit = bvh.intersect_any(origins, dirs.reshape(-1, 3), max_distance)
+    return 1.0 - hit.reshape(-1, samples).mean(axis=1)
+
+
+def _init_worker(bvh):
+    _worker_data['bvh'] = bvh
+
+
+def _compute_chunk(func, points, normals, vertex_ids, args):
+    return func(_worker_data['bvh'], points, normals, vertex_ids, *args)
+
+
+def map_vertex_chunks(func, bvh, points, normals, args=(), max_workers=None, pool=None):
+    """ 頂点をチャンクに分けて、ワーカープロセスで並列にfuncを実行する
+
+    Args:
+        func(callable): func(bvh, points, normals, vertex_ids, *args)で(N,)を返すモジュール関数
+        bvh(TriangleBVH): レイを飛ばす対象のBVH
+        points(np.ndarray): (N,3)のワールド座標
+        normals(np.ndarray): (N,3)のワールド法線
+        args(tuple): funcに渡す残りの引数
+        max_workers(int): ワーカー数、1ならMaya内で処理する
+        pool(ProcessPoolExecutor): 既存のプールを使う場合、ワーカーはbvhで初期化済みであること
+
+    Returns:
+        np.ndarray: (N,)
+    """
+    num_vtx = len(points)
+    vertex_ids = np.arange(num_vtx)
+    chunks = [slice(i, min(i + VERTEX_CHUNK, num_vtx)) for i in range(0, num_vtx, VERTEX_CHUNK)]
+    result = np.ones(num_vtx, dtype=np.float64)
+
+    if max_workers == 1 and pool is None:
+        for chunk in chunks:
+            result[chunk] = func(bvh, points[chunk], normals[chunk], vertex_ids[chunk], *args)
+        return result
+
+    own_pool = pool is None
+    if own_pool:
+        pool = create_process_pool(max_workers, _init_worker, (bvh,))
+
+    try:
+        futures = [(pool.submit(_compute_chunk, func, points[chunk], normals[chunk],
+                                vertex_ids[chunk], args), chunk)
+                   for chunk in chunks]
+        for future, chunk in futures:
+            result[chunk] = future.result()
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    return result
+
+
+def compute_vertex_ao(bvh, points, normals, samples=64, max_distance=10.0, seed=0,
+                      bias=1e-3, max_workers=None, pool=None):
+    """ 頂点をチャンクに分けてワーカープロセスで並列にAOを計算
+
+    Args:
+        max_workers(int): ワーカー数、1ならMaya内で処理する
+        pool(ProcessPoolExecutor): 既存のプールを使う場合、ワーカーはbvhで初期化済みであること
+
+    Returns:
+        np.ndarray: (N,)のAO
+    """
+    return map_vertex_chunks(compute_ao, bvh, points, normals,
+                             (samples, max_distance, seed, bias), max_workers, pool)
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def get_scene_occluders():
+    """ シーン内の表示されているメッシュを遮蔽物として取得
+    """
+    shapes = mc.ls(type='mesh', ni=True, v=True, l=True) or []
+    return [s for s in shapes if not mc.getAttr(s + '.intermediateObject')]
+
+
+def get_vertex_normals(fn_mesh):
+    """ 正規化済みのワールド空間の頂点法線を(V,3)の配列で取得
+    """
+    normals = np.array(fn_mesh.getVertexNormals(False, om2.MSpace.kWorld),
+                       dtype=np.float64).reshape(-1, 3)
+    length = np.linalg.norm(normals, axis=1)
+    length[length == 0.0] = 1.0
+    return normals / length[:, np.newaxis]
+
+
+def bake_vertex_ao(objs, occluders=None, samples=64, max_distance=10.0, seed=0,
+                   bias=None, max_workers=None, channel='rgb'):
+    """ AOを計算して頂点カラーに直接書き込む
+
+    Args:
+        objs(list[str]): 対象オブジェクト
+        occluders(list[str]): 遮蔽物、Noneならシーン内の表示されている全メッシュ
+        samples(int): 頂点あたりのレイ数
+        max_distance(float): 遮蔽とみなす最大距離
+        seed(int): シード値
+        bias(float): レイの始点のオフセット、Noneならシーンの大きさから決める
+        max_workers(int): ワーカー数
+        channel(str): 書き込むチャンネル
+    """
+    if occluders is None:
+        occluders = get_scene_occluders()
+
+    with Timer():
+        bvh, _ = build_mesh_bvh(occluders)
+
+    if bias is None:
+        diag = np.linalg.norm(bvh.node_max[0] - bvh.node_min[0]) if bvh.num_nodes else 1.0
+        bias = diag * 1e-5
+
+    pool = None
+    if not max_workers == 1:
+        pool = create_process_pool(max_workers, _init_worker, (bvh,))
+
+    try:
+        for obj in objs:
+            fn_mesh = om2.MFnMesh(get_dag_path(obj))
+            points = get_points(fn_mesh, om2.MSpace.kWorld)
+            normals = get_vertex_normals(fn_mesh)
+
+            with Timer():
+                ao = compute_vertex_ao(bvh, points, normals, samples, max_distance, seed,
+                                       bias, max_workers, pool)
+
+            _, vertices = get_face_vertex_ids(fn_mesh)
+            colors = np.repeat(ao[vertices, np.newaxis], 4, axis=1)
+            set_face_vertex_colors(obj, colors, channel=channel)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def main(samples=64, max_distance=10.0):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    bake_vertex_ao(sel, samples=samples, max_distance=max_distance)
+
+
+if '__main__' == __name__:
+    main()
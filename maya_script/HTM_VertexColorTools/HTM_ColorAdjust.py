@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+""" 頂点カラーの色調補正(レベル補正、ガンマ、カーブ、HSV、チャンネル入れ替え、チャンネル演算)
+    補正はフェース頂点カラーの配列全体に一括で行い、HTM_SetFaceVertexColors経由で書き込むのでUndo可能
+    ソフト選択のウェイトがあればマスクとして使い、影響のあるフェース頂点だけを書き込む
+"""
+import ast
+import sys
+
+import numpy as np
+
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import undo_ctx
+from HTM_Tools.HTM_SelectUtil import get_selection_weights
+from HTM_Tools.HTM_ArrayUtil import (CHANNEL_TABLE, get_dag_path, get_face_vertex_ids,
+                                     get_face_vertex_colors)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+
+
+# ---------------------------------------------------------
+# 補正処理、すべて(N,4)のカラーを受け取って(N,4)を返す
+# ---------------------------------------------------------
+def levels(colors, in_black=0.0, in_white=1.0, gamma=1.0, out_black=0.0, out_white=1.0):
+    """ レベル補正
+
+    Args:
+        colors(np.ndarray): (N,4)のカラー
+        in_black(float): 入力の黒点、これ以下は0.0
+        in_white(float): 入力の白点、これ以上は1.0
+        gamma(float): 中間調のガンマ、1.0より大きいと明るくなる
+        out_black(float): 出力の黒点
+        out_white(float): 出力の白点
+    """
+    scale = 1.0 / max(in_white - in_black, 1e-6)
+    values = np.clip((colors - in_black) * scale, 0.0, 1.0)
+    if not gamma == 1.0:
+        values = values ** (1.0 / max(gamma, 1e-6))
+    return (out_black + values * (out_white - out_black)).astype(np.float32)
+
+
+def gamma(colors, value=2.2):
+    """ ガンマ補正、value乗の逆数で持ち上げる
+    """
+    return levels(colors, gamma=value)
+
+
+def curve(colors, lut_x, lut_y):
+    """ カーブ(LUT)で値を変換
+
+    Args:
+        lut_x(np.ndarray): 昇順の入力値
+        lut_y(np.ndarray): 入力値に対応する出力値
+    """
+    values = np.interp(colors.reshape(-1), lut_x, lut_y)
+    return values.reshape(colors.shape).astype(np.float32)
+
+
+def rgb_to_hsv(rgb):
+    """ (N,3)のRGBを(N,3)のHSVに変換、Hは0.0～1.0
+    """
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    c_max = rgb.max(axis=1)
+    delta = c_max - rgb.min(axis=1)
+    safe_delta = np.where(delta > 0.0, delta, 1.0)
+
+    hue = np.where(c_max == r, (g - b) / safe_delta,
+                   np.where(c_max == g, (b - r) / safe_delta + 2.0,
+                            (r - g) / safe_delta + 4.0))
+    hue = np.where(delta > 0.0, np.mod(hue / 6.0, 1.0), 0.0)
+    saturation = np.where(c_max > 0.0, delta / np.where(c_max > 0.0, c_max, 1.0), 0.0)
+    return np.column_stack([hue, saturation, c_max])
+
+
+def hsv_to_rgb(hsv):
+    """ (N,3)のHSVを(N,3)のRGBに変換
+    """
+    h6 = np.mod(hsv[:, 0], 1.0) * 6.0
+    s, v = hsv[:, 1], hsv[:, 2]
+
+    # 各チャンネルは色相環上の位置から三角波で求まる
+    k = np.mod(np.array([5.0, 3.0, 1.0]) + h6[:, np.newaxis], 6.0)
+    ramp = np.clip(np.minimum(k, 4.0 - k), 0.0, 1.0)
+    return v[:, np.newaxis] - (v * s)[:, np.newaxis] * ramp
+
+
+def hsv_shift(colors, hue=0.0, saturation=1.0, value=1.0):
+    """ HSVの調整、アルファはそのまま
+
+    Args:
+        hue(float): 色相のずらし量、1.0で一周
+        saturation(float): 彩度の倍率
+        value(float): 明度の倍率
+    """
+    hsv = rgb_to_hsv(colors[:, :3].astype(np.float64))
+    hsv[:, 0] += hue
+    hsv[:, 1] = np.clip(hsv[:, 1] * saturation, 0.0, 1.0)
+    hsv[:, 2] *= value
+
+    result = colors.astype(np.float32)
+    result[:, :3] = hsv_to_rgb(hsv)
+    return result
+
+
+def swizzle(colors, pattern='rgba'):
+    """ チャンネルの入れ替え、コピー
+
+    Args:
+        pattern(str): 出力のRGBAそれぞれに入れるチャンネル、'0'、'1'で定数
+                      'bgra'で赤と青の入れ替え、'rrr1'でRをグレースケールにするなど
+    """
+    if not len(pattern) == 4 or any(ch not in 'rgba01' for ch in pattern):
+        raise ValueError('Invalid swizzle pattern: {}'.format(pattern))
+
+    result = np.empty((len(colors), 4), dtype=np.float32)
+    for i, ch in enumerate(pattern):
+        result[:, i] = float(ch) if ch in '01' else colors[:, CHANNEL_TABLE[ch]]
+    return result
+
+
+def _smoothstep(edge0, edge1, x):
+    t = np.clip((x - edge0) / (edge1 - edge0), 0.0, 1.0)
+    return t * t * (3.0 - 2.0 * t)
+
+
+# チャンネル演算の式で使える関数
+EXPRESSION_FUNCTIONS = {
+    'abs': np.abs,
+    'min': np.minimum,
+    'max': np.maximum,
+    'clip': np.clip,
+    'sqrt': np.sqrt,
+    'pow': np.power,
+    'lerp': lambda a, b, t: a + (b - a) * t,
+    'step': lambda edge, x: (x >= edge).astype(np.float32),
+    'smoothstep': _smoothstep,
+}
+
+
+# チャンネル演算の式で使えるノード、これ以外(属性アクセス、添字、lambda、内包表記など)は使わせない
+_EXPRESSION_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Constant, ast.Name,
+                     ast.Call, ast.operator, ast.unaryop, ast.cmpop, ast.Load)
+if sys.version_info < (3, 8):
+    _EXPRESSION_NODES += (ast.Num,)
+
+
+def _validate_expression(tree, names):
+    """ 式の構文木を全てたどって、許可したノードと名前だけでできているか調べる
+
+    Args:
+        tree(ast.Expression): 式の構文木
+        names(iterable[str]): 使える名前
+    """
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            raise ValueError('Unsupported syntax in expression: {}'.format(type(node).__name__))
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError('Unsupported constant in expression: {!r}'.format(node.value))
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError('Unknown name in expression: {}'.format(node.id))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in EXPRESSION_FUNCTIONS:
+                raise ValueError('Only {} can be called in expression.'.format(
+                    ', '.join(sorted(EXPRESSION_FUNCTIONS))))
+            if node.keywords:
+                raise ValueError('Keyword arguments are not supported in expression.')
+
+
+def channel_math(colors, expression):
+    """ 式でチャンネルを計算する、';'区切りで複数書けて、前の式の結果は後の式で使える
+        式の中ではr, g, b, aと数値、EXPRESSION_FUNCTIONSの関数だけが使える
+
+    Args:
+        expression(str): 'r = r * g'、'a = 1 - r; g = clip(g * 2, 0, 1)'など
+    """
+    result = colors.astype(np.float32)
+    namespace = dict(EXPRESSION_FUNCTIONS)
+    namespace.update((ch, result[:, col]) for ch, col in CHANNEL_TABLE.items())
+
+    for statement in expression.split(';'):
+        if not statement.strip():
+            continue
+
+        target, _, expr = statement.partition('=')
+        target = target.strip().lower()
+        if target not in CHANNEL_TABLE or not expr.strip():
+            raise ValueError('Invalid statement: {}'.format(statement.strip()))
+
+        # 属性アクセスや組み込み関数は使わせない、lambdaの中なども含めて構文木全体を調べる
+        tree = ast.parse(expr.strip(), '<channel_math>', 'eval')
+        _validate_expression(tree, namespace)
+
+        value = eval(compile(tree, '<channel_math>', 'eval'), {'__builtins__': {}}, namespace)
+        result[:, CHANNEL_TABLE[target]] = value
+
+    return result
+
+
+OPERATIONS = {
+    'levels': levels,
+    'gamma': gamma,
+    'curve': curve,
+    'hsv': hsv_shift,
+    'swizzle': swizzle,
+    'math': channel_math,
+}
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def adjust_vertex_colors(obj, op, weights=None, channel='rgb', **kwargs):
+    """ 1オブジェクトの頂点カラーを補正する、Undo可能
+
+    Args:
+        obj(str): 対象オブジェクト
+        op(str): OPERATIONSのキー
+        weights(np.ndarray): (V,)の頂点ごとの補正の強さ、Noneなら全体に1.0
+        channel(str): 書き込むチャンネル
+        kwargs: 補正処理に渡す引数
+    """
+    func = OPERATIONS[op]
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    colors = get_face_vertex_colors(fn_mesh)
+
+    if weights is None:
+        set_face_vertex_colors(obj, func(colors, **kwargs), channel=channel)
+        return
+
+    # 影響のあるフェース頂点だけ計算して書き込む、Undoの情報もその分だけになる
+    faces, vertices = get_face_vertex_ids(fn_mesh)
+    fv_weights = np.asarray(weights, dtype=np.float32)[vertices]
+    affected = fv_weights > 0.0
+    if not affected.any():
+        return
+
+    colors = colors[affected]
+    fv_weights = fv_weights[affected, np.newaxis]
+    adjusted = colors + (func(colors, **kwargs) - colors) * fv_weights
+    set_face_vertex_colors(obj, adjusted, faces[affected], vertices[affected], channel=channel)
+
+
+@undo_ctx
+def adjust_selection(op, channel='rgb', **kwargs):
+    """ 選択しているオブジェクト、頂点の頂点カラーを補正する、まとめて1回でUndoできる
+
+    Example:
+        adjust_selection('levels', in_black=0.2, in_white=0.8)
+        adjust_selection('hsv', hue=0.1, saturation=1.2)
+        adjust_selection('swizzle', channel='rgba', pattern='bgra')
+        adjust_selection('math', channel='rgba', expression='a = r * g')
+    """
+    targets = get_selection_weights()
+    if not targets:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    for shape, weights in targets:
+        adjust_vertex_colors(shape, op, weights, channel, **kwargs)
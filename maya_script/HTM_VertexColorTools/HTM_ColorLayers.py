@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+""" 非破壊の頂点カラーレイヤー
+    レイヤーはフェース頂点単位の配列で持ち、合成結果だけを実際のカラーセットに書き込む
+"""
+import io
+import base64
+
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_Util import undo_ctx, SceneCache, scene_callbacks
+from HTM_Tools.HTM_ArrayUtil import CHANNEL_TABLE, get_dag_path, get_face_vertex_colors
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+
+
+BLEND_MODES = ('normal', 'multiply', 'overlay', 'add')
+
+# レイヤー情報を保存するシェイプのアトリビュート名
+LAYER_ATTR = 'htmColorLayers'
+
+# レイヤーを通さずに直接カラーセットを編集した内容を取り込むレイヤー名
+EXTERNAL_LAYER = 'External Edits'
+
+# 最後に書き込んだ合成結果と現在のカラーの差がこれ以下なら変更されていないとみなす
+# レイヤーはfloat16で持つので、その誤差より大きくする
+EXTERNAL_TOLERANCE = 2e-3
+
+
+def blend(base, top, mode):
+    """ ブレンドモードごとの合成、(N,4)同士をまとめて計算
+
+    Args:
+        base(np.ndarray): (N,4)の下のカラー
+        top(np.ndarray): (N,4)のレイヤーのカラー
+        mode(str): 'normal', 'multiply', 'overlay', 'add'
+    """
+    if mode == 'normal':
+        return top
+    elif mode == 'multiply':
+        return base * top
+    elif mode == 'add':
+        return np.minimum(base + top, 1.0)
+    elif mode == 'overlay':
+        return np.where(base < 0.5,
+                        2.0 * base * top,
+                        1.0 - 2.0 * (1.0 - base) * (1.0 - top))
+    raise ValueError('Invalid blend mode: {}'.format(mode))
+
+
+class ColorLayer(object):
+    """ 頂点カラーレイヤー、カラーはfloat16、マスクはuint8で持つ
+
+    Attributes:
+        name(str): レイヤー名
+        colors(np.ndarray): (FV,4)のfloat16
+        mask(np.ndarray): (FV,)のuint8、Noneならマスク無し
+        blend_mode(str): ブレンドモード
+        opacity(float): 不透明度
+        channel(str): 影響するチャンネル、'g'ならGチャンネルだけ合成する
+        visible(bool):
+    """
+    def __init__(self, name, colors, mask=None, blend_mode='normal', opacity=1.0,
+                 channel='rgba', visible=True):
+        assert blend_mode in BLEND_MODES, 'invalid blend mode was passed.'
+        self.name = name
+        self.colors = np.asarray(colors, dtype=np.float16).reshape(-1, 4)
+        self.mask = None if mask is None else self.to_mask(mask)
+        self.blend_mode = blend_mode
+        self.opacity = opacity
+        self.channel = channel
+        self.visible = visible
+
+    @staticmethod
+    def to_mask(mask):
+        """ 0.0～1.0のマスクをuint8に変換
+        """
+        mask = np.asarray(mask)
+        if mask.dtype == np.uint8:
+            return mask
+        return (np.clip(mask, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+    def apply(self, base):
+        """ 下の合成結果にこのレイヤーを合成した結果を返す
+
+        Args:
+            base(np.ndarray): (FV,4)のfloat32
+        """
+        if not self.visible or self.opacity <= 0.0:
+            return base
+
+        top = self.colors.astype(np.float32)
+        weight = np.full(len(base), self.opacity, dtype=np.float32)
+        if self.mask is not None:
+            weight *= self.mask.astype(np.float32) * (1.0 / 255.0)
+
+        blended = blend(base, top, self.blend_mode)
+
+        result = base.copy()
+        cols = [CHANNEL_TABLE[ch] for ch in self.channel]
+        result[:, cols] += (blended[:, cols] - base[:, cols]) * weight[:, np.newaxis]
+        return result
+
+
+class ColorLayerStack(object):
+    """ レイヤースタック、各レイヤーまでの合成結果をキャッシュしておき
+        レイヤーが変更された場合はそのレイヤーより上だけを再計算する
+        最後にカラーセットに書き込んだ合成結果(flattened)を持っておき、ペイントなどで
+        カラーセットが直接編集された場合はその内容をレイヤーとして取り込む
+    """
+    def __init__(self, obj, base=None, flattened=None):
+        self.fn_mesh = om2.MFnMesh(get_dag_path(obj))
+        self.obj = self.fn_mesh.fullPathName()
+
+        if base is None:
+            base = get_face_vertex_colors(self.fn_mesh)
+        self.base = np.asarray(base, dtype=np.float16).reshape(-1, 4)
+
+        # 作成直後はカラーセットとベースが同じ
+        if flattened is None:
+            flattened = self.base
+        self.flattened = np.asarray(flattened, dtype=np.float16).reshape(-1, 4)
+
+        self.layers = []
+        self._composites = [] # self._composites[i] = レイヤーiまでの合成結果
+
+    @property
+    def num_face_vertices(self):
+        return len(self.base)
+
+    def index(self, name):
+        for i, layer in enumerate(self.layers):
+            if layer.name == name:
+                return i
+        return -1
+
+    def get_layer(self, name):
+        i = self.index(name)
+        return self.layers[i] if i >= 0 else None
+
+    def mark_dirty(self, index):
+        """ index番目以降のレイヤーの合成結果を破棄
+        """
+        del self._composites[index:]
+
+    def add_layer(self, layer, index=None):
+        if not len(layer.colors) == self.num_face_vertices:
+            raise ValueError('Layer size does not match the number of face vertices.')
+
+        if index is None:
+            index = len(self.layers)
+        self.layers.insert(index, layer)
+        self.mark_dirty(index)
+        return layer
+
+    def remove_layer(self, name):
+        i = self.index(name)
+        if i < 0:
+            return
+        del self.layers[i]
+        self.mark_dirty(i)
+
+    def move_layer(self, name, index):
+        i = self.index(name)
+        if i < 0:
+            return
+        layer = self.layers.pop(i)
+        self.layers.insert(index, layer)
+        self.mark_dirty(min(i, index))
+
+    def set_layer(self, name, colors=None, mask=None, channel=None, **kwargs):
+        """ レイヤーの内容を更新、無ければ追加
+
+        Args:
+            name(str): レイヤー名
+            colors(np.ndarray): (FV,4)のカラー
+            mask(np.ndarray): (FV,)のマスク
+            channel(str): 影響するチャンネル
+            kwargs: blend_mode, opacity, visible
+        """
+        i = self.index(name)
+        if i < 0:
+            layer = ColorLayer(name, colors, mask, channel=channel or 'rgba', **kwargs)
+            return self.add_layer(layer)
+
+        layer = self.layers[i]
+        if colors is not None:
+            layer.colors = np.asarray(colors, dtype=np.float16).reshape(-1, 4)
+        if mask is not None:
+            layer.mask = ColorLayer.to_mask(mask)
+        if channel is not None:
+            layer.channel = channel
+        for key, value in kwargs.items():
+            setattr(layer, key, value)
+
+        self.mark_dirty(i)
+        return layer
+
+    def composite(self):
+        """ 合成結果を返す、変更のあったレイヤー以降だけ再計算する
+
+        Returns:
+            np.ndarray: (FV,4)のfloat32
+        """
+        if self._composites:
+            result = self._composites[-1]
+        else:
+            result = self.base.astype(np.float32)
+
+        for layer in self.layers[len(self._composites):]:
+            result = layer.apply(result)
+            self._composites.append(result)
+
+        return np.clip(result, 0.0, 1.0)
+
+    def flatten(self):
+        """ 合成結果を実際のカラーセットに書き込む、Undo可能
+        """
+        result = self.composite()
+        set_face_vertex_colors(self.obj, result)
+        self.flattened = result.astype(np.float16)
+
+    def capture_external_edits(self):
+        """ 最後に書き込んだ合成結果からカラーセットが変わっていれば、変わったフェース頂点を
+            レイヤーとして一番上に取り込む、次の合成で直接の編集が消えないようにする
+            一番上が取り込み用のレイヤーならそこに追加する
+
+        Returns:
+            ColorLayer: 取り込んだレイヤー、変更が無ければNone
+        """
+        current = get_face_vertex_colors(self.fn_mesh)
+        if not len(current) == self.num_face_vertices:
+            return None
+
+        diff = np.abs(current - self.flattened.astype(np.float32))
+        changed = (diff > EXTERNAL_TOLERANCE).any(axis=1)
+        if not changed.any():
+            return None
+
+        top = self.layers[-1] if self.layers else None
+        if top is not None and top.name.startswith(EXTERNAL_LAYER):
+            colors = top.colors.astype(np.float32)
+            colors[changed] = current[changed]
+            mask = changed.astype(np.uint8) * 255
+            if top.mask is not None:
+                mask = np.maximum(top.mask, mask)
+            layer = self.set_layer(top.name, colors, mask)
+        else:
+            names = set(l.name for l in self.layers)
+            name = EXTERNAL_LAYER
+            count = 1
+            while name in names:
+                count += 1
+                name = '{} {}'.format(EXTERNAL_LAYER, count)
+            layer = self.add_layer(ColorLayer(name, current, changed.astype(np.float32)))
+
+        self.flattened = current.astype(np.float16)
+        return layer
+
+    # ---------------------------------------------------------
+    # 保存・読み込み
+    # ---------------------------------------------------------
+    def to_bytes(self):
+        data = {'base': self.base,
+                'flattened': self.flattened,
+                'names': np.array([l.name for l in self.layers]),
+                'blend_modes': np.array([l.blend_mode for l in self.layers]),
+                'channels': np.array([l.channel for l in self.layers]),
+                'opacities': np.array([l.opacity for l in self.layers], dtype=np.float32),
+                'visibles': np.array([l.visible for l in self.layers], dtype=np.bool_)}
+        for i, layer in enumerate(self.layers):
+            data['colors_{}'.format(i)] = layer.colors
+            if layer.mask is not None:
+                data['mask_{}'.format(i)] = layer.mask
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **data)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, obj, raw):
+        data = np.load(io.BytesIO(raw))
+        # flattenedが無い古いデータは、ベースのまま書き込まれていたとみなす
+        stack = cls(obj, base=data['base'],
+                    flattened=data['flattened'] if 'flattened' in data else None)
+
+        for i, name in enumerate(data['names']):
+            mask_key = 'mask_{}'.format(i)
+            layer = ColorLayer(str(name), data['colors_{}'.format(i)],
+                               data[mask_key] if mask_key in data else None,
+                               blend_mode=str(data['blend_modes'][i]),
+                               opacity=float(data['opacities'][i]),
+                               channel=str(data['channels'][i]),
+                               visible=bool(data['visibles'][i]))
+            stack.layers.append(layer)
+
+        return stack
+
+    def save(self, path=None):
+        """ シェイプのアトリビュートか、pathを指定した場合はファイルに保存
+        """
+        raw = self.to_bytes()
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(raw)
+            return
+
+        if not mc.attributeQuery(LAYER_ATTR, node=self.obj, exists=True):
+            mc.addAttr(self.obj, ln=LAYER_ATTR, dt='string')
+        mc.setAttr('{}.{}'.format(self.obj, LAYER_ATTR),
+                   base64.b64encode(raw).decode('ascii'), type='string')
+
+    @classmethod
+    def load(cls, obj, path=None):
+        """ シェイプのアトリビュートかファイルから読み込む、無ければNone
+        """
+        if path is not None:
+            with open(path, 'rb') as f:
+                return cls.from_bytes(obj, f.read())
+
+        shape = om2.MFnMesh(get_dag_path(obj)).fullPathName()
+        if not mc.attributeQuery(LAYER_ATTR, node=shape, exists=True):
+            return None
+        raw = mc.getAttr('{}.{}'.format(shape, LAYER_ATTR))
+        if not raw:
+            return None
+        return cls.from_bytes(obj, base64.b64decode(raw))
+
+
+# {シェイプのフルパス: ColorLayerStack}、次はアトリビュートから読み直す
+# Undo、Redoでアトリビュートとカラーセットが戻るので、メモリ上のスタックも合わせて捨てる
+_cache = SceneCache(dict, [
+    lambda func: om2.MEventMessage.addEventCallback('Undo', func),
+    lambda func: om2.MEventMessage.addEventCallback('Redo', func),
+] + scene_callbacks(om2.MSceneMessage.kAfterOpen, om2.MSceneMessage.kAfterNew))
+
+invalidate = _cache.invalidate
+remove_callbacks = _cache.remove_callbacks
+
+
+def get_stack(obj):
+    """ オブジェクトのレイヤースタックを取得、無ければ現在のカラーをベースに作成
+        トポロジーが変わっている場合は作り直す
+        レイヤーを通さずにカラーセットが編集されていれば、その内容をレイヤーとして取り込む
+    """
+    stacks = _cache.get()
+    shape = om2.MFnMesh(get_dag_path(obj))
+    key = shape.fullPathName()
+    num_fv = shape.numFaceVertices
+
+    stack = stacks.get(key)
+    if stack is None:
+        stack = ColorLayerStack.load(key)
+    if stack is None or not stack.num_face_vertices == num_fv:
+        if stack is not None:
+            om2.MGlobal.displayWarning(u'トポロジーが変更されているため、カラーレイヤーを作り直しました')
+        stack = ColorLayerStack(key)
+    else:
+        stack.capture_external_edits()
+
+    stacks[key] = stack
+    return stack
+
+
+@undo_ctx
+def apply_to_layer(obj, name, colors, channel='rgba', blend_mode=None, mask=None):
+    """ カラーをレイヤーとして設定し、合成結果をカラーセットに反映する
+        各ツールはカラーセットを直接上書きする代わりにこれを呼ぶ
+        カラーセットとアトリビュートへの書き込みはまとめて1回でUndoできる
+
+    Args:
+        obj(str): 対象オブジェクト
+        name(str): レイヤー名
+        colors(np.ndarray): (FV,4)のフェース頂点カラー
+        channel(str): 影響するチャンネル
+        blend_mode(str): ブレンドモード、Noneなら既存のレイヤーの設定を保つ、新規はnormal
+        mask(np.ndarray): (FV,)の0.0～1.0のマスク
+    """
+    kwargs = {} if blend_mode is None else {'blend_mode': blend_mode}
+    stack = get_stack(obj)
+    stack.set_layer(name, colors, mask, channel=channel, **kwargs)
+    stack.flatten()
+    stack.save()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+""" HTM_SetFaceVertexColorsにカラーを渡すためのプロセス内ストア
+    コマンドのフラグで大量の値を渡すと重いので、配列はここに登録してハンドル文字列だけ渡す
+"""
+import itertools
+
+import numpy as np
+
+import maya.cmds as mc
+
+
+_payloads = {}
+_counter = itertools.count(1)
+
+
+class ColorPayload(object):
+    """ フェース頂点カラーの編集内容、配列はすべて連続したメモリで持つ
+
+    Attributes:
+        colors(np.ndarray): (N,4)のfloat32
+        faces(np.ndarray): (N,)のint32のフェースID、Noneならメッシュ全体のフェース頂点順
+        vertices(np.ndarray): (N,)のint32の頂点ID
+    """
+    def __init__(self, colors, faces=None, vertices=None):
+        colors = np.asarray(colors, dtype=np.float32)
+        if colors.ndim == 2 and colors.shape[1] == 3:
+            colors = np.column_stack([colors, np.ones(len(colors), dtype=np.float32)])
+        self.colors = np.ascontiguousarray(colors.reshape(-1, 4))
+
+        if faces is None or vertices is None:
+            self.faces = None
+            self.vertices = None
+        else:
+            self.faces = np.ascontiguousarray(faces, dtype=np.int32)
+            self.vertices = np.ascontiguousarray(vertices, dtype=np.int32)
+            if not len(self.faces) == len(self.vertices) == len(self.colors):
+                raise ValueError('colors, faces and vertices must have the same length.')
+
+
+def submit(colors, faces=None, vertices=None):
+    """ ペイロードを登録してハンドルを返す
+
+    Returns:
+        str: コマンドの-payloadフラグに渡すハンドル
+    """
+    handle = 'HTM_ColorPayload{}'.format(next(_counter))
+    _payloads[handle] = ColorPayload(colors, faces, vertices)
+    return handle
+
+
+def take(handle):
+    """ ペイロードを取り出してストアからは解放する
+    """
+    try:
+        return _payloads.pop(handle)
+    except KeyError:
+        raise KeyError('Color payload "{}" was not found.'.format(handle))
+
+
+def release(handle):
+    _payloads.pop(handle, None)
+
+
+def set_face_vertex_colors(obj, colors, faces=None, vertices=None, channel='rgba'):
+    """ HTM_SetFaceVertexColorsをペイロード経由で実行する、Undo可能
+
+    Args:
+        obj(str): 対象オブジェクト
+        colors(np.ndarray): (N,4)か(N,3)のカラー
+        faces(np.ndarray): (N,)のフェースID、Noneならメッシュ全体のフェース頂点順
+        vertices(np.ndarray): (N,)の頂点ID
+        channel(str): 書き込むチャンネル、'rgba'、'g'など
+    """
+    handle = submit(colors, faces, vertices)
+    try:
+        mc.HTM_SetFaceVertexColors(obj, payload=handle, channel=channel)
+    finally:
+        release(handle)
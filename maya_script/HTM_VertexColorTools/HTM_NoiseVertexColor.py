@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_face_vertex_ids, get_face_vertex_colors,
+                                     merge_channels, to_color_array)
+from HTM_Tools.HTM_PerlinNoise import compute_vertex_noise, NOISE_TYPES
+
+
+kShort_flag_scale = '-sc'
+kLong_flag_scale = '-scale'
+kShort_flag_offset = '-of'
+kLong_flag_offset = '-offset'
+kShort_flag_seed = '-sd'
+kLong_flag_seed = '-seed'
+kShort_flag_octaves = '-oc'
+kLong_flag_octaves = '-octaves'
+kShort_flag_lacunarity = '-lc'
+kLong_flag_lacunarity = '-lacunarity'
+kShort_flag_gain = '-gn'
+kLong_flag_gain = '-gain'
+kShort_flag_type = '-ty'
+kLong_flag_type = '-type'
+kShort_flag_time = '-t'
+kLong_flag_time = '-time'
+kShort_flag_channel = '-ch'
+kLong_flag_channel = '-channel'
+
+
+def maya_useNewAPI():
+    pass
+
+
+class HTM_NoiseVertexColor(om2.MPxCommand):
+    """ 頂点のワールド座標からフラクタルノイズを計算して頂点カラーに設定する
+    """
+    kPluginCmdName = 'HTM_NoiseVertexColor'
+
+    def __init__(self):
+        om2.MPxCommand.__init__(self)
+        self.objs = []
+        self.orig_info = [] # Undo用
+
+        self.scale = 0.03
+        self.offset = 0.0
+        self.seed = 0
+        self.octaves = 1
+        self.lacunarity = 2.0
+        self.gain = 0.5
+        self.noise_type = 'fbm'
+        self.time = None
+        self.channel = 'rgb'
+
+    def doIt(self, args):
+        self.parseArguments(args)
+        self.redoIt()
+
+    def redoIt(self):
+        self.orig_info = []
+
+        for obj in self.objs:
+            sel = om2.MSelectionList()
+            sel.add(obj)
+            dag, _ = sel.getComponent(0)
+            fn_mesh = om2.MFnMesh(dag)
+
+            # Undo用情報取得、フェース頂点単位で一括取得
+            faces, vertices = get_face_vertex_ids(fn_mesh)
+            colors_orig = fn_mesh.getFaceVertexColors()
+            self.orig_info.append({'colors': colors_orig,
+                                   'faces': faces.tolist(),
+                                   'vertices': vertices.tolist()})
+
+            # ノイズ計算、指定チャンネルのみ書き換え
+            val = compute_vertex_noise(fn_mesh, self.scale, self.offset, self.seed,
+                                       self.octaves, self.lacunarity, self.gain,
+                                       self.noise_type, self.time)
+            colors = merge_channels(get_face_vertex_colors(fn_mesh), val[vertices],
+                                    self.channel)
+
+            fn_mesh.setFaceVertexColors(to_color_array(colors),
+                                        self.orig_info[-1]['faces'],
+                                        self.orig_info[-1]['vertices'])
+
+    def undoIt(self):
+        for obj, info in zip(self.objs, self.orig_info):
+            sel = om2.MSelectionList()
+            sel.add(obj)
+            dag, _ = sel.getComponent(0)
+            fn_mesh = om2.MFnMesh(dag)
+
+            fn_mesh.setFaceVertexColors(info['colors'], info['faces'], info['vertices'])
+
+    def isUndoable(self):
+        return True
+
+    def parseArguments(self, args):
+        arg_data = om2.MArgDatabase(self.syntax(), args)
+
+        sel_list = arg_data.getObjectList()
+        self.objs = [sel_list.getDagPath(i).fullPathName() for i in range(sel_list.length())]
+
+        if arg_data.isFlagSet(kShort_flag_scale):
+            self.scale = arg_data.flagArgumentDouble(kShort_flag_scale, 0)
+        if arg_data.isFlagSet(kShort_flag_offset):
+            self.offset = arg_data.flagArgumentDouble(kShort_flag_offset, 0)
+        if arg_data.isFlagSet(kShort_flag_seed):
+            self.seed = arg_data.flagArgumentInt(kShort_flag_seed, 0)
+        if arg_data.isFlagSet(kShort_flag_octaves):
+            self.octaves = arg_data.flagArgumentInt(kShort_flag_octaves, 0)
+        if arg_data.isFlagSet(kShort_flag_lacunarity):
+            self.lacunarity = arg_data.flagArgumentDouble(kShort_flag_lacunarity, 0)
+        if arg_data.isFlagSet(kShort_flag_gain):
+            self.gain = arg_data.flagArgumentDouble(kShort_flag_gain, 0)
+        if arg_data.isFlagSet(kShort_flag_type):
+            self.noise_type = arg_data.flagArgumentString(kShort_flag_type, 0)
+        if arg_data.isFlagSet(kShort_flag_time):
+            self.time = arg_data.flagArgumentDouble(kShort_flag_time, 0)
+        if arg_data.isFlagSet(kShort_flag_channel):
+            self.channel = arg_data.flagArgumentString(kShort_flag_channel, 0).lower()
+
+        if self.noise_type not in NOISE_TYPES:
+            raise ValueError('Invalid noise type: {}'.format(self.noise_type))
+        if not self.channel or any(ch not in 'rgba' for ch in self.channel):
+            raise ValueError('Invalid channel: {}'.format(self.channel))
+
+    @staticmethod
+    def syntaxCreator():
+        """
+        Flag:
+            Positional:
+                object names: Str, 省略時は選択中のオブジェクト
+            scale(sc): float
+            offset(of): float
+            seed(sd): int
+            octaves(oc): int
+            lacunarity(lc): float
+            gain(gn): float
+            type(ty): str, 'fbm', 'turbulence', 'ridged'
+            time(t): float, 指定すると4Dノイズ
+            channel(ch): str, 'rgb', 'r', 'g', 'b', 'a'など
+        """
+        syntax = om2.MSyntax()
+        syntax.setObjectType(om2.MSyntax.kSelectionList)
+        syntax.useSelectionAsDefault(True)
+
+        syntax.addFlag(kShort_flag_scale, kLong_flag_scale, om2.MSyntax.kDouble)
+        syntax.addFlag(kShort_flag_offset, kLong_flag_offset, om2.MSyntax.kDouble)
+        syntax.addFlag(kShort_flag_seed, kLong_flag_seed, om2.MSyntax.kLong)
+        syntax.addFlag(kShort_flag_octaves, kLong_flag_octaves, om2.MSyntax.kLong)
+        syntax.addFlag(kShort_flag_lacunarity, kLong_flag_lacunarity, om2.MSyntax.kDouble)
+        syntax.addFlag(kShort_flag_gain, kLong_flag_gain, om2.MSyntax.kDouble)
+        syntax.addFlag(kShort_flag_type, kLong_flag_type, om2.MSyntax.kString)
+        syntax.addFlag(kShort_flag_time, kLong_flag_time, om2.MSyntax.kDouble)
+        syntax.addFlag(kShort_flag_channel, kLong_flag_channel, om2.MSyntax.kString)
+        return syntax
+
+    @staticmethod
+    def cmdCreator():
+        return HTM_NoiseVertexColor()
+
+
+def initializePlugin(mobject):
+    plugin = om2.MFnPlugin(mobject)
+    plugin.registerCommand(HTM_NoiseVertexColor.kPluginCmdName,
+                           HTM_NoiseVertexColor.cmdCreator,
+                           HTM_NoiseVertexColor.syntaxCreator)
+
+
+def uninitializePlugin(mobject):
+    pluginFn = om2.MFnPlugin(mobject)
+    pluginFn.deregisterCommand(HTM_NoiseVertexColor.kPluginCmdName)
@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
-import maya.cmds as mc
+import numpy as np
+
 import maya.api.OpenMaya as om2
 
-import HTM_Tools.HTM_GlobalVariable as g
+import HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload as payload_store
+from HTM_Tools.HTM_ArrayUtil import (get_face_vertex_ids, get_face_vertex_colors,
+                                     merge_channels, from_color_array, to_color_array)
+
+
+kShort_flag_payload = '-pl'
+kLong_flag_payload = '-payload'
+kShort_flag_channel = '-ch'
+kLong_flag_channel = '-channel'
+
 
 def maya_useNewAPI():
     pass
@@ -10,16 +20,21 @@ def maya_useNewAPI():
 
 class HTM_SetFaceVertexColors(om2.MPxCommand):
     """ MFnMesh.setFaceVertexColors()のUndo対応をしたいがために作ったプラグイン
+        カラーはHTM_ColorPayloadに登録したハンドル経由で受け取る
     """
     kPluginCmdName = 'HTM_SetFaceVertexColors'
 
     def __init__(self):
         om2.MPxCommand.__init__(self)
         self.fn_mesh = om2.MFnMesh()
+        self.obj = ''
+        self.payload = None
+        self.channel = 'rgba'
+
+        # Undo用
         self.colors_old = om2.MColorArray()
         self.face_ids_g = []
         self.vtx_ids_g = []
-        self.obj = ''
 
     def doIt(self, args):
         self.parseArguments(args)
@@ -32,19 +47,32 @@ class HTM_SetFaceVertexColors(om2.MPxCommand):
         dag, _ = sel.getComponent(0)
         self.fn_mesh = om2.MFnMesh(dag)
 
-        # Undoのための情報取得
-        self.colors_old = self.fn_mesh.getFaceVertexColors()
-        num_faces = self.fn_mesh.numPolygons
-
-        for i in range(num_faces):
-            vtxs = self.fn_mesh.getPolygonVertices(i)
-            for v in vtxs:
-                self.vtx_ids_g.append(v)
-                self.face_ids_g.append(i)
-
-        self.fn_mesh.setFaceVertexColors(g.HTM_SetFaceVertexColors_colors,
-                                         g.HTM_SetFaceVertexColors_faces,
-                                         g.HTM_SetFaceVertexColors_vertex)
+        # Undoのための情報取得、メッシュ全体のフェース頂点を一括で
+        faces, vertices = get_face_vertex_ids(self.fn_mesh)
+        colors_old = self.fn_mesh.getFaceVertexColors()
+
+        colors = self.payload.colors
+        if self.payload.faces is None:
+            if not len(colors) == len(faces):
+                raise ValueError('Payload length does not match the number of face vertices.')
+            face_ids, vtx_ids = faces.tolist(), vertices.tolist()
+            fv_ids = slice(None)
+            self.colors_old = colors_old
+        else:
+            # 一部だけ書き込む場合は、Undo用にもその分だけ保持する
+            face_ids = self.payload.faces.tolist()
+            vtx_ids = self.payload.vertices.tolist()
+            fv_ids = self.get_face_vertex_index(faces, vertices)
+            self.colors_old = to_color_array(from_color_array(colors_old)[fv_ids])
+        self.face_ids_g = face_ids
+        self.vtx_ids_g = vtx_ids
+
+        # チャンネル指定がある場合は、指定チャンネル以外を元の値で埋める
+        if not self.channel == 'rgba':
+            colors_orig = get_face_vertex_colors(self.fn_mesh)[fv_ids]
+            colors = merge_channels(colors_orig, colors, self.channel)
+
+        self.fn_mesh.setFaceVertexColors(to_color_array(colors), face_ids, vtx_ids)
 
     def undoIt(self):
         self.fn_mesh.setFaceVertexColors(self.colors_old,
@@ -54,16 +82,38 @@ class HTM_SetFaceVertexColors(om2.MPxCommand):
     def isUndoable(self):
         return True
 
-    def parseArguments(self, args):
-        """ Memo: This process, especially arguments has multi use flag, is too heavy.
-                  It should be ideal to use global variable to pass the values to this command.
+    def get_face_vertex_index(self, faces, vertices):
+        """ ペイロードの(フェースID, 頂点ID)がメッシュ全体のフェース頂点の何番目かを求める
         """
+        num_vtx = self.fn_mesh.numVertices
+        keys = faces.astype(np.int64) * num_vtx + vertices
+        order = np.argsort(keys)
+
+        query = self.payload.faces.astype(np.int64) * num_vtx + self.payload.vertices
+        pos = np.searchsorted(keys, query, sorter=order)
+        pos = np.clip(pos, 0, len(keys) - 1)
+        if not (keys[order[pos]] == query).all():
+            raise ValueError('Payload contains face vertices that do not exist on the mesh.')
+
+        return order[pos]
+
+    def parseArguments(self, args):
         arg_data = om2.MArgDatabase(self.syntax(), args)
 
         # MSelectionListで取得される、1個しか扱えないので加工、あと文字列に変換
         sel_list = arg_data.getObjectList()
         self.obj = sel_list.getDagPath(0).fullPathName()
 
+        # ペイロードはここで取り出して、ストアからは解放しておく
+        if not arg_data.isFlagSet(kShort_flag_payload):
+            raise ValueError('-payload flag is required.')
+        self.payload = payload_store.take(arg_data.flagArgumentString(kShort_flag_payload, 0))
+
+        if arg_data.isFlagSet(kShort_flag_channel):
+            self.channel = arg_data.flagArgumentString(kShort_flag_channel, 0).lower()
+            if not self.channel or any(ch not in 'rgba' for ch in self.channel):
+                raise ValueError('Invalid channel: {}'.format(self.channel))
+
     @staticmethod
     def syntaxCreator():
         """ Add arguments, keyword arguments.
@@ -71,13 +121,17 @@ class HTM_SetFaceVertexColors(om2.MPxCommand):
         Flag:
             Positional:
                 shape name: Str
+            payload(pl): str, HTM_ColorPayload.submit()で得たハンドル
+            channel(ch): str, 書き込むチャンネル、'rgba'、'g'など
         """
         syntax = om2.MSyntax()
 
         # Positional Args
         # setObjectTypeした時点でコマンド引数が設定される。オブジェクトはstringでしか渡せない。
-        # syntax.setObjectType(om2.MSyntax.kSelectionList)
         syntax.setObjectType(om2.MSyntax.kSelectionList)
+
+        syntax.addFlag(kShort_flag_payload, kLong_flag_payload, om2.MSyntax.kString)
+        syntax.addFlag(kShort_flag_channel, kLong_flag_channel, om2.MSyntax.kString)
         return syntax
 
     @staticmethod
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import sys
 import time
-import random
+
+import numpy as np
 
 from PySide2.QtWidgets import *
 from PySide2.QtCore import *
@@ -14,8 +15,13 @@ from maya.OpenMayaUI import MQtUtil
 from maya import OpenMayaUI as omui
 from maya.app.general.mayaMixin import MayaQWidgetBaseMixin
 
-import HTM_Tools.HTM_GlobalVariable as g
 from HTM_Tools.HTM_Util import load_plugin
+from HTM_Tools.HTM_ArrayUtil import (CHANNEL_TABLE, get_face_vertex_colors,
+                                     get_face_vertex_uv_ids, get_uvs)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorLayers import apply_to_layer
+from HTM_Tools.HTM_Curvature import bake_curvature
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorAdjust import adjust_selection
 
 python_version = sys.version_info.major
 win_title = 'HTM Vertex Color Tools'
@@ -107,8 +113,33 @@ class HTM_VertexColorTools(MayaQWidgetBaseMixin, QMainWindow):
 
         pb_set_rand = QPushButton('Set Random Ch-B')
         pb_set_rand.clicked.connect(self.set_random_color_from_uv)
+
+        pb_set_cavity = QPushButton('Set Cavity Ch-R')
+        pb_set_cavity.clicked.connect(lambda:self.set_curvature_color('cavity'))
+        # カラーレイヤーに書き込むかどうか、OFFならカラーセットを直接上書き
+        self.chb_use_layer = QCheckBox('Use Color Layers')
+        self.chb_use_layer.setChecked(True)
+
         main_layout.addWidget(pb_set_grad)
         main_layout.addWidget(pb_set_rand)
+        main_layout.addWidget(pb_set_cavity)
+        main_layout.addWidget(self.chb_use_layer)
+        main_layout.addWidget(QHLine()) # separalater
+
+        # 色調補正、ソフト選択があればウェイトでマスクする
+        pb_apply_curve = QPushButton('Apply Gradient as Curve')
+        pb_apply_curve.clicked.connect(self.apply_gradient_curve)
+
+        hl_math = QHBoxLayout()
+        self.le_math = QLineEdit('r = 1 - r')
+        pb_math = QPushButton('Channel Math')
+        pb_math.clicked.connect(lambda:adjust_selection('math', channel='rgba',
+                                                        expression=self.le_math.text()))
+        hl_math.addWidget(self.le_math)
+        hl_math.addWidget(pb_math)
+
+        main_layout.addWidget(pb_apply_curve)
+        main_layout.addLayout(hl_math)
         main_layout.addWidget(QHLine()) # separalater
 
         # 表示切替
@@ -137,8 +168,9 @@ class HTM_VertexColorTools(MayaQWidgetBaseMixin, QMainWindow):
         if not sel:
             om2.MGlobal.displayWarning('Nothing is selected.')
 
+        layer = 'UV Random' if self.chb_use_layer.isChecked() else None
         for s in sel:
-            self.set_gradient_color_from_uv_main(s, mode='random', channel='b')
+            self.set_gradient_color_from_uv_main(s, mode='random', channel='b', layer=layer)
 
 
     def set_gradient_color_from_uv(self):
@@ -147,12 +179,43 @@ class HTM_VertexColorTools(MayaQWidgetBaseMixin, QMainWindow):
         if not sel:
             om2.MGlobal.displayWarning('Nothing is selected.')
 
+        layer = 'UV Gradient' if self.chb_use_layer.isChecked() else None
         for s in sel:
-            self.set_gradient_color_from_uv_main(s, mode='gradient', channel='g')
+            self.set_gradient_color_from_uv_main(s, mode='gradient', channel='g', layer=layer)
+
+
+    def set_curvature_color(self, mode='cavity', channel='r'):
+        sel = mc.ls(sl=True, tr=True)
+        if not sel:
+            om2.MGlobal.displayWarning('Nothing is selected.')
+            return
+
+        layer = 'Curvature' if self.chb_use_layer.isChecked() else None
+        bake_curvature(sel, mode=mode, channel=channel, layer=layer)
+
+
+    def apply_gradient_curve(self, channel='rgb'):
+        """ グラデーションコントロールをカーブとして選択中の頂点カラーに適用
+        """
+        lut_x, lut_y = self.sample_gradient_ctrl()
+        adjust_selection('curve', channel=channel, lut_x=lut_x, lut_y=lut_y)
 
 
-    def set_gradient_color_from_uv_main(self, obj, mode, use_gradient_ctrl=True, channel='r'):
+    def sample_gradient_ctrl(self, num_samples=256):
+        """ グラデーションコントロールを一度だけサンプリングしてLUTにする
+
+        Returns:
+            np.ndarray, np.ndarray: (num_samples,)の入力値と出力値
+        """
+        lut_x = np.linspace(0.0, 1.0, num_samples)
+        lut_y = np.array([mc.gradientControlNoAttr('gc_htm_vtx_clr_tools', q=True, valueAtPoint=x)
+                          for x in lut_x], dtype=np.float64)
+        return lut_x, lut_y
+
+    def set_gradient_color_from_uv_main(self, obj, mode, use_gradient_ctrl=True, channel='r',
+                                        layer=None):
         """ とあるアセット用の専用処理
+            layerを指定した場合はカラーレイヤーとして非破壊で設定する
         """
         sel = om2.MSelectionList()
         sel.add(obj)
@@ -160,93 +223,61 @@ class HTM_VertexColorTools(MayaQWidgetBaseMixin, QMainWindow):
         dag, _ = sel.getComponent(0)
         fn_mesh = om2.MFnMesh(dag)
 
+        sta = time.time()
+
         # UVシェルのID取得等
         num_shells, shell_ids = fn_mesh.getUvShellsIds()
+        shell_ids = np.array(shell_ids, dtype=np.int64)
 
-        # 元のカラー
-        colors_orig = fn_mesh.getFaceVertexColors()
-        print(len(colors_orig))
+        # 元のカラー、フェース頂点ごとのUV ID
+        colors_orig = get_face_vertex_colors(fn_mesh)
+        fv_uv_ids = get_face_vertex_uv_ids(fn_mesh)
 
         # 全UV値取得
-        u_vals, v_vals = fn_mesh.getUVs()
+        uvs = get_uvs(fn_mesh)
 
-        # UVシェル事に所属UVIDを取得
-        shell_to_uvs = [[-1] for _ in range(num_shells)]
-        for i, shell_id in enumerate(shell_ids):
-            if shell_to_uvs[shell_id][0] == -1:
-                shell_to_uvs[shell_id][0] = i
-            else:
-                shell_to_uvs[shell_id].append(i)
-
-        colors = om2.MColorArray().setLength(fn_mesh.numUVs())
         if mode == 'gradient':
+            # UVシェルごとのVの最小値・最大値、シェルID順に並べてまとめて集計
+            order = np.argsort(shell_ids, kind='stable')
+            v_sorted = uvs[order, 1]
+            counts = np.bincount(shell_ids, minlength=num_shells)
+            starts = np.cumsum(counts) - counts
+            has_uv = counts > 0
+
+            v_min = np.zeros(num_shells)
+            v_max = np.ones(num_shells)
+            v_min[has_uv] = np.minimum.reduceat(v_sorted, starts[has_uv])
+            v_max[has_uv] = np.maximum.reduceat(v_sorted, starts[has_uv])
+
             # UVが、所属しているUVのシェルのどの位置にあるかで頂点カラーを決める
-            for uvs in shell_to_uvs:
-                bb_temp = om2.MBoundingBox()
-                # UVシェルごとの処理
-
-                for uv in uvs:
-                    # BBに対してMPointを投げ込んで拡張していく
-                    point = om2.MPoint(u_vals[uv], v_vals[uv])
-                    bb_temp.expand(point)
-                max = bb_temp.max
-                min = bb_temp.min
-
-                for uv in uvs:
-                    # BBの最大値・最小値の中での現在のUV値の割合をそのままカラーに
-                    v_pos = v_vals[uv]
-                    ratio = (v_pos - min.y) / (max.y - min.y)
-                    if use_gradient_ctrl:
-                        remapped_ratio = mc.gradientControlNoAttr('gc_htm_vtx_clr_tools', q=True, valueAtPoint=ratio)
-                        colors[uv] = (remapped_ratio, remapped_ratio, remapped_ratio, 1)
-                    else:
-                        colors[uv] = (ratio, ratio, ratio, 1)
+            v_range = v_max - v_min
+            v_range[v_range == 0.0] = 1.0
+            values = (uvs[:, 1] - v_min[shell_ids]) / v_range[shell_ids]
+
+            if use_gradient_ctrl:
+                lut_x, lut_y = self.sample_gradient_ctrl()
+                values = np.interp(values, lut_x, lut_y)
 
         elif mode == 'random':
             # UVシェル事に0.0-1.0のランダムな値を
-            for uvs in shell_to_uvs:
-                rand_val = random.random()
-                for uv in uvs:
-                    colors[uv] = (rand_val, rand_val, rand_val, 1)
-
-        it_f = om2.MItMeshPolygon(dag)
-        it_v = om2.MItMeshVertex(dag)
-        it_fv = om2.MItMeshFaceVertex(dag)
-
-        # フェースIDと、それに対応する頂点ID
-        # フェース数 * 頂点数分、配列要素がある
-        faces = []
-        vertices = []
-        uvs_orig = []
-        sta = time.time()
-        colors_new = om2.MColorArray()
-        for i, fv in enumerate(it_fv):
-            faces.append(fv.faceId())
-            vertices.append(fv.vertexId())
-            uvs_orig.append(fv.getUVIndex())
-            colors_new.append(colors[uvs_orig[-1]])
-
-        # この処理流石に冗長過ぎて...どうにかしたい
-        if channel == 'r':
-            for cn, co in zip(colors_new, colors_orig):
-                cn.g = co.g
-                cn.b = co.b
-        if channel == 'g':
-            for cn, co in zip(colors_new, colors_orig):
-                cn.r = co.r
-                cn.b = co.b
-        elif channel == 'b':
-            for cn, co in zip(colors_new, colors_orig):
-                cn.r = co.r
-                cn.g = co.g
+            values = np.random.random(num_shells)[shell_ids]
+
+        # UVの無いフェース頂点は元の値のまま
+        col = CHANNEL_TABLE[channel]
+        fv_values = colors_orig[:, col].copy()
+        has_fv_uv = fv_uv_ids >= 0
+        fv_values[has_fv_uv] = values[fv_uv_ids[has_fv_uv]]
+        colors_new = np.zeros((len(fv_values), 4), dtype=np.float32)
+        colors_new[:, col] = fv_values
 
         end = time.time()
         print(f'// Set Color : {end - sta:3f} Sec')
 
-        g.HTM_SetFaceVertexColors_colors = colors_new
-        g.HTM_SetFaceVertexColors_faces = faces
-        g.HTM_SetFaceVertexColors_vertex = vertices
-        mc.HTM_SetFaceVertexColors(obj)
+        if layer:
+            apply_to_layer(obj, layer, colors_new, channel=channel)
+        else:
+            # 指定チャンネルのみの書き込みはコマンド側で行う
+            set_face_vertex_colors(obj, colors_new, channel=channel)
 
     def change_display_channel(self, channel='rgb'):
         """ 特定チャンネルのみ表示
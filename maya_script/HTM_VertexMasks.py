@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+""" 厚み(thickness)と他メッシュへの近さ(proximity)のマスクを頂点カラーに書き込む
+    どちらも頂点から半球方向にレイを飛ばし、ヒットまでの距離の平均から求める
+"""
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (CHANNEL_TABLE, get_dag_path, get_points,
+                                     get_face_vertex_ids)
+from HTM_Tools.HTM_RayBVH import build_mesh_bvh
+from HTM_Tools.HTM_VertexAO import (cosine_hemisphere_dirs, get_scene_occluders,
+                                    get_vertex_normals, map_vertex_chunks)
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorPayload import set_face_vertex_colors
+from HTM_Tools.HTM_VertexColorTools.HTM_ColorLayers import apply_to_layer
+
+
+MASK_TYPES = ('thickness', 'proximity')
+
+
+# ---------------------------------------------------------
+# マスク計算、ワーカープロセス側でも呼ばれる
+# ---------------------------------------------------------
+def hemisphere_distance(bvh, points, normals, vertex_ids, samples=32, max_distance=10.0,
+                        seed=0, bias=1e-3):
+    """ 法線方向の半球にレイを飛ばし、最も近いヒットまでの距離の平均を求める
+
+    Args:
+        bvh(TriangleBVH): レイを飛ばす対象のBVH
+        points(np.ndarray): (N,3)のワールド座標
+        normals(np.ndarray): (N,3)のレイを飛ばす半球の向き
+        vertex_ids(np.ndarray): (N,)の頂点ID、サンプルパターンの決定に使う
+        samples(int): 頂点あたりのレイ数
+        max_distance(float): 最大距離、ミスしたレイはこの距離として扱う
+        seed(int): シード値
+        bias(float): 自己交差を避けるためのレイの始点のオフセット
+
+    Returns:
+        np.ndarray: (N,)の0.0(すぐにヒット)～1.0(最大距離まで何もない)
+    """
+    dirs = cosine_hemisphere_dirs(normals, vertex_ids, samples, seed)
+    origins = np.repeat(points + normals * bias, samples, axis=0)
+
+    t_hit, _, _ = bvh.intersect_closest(origins, dirs.reshape(-1, 3), max_distance)
+    t_hit = np.minimum(t_hit, max_distance) / max_distance
+    return t_hit.reshape(-1, samples).mean(axis=1)
+
+
+def compute_thickness(bvh, points, normals, vertex_ids, samples=32, max_distance=10.0,
+                      seed=0, bias=1e-3):
+    """ 法線と逆向きにメッシュの内側へレイを飛ばして厚みを求める
+
+    Returns:
+        np.ndarray: (N,)の0.0(薄い)～1.0(max_distance以上の厚み)
+    """
+    return hemisphere_distance(bvh, points, -normals, vertex_ids, samples, max_distance,
+                               seed, bias)
+
+
+def compute_proximity(bvh, points, normals, vertex_ids, samples=32, max_distance=10.0,
+                      seed=0, bias=1e-3):
+    """ 法線方向に他のメッシュへレイを飛ばして近さを求める
+
+    Returns:
+        np.ndarray: (N,)の0.0(max_distance以内に何もない)～1.0(接している)
+    """
+    return 1.0 - hemisphere_distance(bvh, points, normals, vertex_ids, samples, max_distance,
+                                     seed, bias)
+
+
+# ---------------------------------------------------------
+# Maya側の処理
+# ---------------------------------------------------------
+def compute_vertex_mask(obj, mask_type='thickness', targets=None, samples=32,
+                        max_distance=10.0, seed=0, bias=None, max_workers=None):
+    """ 1オブジェクト分のマスクを計算
+
+    Args:
+        obj(str): 対象オブジェクト
+        mask_type(str): 'thickness'か'proximity'
+        targets(list[str]): proximityでレイを飛ばす対象、Noneならシーン内の自分以外の表示メッシュ
+        samples(int): 頂点あたりのレイ数
+        max_distance(float): 最大距離
+        seed(int): シード値
+        bias(float): レイの始点のオフセット、Noneならオブジェクトの大きさから決める
+        max_workers(int): ワーカー数、1ならMaya内で処理する
+
+    Returns:
+        np.ndarray: (V,)の0.0～1.0
+    """
+    assert mask_type in MASK_TYPES, 'invalid mask type was passed.'
+    fn_mesh = om2.MFnMesh(get_dag_path(obj))
+    shape = fn_mesh.fullPathName()
+    points = get_points(fn_mesh, om2.MSpace.kWorld)
+    normals = get_vertex_normals(fn_mesh)
+
+    if bias is None:
+        bias = np.linalg.norm(points.max(axis=0) - points.min(axis=0)) * 1e-5 if len(points) else 1e-5
+
+    if mask_type == 'thickness':
+        bvh, _ = build_mesh_bvh([shape])
+        func = compute_thickness
+    else:
+        if targets is None:
+            targets = get_scene_occluders()
+        targets = [t for t in targets if not om2.MFnMesh(get_dag_path(t)).fullPathName() == shape]
+        if not targets:
+            return np.zeros(len(points))
+        bvh, _ = build_mesh_bvh(targets)
+        func = compute_proximity
+
+    return map_vertex_chunks(func, bvh, points, normals,
+                             (samples, max_distance, seed, bias), max_workers)
+
+
+def bake_vertex_mask(objs, mask_type='thickness', targets=None, samples=32, max_distance=10.0,
+                     seed=0, max_workers=None, channel='r', layer=None):
+    """ 厚み、近さのマスクを頂点カラーに書き込む
+
+    Args:
+        objs(list[str]): 対象オブジェクト
+        mask_type(str): 'thickness'か'proximity'
+        channel(str): 書き込むチャンネル
+        layer(str): カラーレイヤー名、Noneならカラーセットを直接上書き
+    """
+    cols = [CHANNEL_TABLE[ch] for ch in channel]
+    for obj in objs:
+        mask = compute_vertex_mask(obj, mask_type, targets, samples, max_distance, seed,
+                                   max_workers=max_workers)
+
+        fn_mesh = om2.MFnMesh(get_dag_path(obj))
+        _, vertices = get_face_vertex_ids(fn_mesh)
+        colors = np.zeros((len(vertices), 4), dtype=np.float32)
+        colors[:, cols] = mask[vertices, np.newaxis]
+
+        if layer is None:
+            set_face_vertex_colors(obj, colors, channel=channel)
+        else:
+            apply_to_layer(obj, layer, colors, channel=channel)
+
+
+def main(mask_type='thickness', samples=32, max_distance=10.0, channel='r'):
+    sel = mc.ls(sl=True, tr=True)
+    if not sel:
+        om2.MGlobal.displayWarning('Nothing is selected.')
+        return
+
+    bake_vertex_mask(sel, mask_type, samples=samples, max_distance=max_distance, channel=channel)
+
+
+if '__main__' == __name__:
+    main()
@@ -6,8 +6,14 @@ import maya.cmds as mc
 import maya.api.OpenMaya as om2
 import maya.app.renderSetup.views.renderSetupWindow as rs_wind;
 
+from HTM_Tools.HTM_TextureSampler import texture_to_vertex_colors
+from HTM_Tools.HTM_BakePipeline import BakePipeline, BakeJob, prepare_bake_uv, watch_file
+
 debug = True
 
+# 実行中のベイクパイプライン
+pipeline = None
+
 
 def get_self_path():
     """ aovsのプリセットのパスを指定
@@ -106,27 +112,8 @@ def guess_crt_prj():
 def create_working_uv(sel):
     """ ベイクに使用するためのUVの生成
     """
-    working_uv = 'xxx_ao_bake'
-
     for s in sel:
-        all_uvs = mc.polyUVSet(s, q=True, allUVSets=True)
-
-        if not working_uv in all_uvs:
-            mc.polyUVSet(s, create=True, uvSet=working_uv)
-
-        # UVのコピーはあえて毎回やる、内容が変わっていることがあるあるなので
-        mc.polyUVSet(s, copy=True, newUVSet=working_uv)
-        try:
-            # 最初からao_bakeセットが選択されているとエラーが出る
-            # ただ、どのUVSetがデフォルトのものかわからないので、対策どうするか考える
-            mc.polyUVSet(s, currentUVSet=True, uvSet=working_uv)
-        except:
-            pass
-
-        # UVのレイアウトし直し
-        padding = 1.0 / 2048 * 10 # 2048x2048のテクスチャで10ピクセル間隔をあけて配置する場合
-        cmd = 'mc.u3dLayout("{0}.f[*]", res=1024, scl=1, spc={1}, mar={1}, box=[0,1,0,1])'.format(s, padding)
-        mc.evalDeferred(cmd, lp=True)
+        prepare_bake_uv(s, 'xxx_ao_bake')
 
 
 def create_ai_mat():
@@ -176,13 +163,34 @@ def create_ai_mat():
     return ai_mat
 
 
+def render_stage(job):
+    """ ベイク実行、テクスチャの書き出しが終わったら完了するFutureを返す
+    """
+    # 前回のベイク結果が残っていると書き出し完了と判定されてしまうので消しておく
+    if os.path.exists(job.data['texture']):
+        os.remove(job.data['texture'])
+
+    mc.select(job.obj, r=True)
+    mc.arnoldRenderToTexture(f=job.data['temp_dir'], filter='gaussian', aa_samples=3,
+                             ee=True, r=2048, aov=True, shader=job.data['shader'],
+                             uvs='xxx_ao_bake')
+    return watch_file(job.data['texture'])
+
+
+def import_stage(job):
+    """ import texture as vertex color
+    """
+    texture_to_vertex_colors(job.obj, job.data['result'], uv_set='xxx_ao_bake',
+                             average_seams=True, channel='rgb')
+
+
 def exec_bake():
     """ ベイク処理諸々実行
+        オブジェクトごとにUV作成、ベイク、インポートをジョブとして進める
     """
-    sel = mc.ls(sl=True, tr=True)
+    global pipeline
 
-    # ベイク用のUV作成
-    create_working_uv(sel)
+    sel = mc.ls(sl=True, tr=True)
 
     # レンダー設定、重い処理じゃないので毎回設定しちゃう
     set_render_settings()
@@ -190,27 +198,17 @@ def exec_bake():
     # オーバーライド用マテリアル生成
     ai_mat = create_ai_mat()
 
-    shapes = mc.listRelatives(sel, shapes=True, ni=True)
-    tex_pathes = [shape + '.custom_AO.exr' for shape in shapes]
-
-    # ベイク実行
     tex_save_path = gettempdir()
-    mc.arnoldRenderToTexture(f=tex_save_path, filter='gaussian', aa_samples=3,
-                             ee=True, r=2048, aov=True, shader=ai_mat,
-                             uvs='xxx_ao_bake')
-
-    mc.select(cl=True)
-    for tex_path, s in zip(tex_pathes, sel):
-        mc.select(s, r=True)
-        tex_baked = tex_save_path + '\\' + tex_path
-
-        # import texture as vertex colorf
-        #file = r'C:\Users\hiruk\Desktop\T_alpha_test.tga'
-        file = tex_baked
-
-        eval('PaintVertexColorTool; toolPropertyWindow;')
-        cmd = 'mc.artAttrPaintVertexCtx("{}", e=True, importfileload=r"{}")'.format(mc.currentCtx(), file)
-        mc.evalDeferred(cmd, lp=True)
+    pipeline = BakePipeline()
+    for s in sel:
+        shape = mc.listRelatives(s, shapes=True, ni=True)
+        if not shape:
+            continue
+        stages = [('uv', lambda job: prepare_bake_uv(job.obj, 'xxx_ao_bake')),
+                  ('render', render_stage),
+                  ('import', import_stage)]
+        pipeline.submit(BakeJob(s, stages, shader=ai_mat, temp_dir=tex_save_path,
+                                texture=os.path.join(tex_save_path, shape[0] + '.custom_AO.exr')))
 
 
 def create_window():
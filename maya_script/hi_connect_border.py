@@ -120,13 +120,13 @@ class ConnectBorder:
         """
         # 転送元頂点のスキンクラスターを取得
         src_mesh = src_vtx.split('.')[0]
-        src_history = mc.listHistory(src_mesh, pruneDagObjects=True)
-        src_skin_cluster = mc.ls(src_history, type='skinCluster')[0]
+        src_history = mc.listHistory(src_mesh, pruneDagObjects=True) or []
+        src_skin_cluster = (mc.ls(src_history, type='skinCluster') or [None])[0]
 
         # 転送先頂点のスキンクラスターを取得
         dst_mesh = dst_vtx.split('.')[0]
-        dst_history = mc.listHistory(dst_mesh, pruneDagObjects=True)
-        dst_skin_cluster = mc.ls(dst_history, type='skinCluster')[0]
+        dst_history = mc.listHistory(dst_mesh, pruneDagObjects=True) or []
+        dst_skin_cluster = (mc.ls(dst_history, type='skinCluster') or [None])[0]
 
         if not src_skin_cluster:
             om2.MGlobal.displayError(f'スキンクラスターが見つかりませんでした（転送元: {src_vtx}）')
@@ -140,9 +140,9 @@ class ConnectBorder:
         src_joints = mc.skinCluster(src_skin_cluster, query=True, influence=True)
         src_weights = mc.skinPercent(src_skin_cluster, src_vtx, query=True, value=True)
 
-        # 転送先の頂点にスキンウェイトを適用
-        for joint, weight in zip(src_joints, src_weights):
-            mc.skinPercent(dst_skin_cluster, dst_vtx, transformValue=[(joint, weight)])
+        # 転送先の頂点にスキンウェイトを適用、1回ずつ設定すると正規化で値がずれるのでまとめて渡す
+        mc.skinPercent(dst_skin_cluster, dst_vtx,
+                       transformValue=list(zip(src_joints, src_weights)))
 
 
 
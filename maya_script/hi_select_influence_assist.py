@@ -2,6 +2,9 @@ import maya.cmds as mc
 import maya.mel as mel
 import maya.api.OpenMaya as om2
 
+from HTM_Tools.HTM_InfluenceIndex import get_influence_index
+from HTM_Tools.HTM_SkinWeightQuery import rank_selection_influences
+
 class InfluenceTools:
     """
     """
@@ -21,14 +24,14 @@ class InfluenceTools:
 
 
     def get_skin_cluster(self, node, weighted_only=False):
-        sc = mel.eval('findRelatedSkinCluster("{}")'.format(node))
-        #shape = mc.listRelatives(node, s=True, ni=True)
-        #sc = mc.ls(mc.listConnections(shape, s=True, d=False), type='skinCluster')
+        # Skin clusters and influences are looked up from the cached per-scene index.
+        index = get_influence_index()
+        sc = index.skin_cluster_of(node)
         if sc:
             if weighted_only:
                 infs = mc.skinCluster(sc, q=True, wi=True)
             else:
-                infs = mc.skinCluster(sc, q=True, inf=True)
+                infs = index.influence_names(sc)
         else:
             infs = []
 
@@ -49,11 +52,8 @@ class InfluenceTools:
 
 
     def check_influences(self):
-        infs_paint_weight_ui = mc.treeView(self.paint_weight_ui, q=True, item=True, ch='')
-
-        for inf in self.infs_this_tool[:]:
-            if inf not in infs_paint_weight_ui:
-                self.infs_this_tool.remove(inf)
+        infs_paint_weight_ui = set(mc.treeView(self.paint_weight_ui, q=True, item=True, ch='') or [])
+        self.infs_this_tool = [inf for inf in self.infs_this_tool if inf in infs_paint_weight_ui]
 
 
     def sel_items(self):
@@ -97,13 +97,11 @@ class InfluenceTools:
         else:
             joints = mc.ls(sl=True, type='joint', l=True)
 
+        if not joints:
+            return
 
         # Remove joints that is not used as influences.
-        infs_temp = []
-        for j in joints:
-            sc = mc.listConnections(j, d=True, s=False, type='skinCluster')
-            if sc:
-                infs_temp.append(j)
+        infs_temp = get_influence_index().filter_influences(joints)
 
         self.infs_this_tool = [inf.split('|')[-1] for inf in infs_temp]
 
@@ -122,21 +120,23 @@ class InfluenceTools:
             mc.textScrollList(self.tsl_name, e=True, a=inf)
 
 
-    def add_items(self):
-        items = mc.textScrollList(self.tsl_name, q=True, si=True)
+    def get_items_from_components(self, sort_by='total'):
+        # List influences that actually weight the selected vertices, heaviest first.
+        mc.textScrollList(self.tsl_name, e=True, ra=True)
 
-        joints = mc.ls(sl=True, type='joint')
-        for j in joints[:]:
-            if j in items:
-                joints.remove(j)
+        index = get_influence_index()
+        ranking = rank_selection_influences(sort_by)
+        self.infs_this_tool = [index.partial_names.get(inf, inf.split('|')[-1])
+                               for inf, _, _ in ranking]
+        for inf in self.infs_this_tool:
+            mc.textScrollList(self.tsl_name, e=True, a=inf)
 
-        influences_temp = []
-        for j in joints:
-            sc = mc.listConnections(j, d=True, s=False, type='skinCluster')
-            if sc:
-                influences_temp.append(j)
 
-        self.infs_this_tool = influences_temp
+    def add_items(self):
+        items = set(mc.textScrollList(self.tsl_name, q=True, si=True) or [])
+        joints = [j for j in mc.ls(sl=True, type='joint') if j not in items]
+
+        self.infs_this_tool = get_influence_index().filter_influences(joints)
         for inf in self.infs_this_tool:
             mc.textScrollList(self.tsl_name, e=True, a=inf)
 
@@ -156,9 +156,10 @@ def hi_influence_select_tools():
     inf_tools.tsl_name = mc.textScrollList(h=300, w=306, ams=False, sc=inf_tools.sel_items)
 
     mc.text(l = '■ Edit Influence List', fn = 'boldLabelFont')
-    mc.rowLayout(nc=3, ad3=3)
+    mc.rowLayout(nc=4, ad4=4)
     mc.button(label='Get', c=inf_tools.get_items)
     mc.button(label='Get (Hierarchy)', c=lambda *args:inf_tools.get_items(True))
+    mc.button(label='Get (Vertices)', c=lambda *args:inf_tools.get_items_from_components())
     mc.button(label='Add', c=inf_tools.add_items)
     mc.setParent('..')
     mc.button(label='Clear', c=inf_tools.clear_items)
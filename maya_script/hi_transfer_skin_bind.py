@@ -1,43 +1,172 @@
-def transfer_skin_bind(copymode='ClosestPoint'):
+import numpy as np
+
+import maya.cmds as mc
+import maya.api.OpenMaya as om2
+
+from HTM_Tools.HTM_ArrayUtil import (get_dag_path, get_points, get_face_vertex_ids,
+                                     get_triangle_face_vertices, get_face_vertex_uv_ids,
+                                     get_uvs, get_vertex_uvs)
+from HTM_Tools.HTM_RayBVH import TriangleBVH, MeshProjector, nearest_point_ids
+from HTM_Tools.HTM_Util import undo_ctx, load_plugin
+from HTM_Tools.HTM_SkinWeights import get_skin_cluster, get_skin_weights, get_influences
+from HTM_Tools.HTM_SkinWeightPayload import apply_skin_weights
+from HTM_Tools.HTM_VertexAO import get_vertex_normals
+
+
+# copySkinWeights's surface association names -> internal mode
+COPY_MODES = {
+    'closestpoint': 'closestPoint',
+    'raycast': 'rayCast',
+    'uv': 'uv',
+    'closestcomponent': 'closestComponent',
+}
+
+
+def associate_closest_point(fn_mesh_src, points):
+    """ Find the closest source triangle of each point.
+
+    Returns:
+        np.ndarray, np.ndarray: (N,3) source vertex ids, (N,3) barycentric weights
+    """
+    _, vertices = get_face_vertex_ids(fn_mesh_src)
+    _, tri_fv = get_triangle_face_vertices(fn_mesh_src)
+    tri_vertices = vertices[tri_fv]
+
+    bvh = TriangleBVH(get_points(fn_mesh_src, om2.MSpace.kWorld)[tri_vertices])
+    _, tri, bary = bvh.closest_point(points)
+    return tri_vertices[tri], bary
+
+
+def associate_ray_cast(fn_mesh_src, fn_mesh_dst, points):
+    """ Cast rays along both sides of the destination normals,
+        points which missed fall back to the closest point.
+    """
+    projector = MeshProjector(fn_mesh_src.fullPathName())
+    return projector.project(points, get_vertex_normals(fn_mesh_dst))
+
+
+def associate_uv(fn_mesh_src, fn_mesh_dst, points, src_uv_set=None, dst_uv_set=None):
+    """ Find the closest source UV triangle of each destination vertex UV,
+        vertices without UVs fall back to the closest point.
+    """
+    _, vertices = get_face_vertex_ids(fn_mesh_src)
+    _, tri_fv = get_triangle_face_vertices(fn_mesh_src)
+    tri_uv_ids = get_face_vertex_uv_ids(fn_mesh_src, src_uv_set)[tri_fv]
+    has_uv = (tri_uv_ids >= 0).all(axis=1)
+    tri_vertices = vertices[tri_fv][has_uv]
+
+    # Flat triangles on the z=0 plane
+    uv_tris = np.zeros((len(tri_vertices), 3, 3))
+    uv_tris[:, :, :2] = get_uvs(fn_mesh_src, src_uv_set)[tri_uv_ids[has_uv]]
+
+    dst_uvs, valid = get_vertex_uvs(fn_mesh_dst, dst_uv_set)
+    src_ids = np.zeros((len(points), 3), dtype=np.int64)
+    bary = np.zeros((len(points), 3))
+
+    if len(uv_tris) and valid.any():
+        _, tri, bary[valid] = TriangleBVH(uv_tris).closest_point(
+            np.column_stack([dst_uvs[valid], np.zeros(valid.sum())]))
+        src_ids[valid] = tri_vertices[tri]
+    else:
+        valid[:] = False
+
+    if not valid.all():
+        src_ids[~valid], bary[~valid] = associate_closest_point(fn_mesh_src, points[~valid])
+    return src_ids, bary
+
+
+def associate_closest_component(fn_mesh_src, points):
+    """ Use the weights of the closest source vertex as is.
+    """
+    ids, _ = nearest_point_ids(get_points(fn_mesh_src, om2.MSpace.kWorld), points)
+    return ids[:, np.newaxis], np.ones((len(points), 1))
+
+
+def transfer_skin_weights(src, dst, copymode='closestPoint', max_influences=None,
+                          src_uv_set=None, dst_uv_set=None, threshold=1e-4):
+    """ Transfer skin weights from src to dst by interpolating the sparse weight rows
+        of the associated source vertices. Weights are never densified over all
+        influences except for the chunked setWeights buffer.
+        Weights are written through the undoable HTM_SetSkinWeights command, so the
+        plugin has to be loaded beforehand.
+
+    Param:
+        src(str): source mesh with skinCluster
+        dst(str): destination mesh with skinCluster
+        copymode(str): 'closestPoint', 'rayCast', 'uv', 'closestComponent'
+        max_influences(int): max influences per vertex, None uses src's maxInfluences
+        src_uv_set(str): uv set of src for 'uv' mode, None uses the current one
+        dst_uv_set(str): uv set of dst for 'uv' mode, None uses the current one
+        threshold(float): weights below this value are pruned
+
+    Return:
+        list[str]: influences which were not found on dst
+    """
+    mode = COPY_MODES.get(copymode.lower())
+    assert mode is not None, 'invalid copymode was passed.'
+
+    src_sc, src_fn_sc = get_skin_cluster(src)
+    _, dst_fn_sc = get_skin_cluster(dst)
+    if max_influences is None and mc.getAttr(src_sc + '.maintainMaxInfluences'):
+        max_influences = mc.getAttr(src_sc + '.maxInfluences')
+
+    fn_mesh_src = om2.MFnMesh(get_dag_path(src))
+    fn_mesh_dst = om2.MFnMesh(get_dag_path(dst))
+    points = get_points(fn_mesh_dst, om2.MSpace.kWorld)
+
+    if mode == 'closestPoint':
+        src_ids, bary = associate_closest_point(fn_mesh_src, points)
+    elif mode == 'rayCast':
+        src_ids, bary = associate_ray_cast(fn_mesh_src, fn_mesh_dst, points)
+    elif mode == 'uv':
+        src_ids, bary = associate_uv(fn_mesh_src, fn_mesh_dst, points, src_uv_set, dst_uv_set)
+    else:
+        src_ids, bary = associate_closest_component(fn_mesh_src, points)
+
+    weights = get_skin_weights(src, src_fn_sc).blend(src_ids, bary)
+    weights.prune(max_influences, threshold).normalize()
+
+    mapping = weights.remap(get_influences(dst_fn_sc))
+    missing = [weights.influences[i] for i in np.unique(weights.indices) if mapping[i] < 0]
+    apply_skin_weights(dst, weights)
+    return missing
+
+
+@undo_ctx
+def transfer_skin_bind(copymode='closestPoint'):
     """ Smooth binding dst object using the same option and influences of src object
+        Binding and the weight transfer are undone in one step.
 
     Param:
-        mode(str):'closestPoint', 'rayCast', 'uv', 'closestCompnent'
+        mode(str):'closestPoint', 'rayCast', 'uv', 'closestComponent'
     """
     sel = mc.ls(sl=True, l=True, type='transform')
+    if not len(sel) == 2:
+        om2.MGlobal.displayError('Please select valid two objects (source, distination).')
+        return
 
-    try:
-        src, dst = sel[0], sel[1]
-        src_sc, src_inf, _, _ = get_skin_related_val(src)
-        src_map = mc.polyUVSet(src, q=True, cuv=True)[0]
+    src, dst = sel[0], sel[1]
+    src_sc, _ = get_skin_cluster(src)
+    if src_sc is None:
+        om2.MGlobal.displayError('{} has no skinCluster.'.format(src))
+        return
+    src_inf = mc.skinCluster(src_sc, q=True, inf=True)
 
-        # Get value to be used for binding option.
-        max_inf = mc.getAttr(src_sc + '.maxInfluences')
-        normalize_weights = mc.getAttr(src_sc + '.normalizeWeights')
-        maintain_max_inf = mc.getAttr(src_sc + '.maintainMaxInfluences')
+    # Get value to be used for binding option.
+    max_inf = mc.getAttr(src_sc + '.maxInfluences')
+    normalize_weights = mc.getAttr(src_sc + '.normalizeWeights')
+    maintain_max_inf = mc.getAttr(src_sc + '.maintainMaxInfluences')
 
-        # Bind skin
+    # Bind skin
+    if get_skin_cluster(dst)[0] is None:
         mc.skinCluster(dst, src_inf, tsb=True, mi=max_inf,
                        omi=maintain_max_inf, nw=normalize_weights)
 
-        # Copy weights
-        dst_sc, _, _, _ = get_skin_related_val(dst)
-        influence_association = ['label', 'oneToOne', 'name', 'closestJoint']
-        if copymode == 'uv':
-            # Only uv copymode uses another flag for copySkinWeights cmd.
-            surface_association = 'closestPoint'
-            dst_map = mc.polyUVSet(dst, q=True, cuv=True)[0]
-            mc.copySkinWeights(ss=src_sc, ds=dst_sc, nm=True,
-                   sa=surface_association, uvSpace = [src_map, dst_map],
-                   ia=influence_association)
-        else:
-            surface_association = copymode
-            mc.copySkinWeights(ss=src_sc, ds=dst_sc, nm=True,
-                               sa=surface_association,
-                               ia=influence_association)
-
-        mc.select(src, dst, r=True)
-
-    except:
-        om2.MGlobal.displayError('Please select valid two objects (source, distination).')
-        return
\ No newline at end of file
+    # Copy weights
+    load_plugin('HTM_SetSkinWeights')
+    missing = transfer_skin_weights(src, dst, copymode)
+    if missing:
+        om2.MGlobal.displayWarning('Influences not found on {}: {}'.format(
+            dst, ', '.join(missing)))
+
+    mc.select(src, dst, r=True)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import sys
 from tempfile import gettempdir
 
@@ -14,6 +15,11 @@ from maya.app.general.mayaMixin import MayaQWidgetBaseMixin
 from maya.mel import eval
 import maya.utils
 
+from HTM_Tools.HTM_AOBakeQueue import bake_vertex_ao_batch
+from HTM_Tools.HTM_TextureSampler import texture_to_vertex_colors
+from HTM_Tools.HTM_BakePipeline import (BakePipeline, BakeJob, FAILED, prepare_bake_uv,
+                                        watch_file)
+
 
 WIN_TITLE = 'HTM Bake AO To Vertex Color'
 
@@ -108,6 +114,44 @@ class HTMBakeaAOToVertexColor(MayaQWidgetBaseMixin, QMainWindow):
         vbl_settings.addWidget(pb_bake)
         gb_main.setLayout(vbl_settings)
 
+        # =========================================
+        # 頂点から直接AO計算(レンダリングなし)
+        # =========================================
+        vbl_cpu = QVBoxLayout()
+        vbl_cpu.setContentsMargins(4, 4, 4, 4)
+        vbl_cpu.setSpacing(4)
+        gb_cpu = QGroupBox(u'頂点AO (CPU)')
+
+        hbl_ray_count = QHBoxLayout()
+        l_ray_count = QLabel(u'レイ数 :')
+        l_ray_count.setFixedWidth(100)
+        l_ray_count.setAlignment(Qt.AlignRight|Qt.AlignVCenter)
+        self.sb_ray_count = QSpinBox()
+        self.sb_ray_count.setRange(4, 1024)
+        self.sb_ray_count.setValue(64)
+        hbl_ray_count.addWidget(l_ray_count)
+        hbl_ray_count.addWidget(self.sb_ray_count)
+
+        hbl_max_dist = QHBoxLayout()
+        l_max_dist = QLabel(u'最大距離 :')
+        l_max_dist.setFixedWidth(100)
+        l_max_dist.setAlignment(Qt.AlignRight|Qt.AlignVCenter)
+        self.dsb_max_dist = QDoubleSpinBox()
+        self.dsb_max_dist.setRange(0.001, 100000.0)
+        self.dsb_max_dist.setValue(10.0)
+        hbl_max_dist.addWidget(l_max_dist)
+        hbl_max_dist.addWidget(self.dsb_max_dist)
+
+        pb_bake_cpu = QPushButton(u'頂点AO計算 && 頂点カラーへ適用', self)
+        pb_bake_cpu.setIcon(QIcon(':/textureToGeom.png'))
+        pb_bake_cpu.setIconSize(QSize(20,20))
+        pb_bake_cpu.clicked.connect(self.exec_bake_cpu)
+
+        vbl_cpu.addLayout(hbl_ray_count)
+        vbl_cpu.addLayout(hbl_max_dist)
+        vbl_cpu.addWidget(pb_bake_cpu)
+        gb_cpu.setLayout(vbl_cpu)
+
         # =========================================
         # 頂点カラー編集
         # =========================================
@@ -135,6 +179,7 @@ class HTMBakeaAOToVertexColor(MayaQWidgetBaseMixin, QMainWindow):
         # =========================================
         main_layout.addWidget(gb_sub_2)
         main_layout.addWidget(gb_main)
+        main_layout.addWidget(gb_cpu)
         main_layout.addWidget(gb_sub)
 
         widget.setLayout(main_layout)
@@ -149,68 +194,81 @@ class HTMBakeaAOToVertexColor(MayaQWidgetBaseMixin, QMainWindow):
         self.s_sample_count.setValue(value)
 
     def create_uv_for_bake(self):
-        """ ベイクに使用するためのUVの生成
+        """ ベイクに使用するためのUVの生成、オブジェクトごとにジョブとして順番に処理する
         """
         sel = mc.ls(sl=True, type='transform')
         if not sel:
             om2.MGlobal.displayError(u'1つ以上のオブジェクトを選択して実行してください')
-        working_uv = 'xxx_ao_bake'
+            return
 
+        self.uv_pipeline = BakePipeline()
         for s in sel:
-            all_uvs = mc.polyUVSet(s, q=True, allUVSets=True)
-
-            if not working_uv in all_uvs:
-                mc.polyUVSet(s, create=True, uvSet=working_uv)
-
-            # UVのコピーはあえて毎回やる、内容が変わっていることがあるあるなので
-            mc.polyUVSet(s, copy=True, newUVSet=working_uv)
-            try:
-                # 最初からao_bakeセットが選択されているとエラーが出る
-                # ただ、どのUVSetがデフォルトのものかわからないので、対策どうするか考える
-                mc.polyUVSet(s, currentUVSet=True, uvSet=working_uv)
-            except:
-                pass
-
-            # UVのレイアウトし直し
-            padding = 1.0 / 2048 * 10 # 2048x2048のテクスチャで10ピクセル間隔をあけて配置する場合
-            cmd = 'mc.u3dLayout("{0}.f[*]", res=1024, scl=1, spc={1}, mar={1}, box=[0,1,0,1])'.format(s, padding)
-            mc.evalDeferred(cmd, lp=True)
+            self.uv_pipeline.submit(BakeJob(s, [('uv', lambda job: prepare_bake_uv(job.obj))]))
 
     def exec_bake(self):
         """ ベイク実行
+            オブジェクトごとにレンダリング、テクスチャの書き出し待ち、頂点カラーへのインポートをジョブとして進める
         """
         sel = mc.ls(sl=True, type='transform')
         if not sel:
             om2.MGlobal.displayError(u'オブジェクトを選択して実行してください')
+            return
 
         size_table = {'512 x 512px':512, '1024 x 1024px':1024, '2048 x 2048px':2048}
-        tex_size = self.cb_tex_size.currentText()
+        tex_size = size_table[self.cb_tex_size.currentText()]
         sample_count = self.s_sample_count.value()
 
         # AOのサンプル数変更
         mc.setAttr(self.ao + '.samples', sample_count)
 
-        # ベイクと頂点カラーのインポート
         temp_dir = gettempdir()
-        if True:
+        self.bake_pipeline = BakePipeline(on_finished=self.on_bake_finished)
+        for s in sel:
+            shape = mc.listRelatives(s, shapes=True, ni=True)
+            if not shape:
+                continue
+            self.bake_pipeline.submit(BakeJob(
+                s, [('render', self.render_stage), ('import', self.import_stage)],
+                texture=os.path.join(temp_dir, shape[0] + '.custom_AO.exr'),
+                temp_dir=temp_dir, tex_size=tex_size, sample_count=sample_count))
+
+    def render_stage(self, job):
+        """ ベイク実行、テクスチャの書き出しが終わったら完了するFutureを返す
+        """
+        # 前回のベイク結果が残っていると書き出し完了と判定されてしまうので消しておく
+        if os.path.exists(job.data['texture']):
+            os.remove(job.data['texture'])
+
+        mc.select(job.obj, r=True)
+        mc.arnoldRenderToTexture(f=job.data['temp_dir'], filter='gaussian',
+                                 aa_samples=job.data['sample_count'], ee=True,
+                                 r=job.data['tex_size'], aov=True)
+        return watch_file(job.data['texture'])
+
+    def import_stage(self, job):
+        """ テクスチャを頂点カラーとしてインポート、ベイクに使われたカレントUVで直接サンプリングする
+        """
+        texture_to_vertex_colors(job.obj, job.data['result'], uv_set=None,
+                                 average_seams=True, channel='rgb')
 
-            # 選択オブジェクトの取得
-            sel = mc.ls(sl=True, type='transform')
-            if not len(sel) == 1:
-                return
-            shape = mc.listRelatives(sel, shapes=True, ni=True)
-
-            # ベイク実行
-            mc.arnoldRenderToTexture(f=temp_dir, filter='gaussian',
-                                     aa_samples=sample_count, ee=True,
-                                     r=size_table[tex_size], aov=True)
-
-            # テクスチャを頂点カラーとしてインポート、頂点カラーのペイントツールの機能を使用
-            # ベイク処理が終わるまで待ちたいのでevalDeferredで
-            baked_tex = temp_dir + '\\' + shape[0] + '.custom_AO.exr'
-            eval('PaintVertexColorTool; toolPropertyWindow;')
-            cmd = 'mc.artAttrPaintVertexCtx("{}", e=True, importfileload=r"{}")'.format(mc.currentCtx(), baked_tex)
-            mc.evalDeferred(cmd, lp=True)
+    def on_bake_finished(self, jobs):
+        failed = [job.obj for job in jobs if job.state == FAILED]
+        if failed:
+            om2.MGlobal.displayWarning(u'ベイクに失敗したオブジェクト: {}'.format(', '.join(failed)))
+        else:
+            om2.MGlobal.displayInfo(u'ベイク完了: {}個'.format(len(jobs)))
+
+    def exec_bake_cpu(self):
+        """ 頂点から直接レイを飛ばしてAOを計算、UVもレンダリングも不要
+            複数選択時は遮蔽物ごとにまとめて並列に計算し、前回から変更の無いものはスキップする
+        """
+        sel = mc.ls(sl=True, type='transform')
+        if not sel:
+            om2.MGlobal.displayError(u'オブジェクトを選択して実行してください')
+            return
+
+        bake_vertex_ao_batch(sel, samples=self.sb_ray_count.value(),
+                             max_distance=self.dsb_max_dist.value())
 
     def toggle_vertex_color(self):
         """ 頂点カラーの表示非表示のトグル